@@ -0,0 +1,122 @@
+'''
+Compares building 1 minute bars from XTP snapshots with backtrader's
+resampler (one tick per _load) against BarBuilder fed with tick batches.
+
+    python benchmarks/bench_barbuilder.py --days 20 --batch 64
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import datetime
+import time
+
+import numpy as np
+import backtrader as bt
+
+from xtp_backtrader_api.barbuilder import BarBuilder
+from xtp_backtrader_api.xtpdata import DataTimeConverter
+
+
+def make_ticks(days, interval=3):
+    '''Snapshots every ``interval`` seconds over both sessions'''
+    secs = np.r_[np.arange(9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60, interval),
+                 np.arange(13 * 3600, 15 * 3600, interval)] + interval
+    clock = (secs // 3600 * 10000 + secs // 60 % 60 * 100 + secs % 60) * 1000
+    data_time = np.concatenate([(20201001 + d) * 1000000000 + clock
+                                for d in range(days)])
+    rng = np.random.RandomState(0)
+    price = 10.0 + np.cumsum(rng.normal(0, 0.01, len(data_time)))
+    qty = np.tile(np.cumsum(rng.randint(0, 1000, len(secs))), days)
+    return dict(data_time=data_time, last_price=price, qty=qty)
+
+
+class TickData(bt.feed.DataBase):
+    params = (('ticks', None),)
+
+    def start(self):
+        super(TickData, self).start()
+        self._i = 0
+        t = self.p.ticks
+        self._rows = list(zip(t['dtnum'], t['last_price'].tolist(),
+                              t['qty'].tolist()))
+
+    def _load(self):
+        if self._i >= len(self._rows):
+            return False
+        dtnum, price, qty = self._rows[self._i]
+        self._i += 1
+        self.lines.datetime[0] = dtnum
+        self.lines.open[0] = self.lines.high[0] = price
+        self.lines.low[0] = self.lines.close[0] = price
+        self.lines.volume[0] = qty
+        return True
+
+
+class BatchBarData(bt.feed.DataBase):
+    params = (('ticks', None), ('batch', 64))
+
+    def start(self):
+        super(BatchBarData, self).start()
+        self._i = 0
+        self._bars = BarBuilder(60)
+        self._dtconv = DataTimeConverter()
+        self._pending = []
+
+    def _load(self):
+        t = self.p.ticks
+        while not self._pending:
+            if self._i >= len(t['data_time']):
+                return False
+            s = slice(self._i, self._i + self.p.batch)
+            self._i += self.p.batch
+            self._pending = self._bars.update(
+                dict((k, v[s]) for k, v in t.items()))[::-1]
+
+        dt, o, h, l, c, v, oi = self._pending.pop()
+        self.lines.datetime[0] = self._dtconv(dt)
+        self.lines.open[0], self.lines.high[0] = o, h
+        self.lines.low[0], self.lines.close[0] = l, c
+        self.lines.volume[0] = v
+        return True
+
+
+def run(data, resample):
+    cerebro = bt.Cerebro(stdstats=False, runonce=False, preload=False)
+    if resample:
+        cerebro.resampledata(data, timeframe=bt.TimeFrame.Minutes,
+                             compression=1)
+    else:
+        cerebro.adddata(data)
+    cerebro.addstrategy(bt.Strategy)
+    t0 = time.perf_counter()
+    strat = cerebro.run()[0]
+    return time.perf_counter() - t0, len(strat.data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=64,
+                        help='ticks handed to BarBuilder at once')
+    args = parser.parse_args()
+
+    ticks = make_ticks(args.days)
+    n = len(ticks['data_time'])
+    # timestamp conversion is left out of the resampler timings
+    dtnums = [bt.date2num(datetime.strptime(str(t), '%Y%m%d%H%M%S%f'))
+              for t in ticks['data_time'].tolist()]
+
+    t0 = time.perf_counter()
+    BarBuilder(60).update(ticks)
+    secs = time.perf_counter() - t0
+    print('BarBuilder alone, one batch: %.3fs (%.2fus/tick)' %
+          (secs, secs / n * 1e6))
+
+    for name, data, resample in (
+            ('resampler', TickData(ticks=dict(ticks, dtnum=dtnums)), True),
+            ('barbuilder', BatchBarData(ticks=ticks, batch=args.batch),
+             False)):
+        secs, bars = run(data, resample)
+        print('%-10s %d ticks -> %d bars in %.2fs (%.2fus/tick)' %
+              (name, n, bars, secs, secs / n * 1e6))
@@ -0,0 +1,62 @@
+'''
+Startup backfill from the BarCache: the last ``--bars`` minute bars of each
+of ``--symbols`` symbols, each with ``--days`` days of history on disk,
+read and queued the way ``XTPData._backfill`` does. Also times appending
+the bars completed in a minute, one call per symbol, as live datas do.
+
+    python benchmarks/bench_barcache.py --symbols 500 --bars 240 --days 250
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import shutil
+import tempfile
+import time
+
+import backtrader as bt
+
+from bench_historical import make_bars
+from xtp_backtrader_api.barcache import BarCache
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--bars', type=int, default=240)
+    parser.add_argument('--days', type=int, default=250)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        codes = ['%06d' % (600000 + i) for i in range(args.symbols)]
+        bars = make_bars(1)[:args.days * 240]
+        history, live = bars[:-240], bars[-240:]
+        cache = BarCache(path)
+        for code in codes:
+            cache.append(code, bt.TimeFrame.Minutes, 1, history)
+
+        cache = BarCache(path)  # nothing cached in memory
+        t0 = time.perf_counter()
+        queues = []
+        for code in codes:
+            q = collections.deque()
+            b = cache.tail(code, bt.TimeFrame.Minutes, 1, args.bars)
+            q.extend(zip(*[b[name].tolist() for name in b.dtype.names]))
+            queues.append(q)
+        secs = time.perf_counter() - t0
+        print('backfill %d symbols x %d bars: %.1fms (%.0fus/symbol)' %
+              (len(codes), args.bars, secs * 1e3, secs / len(codes) * 1e6))
+
+        live = live.tolist()
+        t0 = time.perf_counter()
+        for bar in live[:10]:
+            for code in codes:
+                cache.append(code, bt.TimeFrame.Minutes, 1, [bar])
+        secs = time.perf_counter() - t0
+        print('append 1 bar: %.1fus, %d symbols each minute %.1fms' %
+              (secs / len(codes) / 10 * 1e6, len(codes),
+               secs / 10 * 1e3))
+    finally:
+        shutil.rmtree(path)
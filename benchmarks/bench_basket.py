@@ -0,0 +1,104 @@
+'''
+A rebalance of ``--symbols`` stocks sent from a strategy over a replayed
+session to a local fake trade server: once with a ``buy`` per stock, once
+with a single ``XTPBroker.submit_basket``.
+
+Reports the time spent in the strategy sending the orders and the time
+until the last order reached the trader api, as well as until the basket
+was reported filled.
+
+    python benchmarks/bench_basket.py --symbols 300
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import backtrader as bt
+
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.xtpstore import XTPStore
+
+from bench_replay import record_day
+from fakes import FakeTraderServer
+
+
+class StampedTrader(FakeTraderServer):
+    '''Records when the last order reached the trader api'''
+    last = 0.0
+
+    def InsertOrder(self, order, session_id):
+        self.last = time.perf_counter()
+        return super(StampedTrader, self).InsertOrder(order, session_id)
+
+
+class Rebalance(bt.Strategy):
+    params = (('basket', False), ('size', 100))
+
+    def __init__(self):
+        self.sent = self.took = self.filled = None
+        self.fills = 0
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.fills += 1
+            if self.fills == len(self.datas):
+                self.filled = time.perf_counter()
+
+    def next(self):
+        if self.sent is not None:
+            return
+        prices = [d.close[0] for d in self.datas]
+        self.sent = time.perf_counter()
+        if self.p.basket:
+            self.broker.submit_basket(self, self.datas,
+                                      [self.p.size] * len(self.datas), prices)
+        else:
+            for data, price in zip(self.datas, prices):
+                self.buy(data, size=self.p.size, price=price,
+                         exectype=bt.Order.Limit)
+        self.took = time.perf_counter() - self.sent
+
+
+def run(path, codes, basket):
+    XTPStore._singleton = XTPReplayAPI._singleton = None
+    store = XTPStore(replay=path, reconcile=0, assetrefresh=0)
+    store.trader = trader = StampedTrader(cash=1e9)
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.setbroker(store.getbroker(use_positions=False, starttimeout=0))
+    for code in codes:
+        cerebro.adddata(store.getdata(dataname=code,
+                                      timeframe=bt.TimeFrame.Ticks))
+    cerebro.addstrategy(Rebalance, basket=basket)
+    strategy = cerebro.run()[0]
+    trader.close()
+
+    print('%-6s: sent in %7.2fms, last insert after %7.2fms, '
+          '%s' % ('basket' if basket else 'buy', strategy.took * 1e3,
+                  (trader.last - strategy.sent) * 1e3,
+                  'all filled after %.2fms' % (
+                      (strategy.filled - strategy.sent) * 1e3)
+                  if strategy.filled else 'not all filled during the run'))
+
+
+def main(args):
+    # one exchange: the replay starts with the first subscription
+    codes = ['%06d' % (600000 + i) for i in range(args.symbols)]
+    path = tempfile.mkdtemp()
+    try:
+        record_day(path, codes, args.snapshots)
+        for basket in (False, True):
+            run(path, codes, basket)
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=300)
+    parser.add_argument('--snapshots', type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,82 @@
+'''
+Cost of the broker value reads backtrader makes on every bar (analyzers,
+observers, sizers) and of marking the portfolio to market once per
+``next``, for a portfolio of ``--positions`` symbols with a tick each.
+``getvalue(datas)`` over all the datas is compared with the former loop
+(clone the position, materialize the line buffer of ``--bars`` bars).
+
+    python benchmarks/bench_broker_value.py --positions 2000
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import timeit
+from types import SimpleNamespace
+
+import numpy as np
+
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpbroker import XTPBroker
+from xtp_backtrader_api.xtpstore import symbol_key
+
+from fakes import offline_store
+
+
+class _Data(list):
+    '''Stands for a data feed: a line buffer and its ticker'''
+    __hash__ = object.__hash__
+
+    def __init__(self, dataname, bars):
+        super(_Data, self).__init__(np.linspace(9.0, 11.0, bars).tolist())
+        self.p = SimpleNamespace(dataname=dataname)
+
+
+def _loop_value(broker, datas):
+    # what getvalue(datas) did before
+    total_value = 0
+    for d in datas:
+        pos = broker.getposition(d)
+        if pos.size:
+            price = list(d)[0]
+            total_value += price * pos.size
+    return total_value
+
+
+def main(args):
+    store = offline_store(reconcile=0, assetrefresh=0)
+    broker = XTPBroker()
+
+    tick = dict((name, 0) for name, _ in TickRingBuffer.FIELDS)
+    datas = []
+    for i in range(args.positions):
+        code = '%06d' % (600000 + i)
+        datas.append(_Data(code, args.bars))
+        broker.ledger.fill(symbol_key(code), 100, 10.0)
+        tick['last_price'] = 10.0 + i % 100 * 0.01
+        store.register_ring(code, capacity=16).push(SimpleNamespace(**tick))
+
+    broker._markvalue()  # binds the rings
+    broker.getvalue(datas)  # builds the index of the datas
+
+    n = args.number
+    read = timeit.timeit(broker.getvalue, number=n) / n
+    cash = timeit.timeit(broker.getcash, number=n) / n
+    m = max(1, n // 1000)
+    mark = timeit.timeit(broker._markvalue, number=m) / m
+    vec = timeit.timeit(lambda: broker.getvalue(datas), number=m) / m
+    loop = timeit.timeit(lambda: _loop_value(broker, datas), number=10) / 10
+
+    print('%d positions: getvalue() %.0fns, getcash() %.0fns, '
+          'mark to market per next %.1fus' %
+          (args.positions, read * 1e9, cash * 1e9, mark * 1e6))
+    print('getvalue(datas) over all datas: %.1fus (python loop %.1fus)' %
+          (vec * 1e6, loop * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--positions', type=int, default=2000)
+    parser.add_argument('--bars', type=int, default=240)
+    parser.add_argument('--number', type=int, default=100000)
+    main(parser.parse_args())
@@ -0,0 +1,45 @@
+'''
+Measures the latency of XTPQuoteAPI.OnDepthMarketData for the different
+tick ring layouts, driven by a local fake quote source at a fixed rate.
+
+    python benchmarks/bench_depth_callback.py --rate 100000 --count 200000
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+
+import numpy as np
+
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpstore import symbol_key
+
+from fakes import FakeQuoteSource, offline_quote_api
+
+
+def bench(layout, depth, args):
+    tickers = ['%06d' % (600000 + i) for i in range(args.symbols)]
+    rings = dict((symbol_key(t),
+                  TickRingBuffer(t, capacity=args.ringsize, layout=layout,
+                                 depth=depth))
+                 for t in tickers)
+
+    source = FakeQuoteSource(offline_quote_api(rings), tickers)
+    spent = np.array(source.run(args.count, rate=args.rate))
+    p50, p99 = np.percentile(spent, [50, 99])
+    print('%-5s depth=%-2d p50=%7.2fus p99=%7.2fus max=%8.2fus' %
+          (layout, depth, p50 / 1e3, p99 / 1e3, spent.max() / 1e3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--rate', type=int, default=100000,
+                        help='ticks per second delivered to the callback')
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--symbols', type=int, default=300)
+    parser.add_argument('--ringsize', type=int, default=4096)
+    args = parser.parse_args()
+
+    for layout, depth in (('full', 0), ('lean', 0), ('lean', 1),
+                          ('lean', 5)):
+        bench(layout, depth, args)
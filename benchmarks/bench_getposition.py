@@ -0,0 +1,74 @@
+'''
+Allocations and time of the ``getposition`` calls a strategy over
+``--symbols`` datas makes on every bar (read size and price of each),
+with the former clone per call against the cached ``PositionView``.
+
+    python benchmarks/bench_getposition.py --symbols 500 --bars 240
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import time
+from types import SimpleNamespace
+
+from backtrader.position import Position
+
+from xtp_backtrader_api.xtpbroker import XTPBroker
+
+from fakes import offline_store
+
+
+class _Data(object):
+    def __init__(self, dataname):
+        self.p = SimpleNamespace(dataname=dataname)
+
+
+_created = [0]
+_init = Position.__init__
+
+
+def _counting_init(self, *args, **kwargs):
+    _created[0] += 1
+    _init(self, *args, **kwargs)
+
+
+def run(getposition, datas, bars):
+    _created[0] = 0
+    t0 = time.perf_counter()
+    for _ in range(bars):
+        for d in datas:
+            pos = getposition(d)
+            if pos.size:
+                pos.price
+    elapsed = time.perf_counter() - t0
+    return _created[0], elapsed / (bars * len(datas))
+
+
+def main(args):
+    offline_store(reconcile=0, assetrefresh=0)
+    broker = XTPBroker()
+    datas = [_Data('%06d' % (600000 + i)) for i in range(args.symbols)]
+    for d in datas:
+        broker.ledger.fill(broker._key(d), 100, 10.0)
+
+    def cloned(data):  # what getposition did before
+        return broker.getposition(data, clone=False).clone()
+
+    Position.__init__ = _counting_init
+    try:
+        for name, getposition in (('clone per call', cloned),
+                                  ('position view', broker.getposition)):
+            getposition(datas[0])  # warm up the caches
+            created, per = run(getposition, datas, args.bars)
+            print('%-15s %8d Position allocations, %.0fns per call' %
+                  (name, created, per * 1e9))
+    finally:
+        Position.__init__ = _init
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--bars', type=int, default=240)
+    main(parser.parse_args())
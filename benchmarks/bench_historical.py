@@ -0,0 +1,96 @@
+'''
+Backtest of an SMA crossover over ``--years`` of cached 1 minute bars with
+a historical XTPData: bars preloaded into the line buffers at once and
+indicators in runonce mode, against the bar by bar loading and next() mode
+every XTPData was limited to while ``islive`` was always ``True``.
+
+    python benchmarks/bench_historical.py --years 2
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import date, timedelta
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import backtrader as bt
+
+from xtp_backtrader_api.barcache import BAR_DTYPE, BarCache
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.xtpstore import XTPStore
+
+
+def make_bars(years):
+    '''240 minute bars per weekday, as XTPData builds them'''
+    days = [date(2015, 1, 5) + timedelta(days=i) for i in range(365 * years)]
+    days = np.array([(d.year * 100 + d.month) * 100 + d.day
+                     for d in days if d.weekday() < 5], dtype=np.int64)
+    mins = np.r_[np.arange(9 * 60 + 31, 11 * 60 + 31),
+                 np.arange(13 * 60 + 1, 15 * 60 + 1)]
+    clock = (mins // 60 * 10000 + mins % 60 * 100) * 1000
+    bars = np.zeros(len(days) * len(mins), dtype=BAR_DTYPE)
+    bars['data_time'] = (days[:, None] * 1000000000 + clock).ravel()
+    rng = np.random.RandomState(0)
+    close = 10.0 + np.cumsum(rng.normal(0, 0.01, len(bars)))
+    bars['open'] = np.r_[close[0], close[:-1]]
+    bars['high'] = np.maximum(bars['open'], close) + 0.01
+    bars['low'] = np.minimum(bars['open'], close) - 0.01
+    bars['close'] = close
+    bars['volume'] = rng.randint(100, 10000, len(bars))
+    return bars
+
+
+class SmaCross(bt.Strategy):
+    params = (('fast', 10), ('slow', 30))
+
+    def __init__(self):
+        self.cross = bt.ind.CrossOver(bt.ind.SMA(period=self.p.fast),
+                                      bt.ind.SMA(period=self.p.slow))
+
+    def next(self):
+        if self.cross[0] > 0:
+            self.buy()
+        elif self.cross[0] < 0:
+            self.close()
+
+
+def run(store, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    cerebro.adddata(store.getdata(dataname='600000', historical=True,
+                                  timeframe=bt.TimeFrame.Minutes,
+                                  compression=1))
+    cerebro.addstrategy(SmaCross)
+    t0 = time.perf_counter()
+    strat = cerebro.run()[0]
+    return time.perf_counter() - t0, strat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--years', type=int, default=1)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        bars = make_bars(args.years)
+        BarCache(path).append('600000', bt.TimeFrame.Minutes, 1, bars)
+        # an empty replay stands in for the quote server
+        store = XTPStore(replay=path, barcache=path)
+
+        results = []
+        for name, kwargs in (('bar by bar', dict(preload=False,
+                                                 runonce=False)),
+                             ('preload+runonce', dict())):
+            secs, strat = run(store, **kwargs)
+            results.append((strat.broker.getvalue(), len(strat.data)))
+            print('%-16s %d bars in %.2fs (%.1fus/bar)' %
+                  (name, len(bars), secs, secs / len(bars) * 1e6))
+
+        assert results[0] == results[1], results
+        print('same result: value %.2f over %d bars' % results[0])
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+        shutil.rmtree(path)
@@ -0,0 +1,101 @@
+'''
+Cost and output of the store's latency monitor (``latency=True``).
+
+First the ``OnDepthMarketData`` callback is timed with the monitor off and
+on over ``--count`` ticks. Then a live tick data, a strategy buying every
+``--every`` ticks and the broker run against a local fake trade server
+while a source thread delivers ``--ticks`` ticks every ``--interval``
+seconds, and the per stage percentiles of the ``LatencyAnalyzer`` are
+printed (the Prometheus exposition with ``--prometheus``). The fake ticks
+are dated 2020, which leaves the ``exchange`` stage meaningless here.
+
+    python benchmarks/bench_latency.py --ticks 2000 --interval 0.002
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import threading
+import time
+
+import numpy as np
+import backtrader as bt
+
+from xtp_backtrader_api.latency import LatencyAnalyzer, LatencyMonitor
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpstore import XTPStore, symbol_key
+
+from bench_wakeup import deliver
+from fakes import FakeQuoteSource, FakeTraderServer, offline_quote_api
+from fakes import offline_store
+
+
+def callback_cost(args):
+    for name, latency in (('off', None), ('on', LatencyMonitor())):
+        rings = {symbol_key('600000'): TickRingBuffer('600000',
+                                                      layout='lean')}
+        api = offline_quote_api(rings)
+        api.latency = latency
+        source = FakeQuoteSource(api, ['600000'])
+        spent = np.array(source.run(args.count, templates=1024))
+        print('OnDepthMarketData monitor %-3s p50 %5.2fus p99 %5.2fus' %
+              (name, np.percentile(spent, 50) / 1e3,
+               np.percentile(spent, 99) / 1e3))
+
+
+class Trade(bt.Strategy):
+    params = (('every', 10), ('count', 0))
+
+    def __init__(self):
+        self.ticks = 0
+
+    def next(self):
+        self.ticks += 1
+        if self.ticks % self.p.every == 0:
+            self.buy(size=100, price=self.data.close[0],
+                     exectype=bt.Order.Limit)
+        if self.ticks == self.p.count:
+            self.env.runstop()
+
+
+def pipeline(args):
+    store = offline_store(latency=True, reconcile=0, assetrefresh=0)
+    store.trader = FakeTraderServer()
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.setbroker(store.getbroker(use_positions=False))
+    cerebro.adddata(store.getdata(dataname='600000',
+                                  timeframe=bt.TimeFrame.Ticks,
+                                  qcheck=args.qcheck))
+    cerebro.addstrategy(Trade, every=args.every, count=args.ticks)
+    cerebro.addanalyzer(LatencyAnalyzer, _name='latency')
+    source = threading.Thread(target=deliver, args=(
+        store.quotaAPI, args.ticks, args.interval, [0.0] * args.ticks))
+    source.daemon = True
+    source.start()
+
+    strat = cerebro.run()[0]
+    time.sleep(0.1)  # last acks and fills
+    store.trader.close()
+    XTPStore._singleton = None
+
+    print('%-9s %7s %9s %9s %9s %9s' % ('stage', 'count', 'p50 us',
+                                        'p99 us', 'p99.9 us', 'max us'))
+    for stage, snap in strat.analyzers.latency.get_analysis().items():
+        print('%-9s %7d %9.1f %9.1f %9.1f %9.1f' % (
+            stage, snap['count'], snap['p50'] / 1e3, snap['p99'] / 1e3,
+            snap['p999'] / 1e3, snap['max'] / 1e3))
+    if args.prometheus:
+        print(store.latency.prometheus())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--ticks', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.002)
+    parser.add_argument('--every', type=int, default=10)
+    parser.add_argument('--qcheck', type=float, default=10.0)
+    parser.add_argument('--prometheus', action='store_true')
+    args = parser.parse_args()
+    callback_cost(args)
+    pipeline(args)
@@ -0,0 +1,64 @@
+'''
+Cost of accounting for one fill: the former full resync in
+``XTPBroker.notify`` (rebuild every Position from a broker position list,
+looping over all datas) against ``Ledger.fill``. The broker query itself is
+left out, the resync is timed as if the answer were free.
+
+    python benchmarks/bench_ledger.py --symbols 500
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import time
+from types import SimpleNamespace
+
+from backtrader.position import Position
+
+from xtp_backtrader_api.ledger import Ledger
+
+
+def resync(datasbyname, broker_positions):
+    # the loop update_positions ran on every notification
+    positions = collections.defaultdict(Position)
+    broker_positions_symbols = [p.symbol for p in broker_positions]
+    broker_positions_mapped_by_symbol = \
+        {p.symbol: p for p in broker_positions}
+
+    for name, data in datasbyname.items():
+        if name in broker_positions_symbols:
+            pos = broker_positions_mapped_by_symbol[name]
+            positions[data] = Position(int(pos.qty),
+                                       float(pos.avg_entry_price))
+    return positions
+
+
+def main(args):
+    codes = ['%06d' % (600000 + i) for i in range(args.symbols)]
+    datasbyname = dict((code, object()) for code in codes)
+    broker_positions = [SimpleNamespace(symbol=code, qty=100,
+                                        avg_entry_price=10.0)
+                        for code in codes]
+
+    n = args.fills
+    t0 = time.perf_counter()
+    for i in range(n // 100):
+        resync(datasbyname, broker_positions)
+    old = (time.perf_counter() - t0) / (n // 100)
+
+    ledger = Ledger(cash=1e9)
+    t0 = time.perf_counter()
+    for i in range(n):
+        ledger.fill(codes[i % args.symbols], 100, 10.0)
+    new = (time.perf_counter() - t0) / n
+
+    print('%d symbols: resync %.1fus/fill, ledger %.2fus/fill (%.0fx)' %
+          (args.symbols, old * 1e6, new * 1e6, old / new))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--fills', type=int, default=100000)
+    main(parser.parse_args())
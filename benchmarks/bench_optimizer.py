@@ -0,0 +1,65 @@
+'''
+Throughput of ParameterSweep: an SMA crossover grid over ``--symbols``
+symbols with ``--days`` days of minute bars each, run with 1 worker and
+with ``--workers`` (all cores by default), in backtests per minute.
+
+The bars are mapped by the workers from shared memory, so the cost of
+starting the pool does not grow with the data.
+
+    python benchmarks/bench_optimizer.py --symbols 4 --days 20 --workers 32
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import multiprocessing
+
+import backtrader as bt
+
+from bench_historical import make_bars
+from xtp_backtrader_api.optimizer import ParameterSweep, SharedBars
+
+
+class SmaCross(bt.Strategy):
+    params = (('fast', 10), ('slow', 30))
+
+    def __init__(self):
+        self.crosses = [
+            bt.ind.CrossOver(bt.ind.SMA(d, period=self.p.fast),
+                             bt.ind.SMA(d, period=self.p.slow))
+            for d in self.datas]
+
+    def next(self):
+        for data, cross in zip(self.datas, self.crosses):
+            if cross[0] > 0:
+                self.buy(data=data, size=100)
+            elif cross[0] < 0:
+                self.close(data=data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=4)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    bars = make_bars(1)[:args.days * 240]
+    shared = SharedBars.create(collections.OrderedDict(
+        ('%06d' % (600000 + i), bars) for i in range(args.symbols)))
+    grid = dict(fast=range(5, 25, 5), slow=range(30, 70, 10))
+    try:
+        base = None
+        for workers in sorted(set([1, args.workers])):
+            sweep = ParameterSweep(SmaCross, grid, shared, workers=workers,
+                                   chunksize=1)
+            results = sweep.run()
+            base = base or sweep.rate
+            print('%2d workers: %d backtests of %d x %d bars in %.1fs, '
+                  '%.0f backtests/minute (x%.1f)' %
+                  (workers, len(results), args.symbols, len(bars),
+                   sweep.elapsed, sweep.rate, sweep.rate / base))
+    finally:
+        shared.close()
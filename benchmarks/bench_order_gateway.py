@@ -0,0 +1,87 @@
+'''
+Sends orders through the ``OrderGateway`` to a local fake trade server and
+reports the time spent in the caller (what ``cerebro.next`` pays per order),
+the submit to fill round trip as seen when draining events, and the
+sustained orders/s.
+
+    python benchmarks/bench_order_gateway.py --orders 20000 --latency 0
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import time
+
+import numpy as np
+
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.ordergateway import OrderGateway
+from xtp_backtrader_api.xtpstore import split_ticker
+
+from fakes import FakeTraderServer
+
+
+def _report(name, ns):
+    ns = np.asarray(ns) / 1000.0
+    print('%-26s p50 %8.1fus  p99 %8.1fus  max %8.1fus' %
+          (name, np.percentile(ns, 50), np.percentile(ns, 99), ns.max()))
+
+
+def main(args):
+    timer = time.perf_counter_ns
+    pricetype = XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT
+    code, exchange = split_ticker('600000')
+
+    trader = FakeTraderServer(latency=args.latency)
+    gateway = OrderGateway(trader, trader.session_id)
+    trader.gateway = gateway
+    gateway.start()
+
+    sent = dict()
+    caller = []
+    roundtrip = []
+    pending = 0
+    t0 = time.time()
+    for oref in range(1, args.orders + 1):
+        t = timer()
+        gateway.submit(oref, code, exchange, True, 100, 10.0, pricetype)
+        caller.append(timer() - t)
+        sent[oref] = t
+        pending += 1
+
+        while pending >= args.window:  # bounded number of live orders
+            time.sleep(args.poll)  # like cerebro between two next calls
+            for event in gateway.drain():
+                if event[0] == OrderGateway.FILL:
+                    roundtrip.append(timer() - sent.pop(event[1]))
+                    pending -= 1
+
+    while pending:
+        time.sleep(args.poll)
+        for event in gateway.drain():
+            if event[0] == OrderGateway.FILL:
+                roundtrip.append(timer() - sent.pop(event[1]))
+                pending -= 1
+
+    elapsed = time.time() - t0
+    gateway.stop()
+    trader.close()
+
+    print('%d orders, window %d, server latency %.3fms' %
+          (args.orders, args.window, args.latency * 1000))
+    _report('gateway.submit (caller)', caller)
+    _report('submit -> fill drained', roundtrip)
+    print('throughput: %.0f orders/s' % (args.orders / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--window', type=int, default=64,
+                        help='maximum number of unfilled orders')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated server seconds per request')
+    parser.add_argument('--poll', type=float, default=0.0001,
+                        help='seconds between two drains of the events')
+    main(parser.parse_args())
@@ -0,0 +1,122 @@
+'''
+A bursty strategy against the ``RateLimiter``: every ``--period`` seconds
+``--burst`` orders are submitted at once through the ``OrderGateway`` to a
+local fake trade server (which never fills them), along with a cancel for
+every ``--cancelevery``-th order of the previous burst, with inserts
+limited to ``--insert``/s.
+
+Reports the insert rate sustained, the most inserts the server saw in any
+second (which has to stay within rate and burst), the queue depth, and how
+long orders and cancels waited between submission and reaching the
+trader.
+
+    python benchmarks/bench_ratelimit.py --insert 200 --burst 150
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import time
+
+import numpy as np
+
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.ordergateway import OrderGateway
+from xtp_backtrader_api.ratelimit import RateLimiter
+from xtp_backtrader_api.xtpstore import split_ticker
+
+from fakes import FakeTraderServer
+
+
+class StampedTrader(FakeTraderServer):
+    '''Records when each order and cancel reaches the trader api'''
+
+    def __init__(self):
+        super(StampedTrader, self).__init__(fill=False)
+        self.inserts = dict()  # order ref -> time
+        self.cancels = dict()  # xtp id -> time
+
+    def InsertOrder(self, order, session_id):
+        self.inserts[order.order_client_id] = time.perf_counter()
+        return super(StampedTrader, self).InsertOrder(order, session_id)
+
+    def CancelOrder(self, order_xtp_id, session_id):
+        self.cancels[order_xtp_id] = time.perf_counter()
+        return super(StampedTrader, self).CancelOrder(order_xtp_id,
+                                                      session_id)
+
+
+def main(args):
+    pricetype = XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT
+    code, exchange = split_ticker('600000')
+    trader = StampedTrader()
+    limiter = RateLimiter(insert=args.insert, cancel=args.cancel,
+                          burst=args.rateburst)
+    gateway = OrderGateway(trader, trader.session_id, limiter=limiter)
+    trader.gateway = gateway
+    gateway.start()
+
+    submitted, cancelled = dict(), dict()
+    oref, depth = 0, []
+    t0 = time.perf_counter()
+    for burst in range(args.bursts):
+        due = t0 + burst * args.period
+        while time.perf_counter() < due:
+            depth.append(limiter.depth())
+            time.sleep(0.001)
+        for _ in range(args.burst):
+            oref += 1
+            submitted[oref] = time.perf_counter()
+            gateway.submit(oref, code, exchange, True, 100, 10.0, pricetype)
+        for ref in range(max(oref - 2 * args.burst + 1, 1),
+                         oref - args.burst + 1, args.cancelevery):
+            cancelled[ref] = time.perf_counter()
+            gateway.cancel(ref)
+
+    while limiter.depth():
+        depth.append(limiter.depth())
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - t0
+    time.sleep(0.1)
+    gateway.stop()
+    trader.close()
+
+    inserts = np.sort(np.array(list(trader.inserts.values())))
+    window = np.searchsorted(inserts, inserts + 1.0) - np.arange(
+        len(inserts))
+    waits = np.array([trader.inserts[ref] - submitted[ref]
+                      for ref in trader.inserts]) * 1e3
+    xtpids = dict((ref, xtpid) for xtpid, ref in gateway.byxtpid.items())
+    cwaits = np.array([trader.cancels[xtpids[ref]] - cancelled[ref]
+                       for ref in cancelled if ref in xtpids and
+                       xtpids[ref] in trader.cancels]) * 1e3
+
+    print('%d orders in %d bursts, %d cancels (%d withdrawn before '
+          'being sent), %.1fs' % (
+              oref, args.bursts, len(cancelled),
+              len(cancelled) - len(cwaits), elapsed))
+    print('inserts: %.0f/s sustained, at most %d in any second '
+          '(limit %g/s, burst %g)' % (
+              len(inserts) / (inserts[-1] - inserts[0]), window.max(),
+              args.insert, args.insert * args.rateburst))
+    print('queue depth: max %d, mean %.1f' % (limiter.maxdepth,
+                                              np.mean(depth)))
+    print('order wait:  p50 %7.1fms  p99 %7.1fms' % (
+        np.percentile(waits, 50), np.percentile(waits, 99)))
+    if len(cwaits):
+        print('cancel wait: p50 %7.3fms  p99 %7.3fms' % (
+            np.percentile(cwaits, 50), np.percentile(cwaits, 99)))
+    print(dict(limiter.metrics()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--insert', type=float, default=200.0)
+    parser.add_argument('--cancel', type=float, default=100.0)
+    parser.add_argument('--rateburst', type=float, default=0.25)
+    parser.add_argument('--burst', type=int, default=150)
+    parser.add_argument('--bursts', type=int, default=10)
+    parser.add_argument('--period', type=float, default=0.5)
+    parser.add_argument('--cancelevery', type=int, default=10)
+    main(parser.parse_args())
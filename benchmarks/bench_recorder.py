@@ -0,0 +1,98 @@
+'''
+Sustained write throughput of the tick recorder and its cost in
+XTPQuoteAPI.OnDepthMarketData.
+
+Ticks for ``--symbols`` symbols on both exchanges are delivered as fast as
+possible with and without a recorder, then the files are read back as
+memmaps and checked against the number of ticks sent.
+
+    python benchmarks/bench_recorder.py --count 500000 --path /tmp/ticks
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from xtp_backtrader_api.recorder import TICK_DTYPE, TickRecorder, open_ticks
+
+from fakes import FakeQuoteSource, offline_quote_api
+
+
+def main(args):
+    half = args.symbols // 2
+    tickers = ['%06d' % (600000 + i) for i in range(half)] + \
+        ['%06d' % (1 + i) for i in range(args.symbols - half)]
+
+    source = FakeQuoteSource(offline_quote_api(dict()), tickers)
+    spent = np.array(source.run(args.count, templates=args.symbols))
+    base = np.percentile(spent, 50)
+
+    path = args.path or tempfile.mkdtemp()
+    for name in glob.glob(os.path.join(path, '*.ticks')):
+        os.remove(name)
+    recorder = TickRecorder(path, capacity=args.ringsize,
+                            flushinterval=args.flush)
+    recorder.start()
+    source = FakeQuoteSource(offline_quote_api(dict(), recorder=recorder),
+                             tickers)
+    t0 = time.perf_counter()
+    spent = np.array(source.run(args.count, templates=args.symbols))
+    recorder.stop()
+    elapsed = time.perf_counter() - t0
+
+    p50, p99 = np.percentile(spent, [50, 99])
+    print('callback  p50=%.2fus (%.2fus without recorder) p99=%.2fus' %
+          (p50 / 1e3, base / 1e3, p99 / 1e3))
+    print('sustained %d ticks in %.2fs, %.0f ticks/s, %.1f MB/s, '
+          '%d dropped' %
+          (recorder.records, elapsed, recorder.records / elapsed,
+           recorder.records * TICK_DTYPE.itemsize / elapsed / 1e6,
+           recorder.ring.overflows))
+
+    # the writer alone: a full ring written out in one pass
+    ring = recorder.ring
+    ring._records['data_time'] = 20201020093000000
+    ring._records['exchange_id'] = np.arange(ring.capacity) % 2 + 1
+    ring._head = ring._tail + ring.capacity
+    t0 = time.perf_counter()
+    written = recorder.flush()
+    for f in recorder._files.values():
+        f.close()
+    recorder._files.clear()
+    writer = time.perf_counter() - t0
+    print('writer    %d ticks in %.1fms, %.0f ticks/s, %.0f MB/s' %
+          (written, writer * 1e3, written / writer,
+           written * TICK_DTYPE.itemsize / writer / 1e6))
+
+    t0 = time.perf_counter()
+    total = 0
+    for name in glob.glob(os.path.join(path, '20201019.*.ticks')):
+        ticks = open_ticks(name)
+        total += len(ticks)
+        ticks['last_price'].max()
+    print('read back %d ticks, %.2fms' %
+          (total, (time.perf_counter() - t0) * 1e3))
+    assert total == recorder.records - written
+
+    if not args.path:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=500000)
+    parser.add_argument('--symbols', type=int, default=4000)
+    parser.add_argument('--ringsize', type=int, default=65536)
+    parser.add_argument('--flush', type=float, default=0.2,
+                        help='seconds between writer passes')
+    parser.add_argument('--path', default=None,
+                        help='directory for the files, a temporary one '
+                        'by default')
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+'''
+Replay speed of recorded ticks through XTPReplayAPI, OnDepthMarketData,
+the tick rings and minute bar building (what ``XTPData`` runs), for a
+synthetic recorded day of ``--symbols`` symbols with ``--snapshots``
+snapshots each (a real day at 3 second snapshots has 4800).
+
+Runs with every symbol subscribed and with ``--subset`` of them, and
+extrapolates the time to replay a full day.
+
+    python benchmarks/bench_replay.py --symbols 4000 --snapshots 100
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from xtp_backtrader_api.barbuilder import BarBuilder
+from xtp_backtrader_api.recorder import TICK_DTYPE
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpstore import split_ticker, symbol_key
+
+DAY = 20201019
+
+
+def record_day(path, tickers, snapshots):
+    '''Writes the files a TickRecorder would have written for a day'''
+    for exchange, name in ((1, 'SH'), (2, 'SZ')):
+        codes = [t for t in tickers if split_ticker(t)[1] == exchange]
+        ticks = np.zeros(len(codes) * snapshots, dtype=TICK_DTYPE)
+        snap = np.repeat(np.arange(snapshots), len(codes))
+        secs = 9 * 3600 + 30 * 60 + snap * 3
+        secs = np.where(secs >= 11 * 3600 + 30 * 60, secs + 5400, secs)
+        hhmmss = secs // 3600 * 10000 + secs // 60 % 60 * 100 + secs % 60
+        ticks['exchange_id'] = exchange
+        ticks['ticker'] = np.tile(np.array(codes, dtype='S16'), snapshots)
+        ticks['data_time'] = (DAY * 1000000 + hhmmss) * 1000
+        ticks['last_price'] = 10.0 + (snap % 97) * 0.01
+        ticks['qty'] = (snap + 1) * 100
+        ticks.tofile(os.path.join(path, '%d.%s.ticks' % (DAY, name)))
+
+
+def replay(path, tickers, args):
+    XTPReplayAPI._singleton = None
+    rings = dict((symbol_key(t),
+                  TickRingBuffer(t, capacity=args.ringsize, layout='lean'))
+                 for t in tickers)
+    api = XTPReplayAPI(files=XTPReplayAPI.findfiles(path, DAY), rings=rings,
+                       autoplay=False)
+    builders = [(ring, BarBuilder(60)) for ring in rings.values()]
+    bars = [0]
+
+    def consume():  # XTPData._load_bar for every data
+        while True:
+            finished = api.finished
+            idle = True
+            for ring, builder in builders:
+                ticks = ring.popmany()
+                if ticks is not None:
+                    bars[0] += len(builder.update(ticks))
+                    idle = False
+                elif finished:
+                    bars[0] += len(builder.expire(99991231235959999))
+            if finished and idle:
+                return
+            if idle:
+                time.sleep(0.001)
+
+    consumer = threading.Thread(target=consume)
+    t0 = time.perf_counter()
+    consumer.start()
+    for exchange in (1, 2):
+        api.SubscribeMarketData(
+            [t for t in tickers if split_ticker(t)[1] == exchange], exchange)
+    api.play()
+    consumer.join()
+    elapsed = time.perf_counter() - t0
+    dropped = sum(ring.dropped for ring in rings.values())
+    return api.delivered, bars[0], dropped, elapsed
+
+
+def main(args):
+    half = args.symbols // 2
+    tickers = ['%06d' % (600000 + i) for i in range(half)] + \
+        ['%06d' % (1 + i) for i in range(args.symbols - half)]
+    path = tempfile.mkdtemp()
+    try:
+        record_day(path, tickers, args.snapshots)
+        total = args.symbols * args.snapshots
+        print('%d symbols x %d snapshots = %d ticks, %.0f MB' %
+              (args.symbols, args.snapshots, total,
+               total * TICK_DTYPE.itemsize / 1e6))
+        step = max(1, len(tickers) // args.subset)
+        for subset in (tickers, tickers[::step]):
+            ticks, bars, dropped, elapsed = replay(path, subset, args)
+            fullday = elapsed * 4800.0 / args.snapshots
+            print('%4d subscribed: %d ticks, %d bars, %d dropped in %.2fs '
+                  '(%.0f ticks/s), full day ~%.0fs' %
+                  (len(subset), ticks, bars, dropped, elapsed,
+                   ticks / elapsed, fullday))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=4000)
+    parser.add_argument('--snapshots', type=int, default=100)
+    parser.add_argument('--subset', type=int, default=50)
+    parser.add_argument('--ringsize', type=int, default=4096)
+    main(parser.parse_args())
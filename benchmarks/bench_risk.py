@@ -0,0 +1,110 @@
+'''
+Pushes ``--rate`` orders/s (10k by default) over ``--symbols`` symbols
+through the ``RiskEngine`` checks and the ``OrderGateway`` to a local fake
+trade server, moving the risk counters with the fills the way the broker
+does, and reports the time ``admit`` adds per order next to the time of
+``gateway.submit`` itself. A share of the orders breaks a limit (price
+band, T+1 sells) and is rejected locally.
+
+    python benchmarks/bench_risk.py --orders 50000 --rate 10000
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.ledger import Ledger
+from xtp_backtrader_api.ordergateway import OrderGateway
+from xtp_backtrader_api.risk import RiskEngine
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpstore import split_ticker, symbol_key
+
+from fakes import FakeTraderServer
+
+
+def _report(name, ns):
+    ns = np.asarray(ns) / 1000.0
+    print('%-24s p50 %6.2fus  p99 %6.2fus  max %8.2fus' %
+          (name, np.percentile(ns, 50), np.percentile(ns, 99), ns.max()))
+
+
+def main(args):
+    timer = time.perf_counter_ns
+    pricetype = XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT
+    codes = ['%06d' % (600000 + i) for i in range(args.symbols)]
+    exchanges = dict((code, split_ticker(code)[1]) for code in codes)
+    keys = dict((code, symbol_key(code)) for code in codes)
+    rings, ledger = dict(), Ledger(cash=1e9)
+    tick = dict((name, 0) for name, _ in TickRingBuffer.FIELDS)
+    for code in codes:
+        tick['last_price'] = 10.0
+        rings[keys[code]] = ring = TickRingBuffer(code, capacity=16)
+        ring.push(SimpleNamespace(**tick))
+        ledger.fill(keys[code], 10000, 10.0)  # held overnight
+
+    risk = RiskEngine(maxsize=10000, maxposition=1000000, maxnotional=1e6,
+                      maxexposure=1e9, maxrate=args.rate * 2, band=0.1,
+                      rings=rings)
+    risk.reset(ledger)
+
+    trader = FakeTraderServer()
+    gateway = OrderGateway(trader, trader.session_id)
+    trader.gateway = gateway
+    gateway.start()
+
+    rnd = random.Random(1)
+    orders = [(rnd.choice(codes), rnd.random() < 0.6,
+               rnd.choice((100, 200, 500)),
+               round(10.0 * (1 + rnd.uniform(-0.12, 0.12)), 2))
+              for _ in range(args.orders)]
+
+    codeof, checks, submits = dict(), [], []
+    interval = 1e9 / args.rate
+    start = timer()
+    for oref, (code, isbuy, size, price) in enumerate(orders, 1):
+        due = start + oref * interval
+        while timer() < due:
+            pass
+
+        t0 = timer()
+        reason = risk.admit(oref, keys[code], isbuy, size, price,
+                            ledger.cash)
+        t1 = timer()
+        checks.append(t1 - t0)
+        if reason is None:
+            codeof[oref] = code
+            gateway.submit(oref, code, exchanges[code], isbuy, size, price,
+                           pricetype)
+            submits.append(timer() - t1)
+
+        if oref % 64 == 0:  # the broker applies events once per next
+            for event in gateway.drain():
+                if event[0] == OrderGateway.FILL:
+                    key = keys[codeof[event[1]]]
+                    psize, pprice = ledger.fill(key, *event[2:])[:2]
+                    risk.filled(event[1], key, event[2], psize, pprice)
+
+    elapsed = (timer() - start) / 1e9
+    gateway.stop()
+    trader.close()
+
+    print('%d orders at %.0f orders/s over %d symbols, %d rejected: %s' % (
+        args.orders, args.orders / elapsed, args.symbols,
+        sum(risk.rejected.values()), dict(risk.rejected)))
+    _report('risk.admit', checks)
+    _report('gateway.submit', submits)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--rate', type=int, default=10000)
+    parser.add_argument('--symbols', type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,56 @@
+'''
+Subscribes a few thousand tickers the way datas do at cerebro start and
+reports how many SubscribeMarketData calls were made and how long it took,
+against one call per ticker. The API call is simulated with a fixed
+latency.
+
+    python benchmarks/bench_subscribe.py --symbols 3000 --latency 0.0005
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import threading
+import time
+
+from xtp_backtrader_api.xtpstore import Subscriptions
+
+
+def main(args):
+    tickers = ['%06d' % (600000 + i) for i in range(args.symbols // 2)] + \
+        ['%06d' % (i + 1) for i in range(args.symbols - args.symbols // 2)]
+
+    calls = []
+
+    def subscribe(codes, exchange):
+        time.sleep(args.latency)
+        calls.append(len(codes))
+        return 0
+
+    done = threading.Event()
+
+    def notify(msg, *args, **kwargs):
+        if msg == 'Subscribed':
+            print('batched: %d tickers, %d calls, %.3fs since first request'
+                  % (args[0], kwargs['calls'], kwargs['elapsed']))
+            done.set()
+
+    subs = Subscriptions(subscribe, debounce=args.debounce, notify=notify)
+    for ticker in tickers:
+        subs.add(ticker)  # as each XTPData.start does
+    done.wait()
+
+    t0 = time.time()
+    for ticker in tickers:
+        subscribe([ticker], None)
+    print('one call per ticker: %d calls, %.3fs' %
+          (len(tickers), time.time() - t0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--symbols', type=int, default=3000)
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help='simulated seconds per SubscribeMarketData call')
+    parser.add_argument('--debounce', type=float, default=0.2)
+    main(parser.parse_args())
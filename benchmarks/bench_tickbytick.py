@@ -0,0 +1,105 @@
+'''
+Replays tick by tick messages into XTPQuoteAPI.OnTickByTick at a fixed
+rate while a consumer thread drains the rings into per second order flow
+bars, as ``XTPTickByTickData`` does.
+
+The default rate is the SZSE peak, about 200k messages/s over the whole
+market on busy opens. Reports the callback latency, the messages lost to
+overflows and the consumer cost per message (decode and aggregation).
+
+    python benchmarks/bench_tickbytick.py --rate 200000 --count 400000
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from xtp_backtrader_api.barbuilder import OrderFlowBuilder
+from xtp_backtrader_api.tickbuffer import TickByTickBuffer
+from xtp_backtrader_api.xtpstore import symbol_key
+
+from fakes import FakeTickByTickSource, offline_quote_api
+
+
+class Consumer(threading.Thread):
+    def __init__(self, rings, interval):
+        super(Consumer, self).__init__()
+        self.daemon = True
+        self.rings = rings
+        self.interval = interval
+        self.flows = [OrderFlowBuilder(1) for _ in rings]
+        self.events = self.bars = 0
+        self.busy = 0.0
+        self.done = False
+
+    def drain(self):
+        for ring, flow in zip(self.rings, self.flows):
+            t0 = time.perf_counter()
+            events = ring.popmany()
+            if events is not None:
+                self.bars += len(flow.update(events))
+                self.events += len(events['kind'])
+            self.busy += time.perf_counter() - t0
+
+    def run(self):
+        while not self.done:
+            self.drain()
+            time.sleep(self.interval)
+        self.drain()
+
+
+def main(args):
+    tickers = ['%06d' % i for i in range(1, args.symbols + 1)]
+    tbtrings = dict((symbol_key(t),
+                     TickByTickBuffer(t, capacity=args.ringsize))
+                    for t in tickers)
+    source = FakeTickByTickSource(offline_quote_api(dict(), tbtrings),
+                                  tickers)
+
+    consumer = Consumer(list(tbtrings.values()), args.poll)
+    consumer.start()
+    spent = np.array(source.run(args.count, rate=args.rate))
+    elapsed = source.elapsed
+    consumer.done = True
+    consumer.join()
+
+    p50, p99 = np.percentile(spent, [50, 99])
+    dropped = sum(ring.dropped for ring in tbtrings.values())
+    print('%d symbols, %d msgs at %.0f msgs/s (asked %d)' %
+          (args.symbols, args.count, args.count / elapsed, args.rate))
+    print('callback  p50=%.2fus p99=%.2fus max=%.2fus' %
+          (p50 / 1e3, p99 / 1e3, spent.max() / 1e3))
+    print('consumer  %d msgs, %d bars, %d dropped, %.2fus/msg '
+          '(%.0f msgs/s capacity)' %
+          (consumer.events, consumer.bars, dropped,
+           consumer.busy / max(consumer.events, 1) * 1e6,
+           consumer.events / max(consumer.busy, 1e-9)))
+
+    # the same work without a producer competing for the GIL, one symbol
+    # drained in full batches
+    ring = TickByTickBuffer('000001', capacity=args.ringsize)
+    source = FakeTickByTickSource(
+        offline_quote_api(dict(), {symbol_key('000001'): ring}), ['000001'])
+    source.run(args.ringsize)
+    flow = OrderFlowBuilder(1)
+    t0 = time.perf_counter()
+    flow.update(ring.popmany())
+    batch = time.perf_counter() - t0
+    print('batch     %d msgs decoded and aggregated in %.2fms, %.2fus/msg' %
+          (args.ringsize, batch * 1e3, batch / args.ringsize * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--rate', type=int, default=200000,
+                        help='messages per second delivered to the callback')
+    parser.add_argument('--count', type=int, default=400000)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--ringsize', type=int, default=4096)
+    parser.add_argument('--poll', type=float, default=0.01,
+                        help='seconds between consumer passes')
+    main(parser.parse_args())
@@ -0,0 +1,53 @@
+'''
+Compares converting XTP data_time integers to backtrader dates with
+strptime + date2num against DataTimeConverter (per tick and batch).
+
+    python benchmarks/bench_timeconv.py --count 200000
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import datetime
+import time
+
+import numpy as np
+from backtrader import date2num
+
+from xtp_backtrader_api.xtpdata import DataTimeConverter
+
+
+def timed(name, func, n):
+    t0 = time.perf_counter()
+    out = func()
+    secs = time.perf_counter() - t0
+    print('%-22s %8.3fs %8.3fus/tick' % (name, secs, secs / n * 1e6))
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    ms = np.sort(rng.randint(0, 4 * 3600 * 1000, args.count)) + \
+        (9 * 3600 + 30 * 60) * 1000
+    secs, ms = np.divmod(ms, 1000)
+    hhmmss = secs // 3600 * 10000 + secs // 60 % 60 * 100 + secs % 60
+    data_times = (20201019 * 1000000 + hhmmss) * 1000 + ms
+    values = data_times.tolist()
+
+    ref = timed('strptime + date2num', lambda: [
+        date2num(datetime.strptime(str(v), '%Y%m%d%H%M%S%f'))
+        for v in values], args.count)
+
+    conv = DataTimeConverter()
+    scalar = timed('converter per tick', lambda: [conv(v) for v in values],
+                   args.count)
+    batch = timed('converter batch', lambda: conv.convert(data_times),
+                  args.count)
+
+    err = max(np.abs(np.array(ref) - np.array(scalar)).max(),
+              np.abs(np.array(ref) - batch).max()) * 86400e6
+    print('max deviation from date2num: %.3fus' % err)
@@ -0,0 +1,156 @@
+'''
+Cost of the stops, trailing stops and bracket children held by
+``XTPBroker``, checked by the quote callback against every tick.
+
+First ``--triggers`` resting triggers (a fourth of them trailing the price
+by an amount, a fourth by a percentage) spread over ``--symbols`` symbols
+are fed ``--ticks`` ticks of a random walk per symbol: ``Triggers.tick``
+(sorted levels per symbol) is compared with checking and trailing every
+held order on every tick.
+
+Then the time from ``OnDepthMarketData`` to ``InsertOrder`` returning for
+the orders a tick triggers (the ``trigger`` stage of the latency monitor)
+is measured with an offline store sending to a local fake trade server:
+``--stops`` buy stops one cent apart, the ticks climbing one cent every
+``--interval`` seconds.
+
+    python benchmarks/bench_triggers.py --triggers 10000 --symbols 100
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import random
+import time
+
+import xtpwrapper.xtp_enum as XTPEnum
+from xtpwrapper.xtp_struct.xquote_struct import XTPMarketDataStruct
+
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.triggers import Triggers
+from xtp_backtrader_api.xtpstore import XTPStore, symbol_key
+
+from fakes import FakeTraderServer, offline_store
+
+
+def _naive(orders, price, fire):
+    # every held order of the symbol, trailing ones moved after the check
+    for oref, order in list(orders.items()):
+        level, above, amount, percent, extreme = order
+        if (price >= level) if above else (price <= level):
+            del orders[oref]
+            fire(oref)
+        elif not (amount or percent):
+            continue
+        elif not above and price > extreme:
+            order[0], order[4] = price - (amount or price * percent), price
+        elif above and price < extreme:
+            order[0], order[4] = price + (amount or price * percent), price
+
+
+def tick_cost(args):
+    rnd = random.Random(1)
+    tickers = [symbol_key('%06d' % (600000 + i))
+               for i in range(args.symbols)]
+
+    fired, naivefired = [], []
+    triggers = Triggers(send=lambda oref, request: fired.append(oref))
+    held = dict((ticker, dict()) for ticker in tickers)
+    for oref in range(args.triggers):
+        n = rnd.randrange(args.symbols)
+        above = rnd.random() < 0.5
+        level = round(10.0 + (1 if above else -1) *
+                      rnd.uniform(0.05, args.spread), 2)
+        amount = percent = 0.0
+        kind = oref % 4
+        if kind == 1:
+            amount = abs(level - 10.0)
+        elif kind == 2:
+            percent = abs(level - 10.0) / 10.0
+        triggers.add(oref, tickers[n], level, above, None,
+                     amount=amount, percent=percent)
+        # the price trailed, as TriggerBook.addtrail
+        if above:
+            extreme = level - amount if amount else level / (1 + percent)
+        else:
+            extreme = level + amount if amount else level / (1 - percent)
+        held[tickers[n]][oref] = [level, above, amount, percent, extreme]
+
+    walk = []
+    last = dict((ticker, 10.0) for ticker in tickers)
+    for _ in range(args.ticks):
+        for ticker in tickers:
+            last[ticker] = round(last[ticker] + rnd.gauss(0, 0.02), 2)
+            walk.append((ticker, last[ticker]))
+
+    tick = triggers.tick
+    t0 = time.perf_counter()
+    for ticker, price in walk:
+        tick(ticker, price)
+    t1 = time.perf_counter()
+    for ticker, price in walk:
+        _naive(held[ticker], price, naivefired.append)
+    t2 = time.perf_counter()
+
+    assert sorted(fired) == sorted(naivefired)
+    print('%d triggers over %d symbols, %d ticks, %d fired' % (
+        args.triggers, args.symbols, len(walk), len(fired)))
+    print('sorted levels: %6.2fus per tick' % ((t1 - t0) / len(walk) * 1e6))
+    print('every order:   %6.2fus per tick' % ((t2 - t1) / len(walk) * 1e6))
+
+
+def trigger_latency(args):
+    store = offline_store(latency=True, reconcile=0, assetrefresh=0)
+    store.trader = trader = FakeTraderServer(fill=False)
+    store._start_trader()  # what the broker does when started
+    store.rings[symbol_key('600000')] = TickRingBuffer('600000',
+                                                       layout='lean')
+
+    def send(oref, request):
+        store.gateway.submitmany((request,))
+        return True
+
+    triggers = store.triggers
+    triggers.send = send
+    for oref in range(1, args.stops + 1):
+        level = round(10.0 + oref * 0.01, 2)
+        triggers.add(oref, symbol_key('600000'), level, True,
+                     (oref, '600000', XTPEnum.XTP_EXCHANGE_TYPE.
+                      XTP_EXCHANGE_SH, True, 100, 0.0, XTPEnum.
+                      XTP_PRICE_TYPE.XTP_PRICE_BEST5_OR_CANCEL))
+
+    md = XTPMarketDataStruct()
+    md.ticker = b'600000'
+    md.exchange_id = 1
+    for n in range(args.stops + 1):
+        secs = 9 * 3600 + 30 * 60 + n
+        md.data_time = ((20201019 * 100 + secs // 3600) * 100 +
+                        secs // 60 % 60) * 100000 + secs % 60 * 1000
+        md.last_price = round(10.0 + n * 0.01, 2)
+        store.quotaAPI.OnDepthMarketData(md, [], 0, 0, [], 0, 0)
+        time.sleep(args.interval)
+
+    time.sleep(0.1)  # last inserts
+    fired = triggers.collect()
+    store.gateway.stop()
+    trader.close()
+    XTPStore._singleton = None
+
+    snap = store.latency.snapshot()['trigger']
+    assert len(fired) == snap['count'] == args.stops
+    print('tick to InsertOrder of %d stops: p50 %.1fus p99 %.1fus '
+          'max %.1fus' % (snap['count'], snap['p50'] / 1e3,
+                          snap['p99'] / 1e3, snap['max'] / 1e3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--triggers', type=int, default=10000)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--spread', type=float, default=1.0)
+    parser.add_argument('--stops', type=int, default=1000)
+    parser.add_argument('--interval', type=float, default=0.001)
+    args = parser.parse_args()
+    tick_cost(args)
+    trigger_latency(args)
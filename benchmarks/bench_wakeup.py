@@ -0,0 +1,106 @@
+'''
+Tick to ``next()`` latency of a live XTPData and the CPU the cerebro loop
+burns meanwhile: ``--ticks`` ticks are delivered to ``OnDepthMarketData``
+every ``--interval`` seconds from a source thread, the strategy takes the
+time of each ``next()`` against the time its tick was pushed.
+
+Compares ``qcheck=0``, where the data returns at once when it has nothing
+and cerebro spins, with waiting up to ``--qcheck`` seconds on the store's
+``Wakeup``, which ``OnDepthMarketData`` signals, with and without the
+asyncio event hub, and prints the latency histogram of each.
+
+    python benchmarks/bench_wakeup.py --ticks 2000 --interval 0.002
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import threading
+import time
+
+import numpy as np
+import backtrader as bt
+
+from fakes import offline_store
+from xtp_backtrader_api.xtpstore import XTPStore
+from xtpwrapper.xtp_struct.xquote_struct import XTPMarketDataStruct
+
+
+def deliver(api, count, interval, pushed):
+    md = XTPMarketDataStruct()
+    md.ticker = b'600000'
+    md.exchange_id = 1
+    time.sleep(0.5)  # subscription and cerebro start
+    start = time.perf_counter()
+    for n in range(count):
+        delay = start + n * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        secs = 9 * 3600 + 30 * 60 + n
+        md.data_time = ((20201019 * 100 + secs // 3600) * 100 +
+                        secs // 60 % 60) * 100000 + secs % 60 * 1000
+        md.last_price = 10.0 + n % 10 * 0.01
+        md.qty = n
+        pushed[n] = time.perf_counter()
+        api.OnDepthMarketData(md, [], 0, 0, [], 0, 0)
+
+
+class Latency(bt.Strategy):
+    params = (('pushed', None), ('count', 0))
+
+    def __init__(self):
+        self.latencies = []
+
+    def next(self):
+        now = time.perf_counter()
+        self.latencies.append(now - self.p.pushed[int(self.data.volume[0])])
+        if len(self.latencies) == self.p.count:
+            self.env.runstop()
+
+
+BUCKETS = [50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000]  # us
+
+
+def histogram(lat):
+    counts = np.bincount(np.searchsorted(BUCKETS, lat),
+                         minlength=len(BUCKETS) + 1)
+    labels = ['<%dus' % b for b in BUCKETS] + ['>=%dus' % BUCKETS[-1]]
+    return '  '.join('%s:%d' % (label, count)
+                     for label, count in zip(labels, counts) if count)
+
+
+def main(name, args, qcheck, **storekwargs):
+    store = offline_store(**storekwargs)
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(store.getdata(dataname='600000',
+                                  timeframe=bt.TimeFrame.Ticks,
+                                  qcheck=qcheck))
+    pushed = [0.0] * args.ticks
+    cerebro.addstrategy(Latency, pushed=pushed, count=args.ticks)
+    source = threading.Thread(target=deliver, args=(
+        store.quotaAPI, args.ticks, args.interval, pushed))
+    source.daemon = True
+    source.start()
+
+    t0, c0 = time.perf_counter(), time.process_time()
+    strat = cerebro.run()[0]
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    XTPStore._singleton = None
+
+    lat = np.array(strat.latencies) * 1e6
+    print('%-10s %d ticks: latency p50 %.0fus p99 %.0fus max %.0fus, '
+          'cpu %.0f%% of %.1fs' % (
+              name, len(lat), np.percentile(lat, 50), np.percentile(lat, 99),
+              lat.max(), cpu / wall * 100, wall))
+    print('           %s' % histogram(lat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--ticks', type=int, default=2000)
+    parser.add_argument('--interval', type=float, default=0.002)
+    parser.add_argument('--qcheck', type=float, default=10.0)
+    args = parser.parse_args()
+    main('spinning', args, 0.0)
+    main('wakeup', args, args.qcheck)
+    main('eventloop', args, args.qcheck, eventloop=True)
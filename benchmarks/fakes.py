@@ -0,0 +1,369 @@
+'''
+Local stand-ins for the XTP servers used by the benchmarks. Nothing here
+opens a network connection.
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import ctypes
+import itertools
+import threading
+import time
+
+from backtrader.utils.py3 import queue
+
+import xtpwrapper
+import xtpwrapper.xtp_enum as XTPEnum
+from xtpwrapper.xtp_struct.xoms_struct import (XTPOrderInfoStruct,
+                                               XTPQueryAssetRspStruct,
+                                               XTPQueryStkPositionRspStruct,
+                                               XTPTradeReportStruct)
+from xtpwrapper.xtp_struct.xquote_struct import (XTPMarketDataStruct,
+                                                 XTPTickByTickStruct)
+
+from xtp_backtrader_api.live_trader import LiveTrader
+from xtp_backtrader_api.xtpstore import XTPQuoteAPI, XTPStore, split_ticker
+
+
+def offline_quote_api(rings, tbtrings=None, recorder=None):
+    '''
+    Returns an ``XTPQuoteAPI`` which has not logged in anywhere and
+    dispatches into ``rings`` (and ``tbtrings`` for tick by tick data),
+    recording the ticks with ``recorder`` if given
+    '''
+    # Bypass the singleton/login in __init__: only the callbacks are needed
+    api = xtpwrapper.QuoteAPI.__new__(XTPQuoteAPI)
+    api.rings = rings
+    api.tbtrings = tbtrings if tbtrings is not None else dict()
+    api.recorder = recorder
+    api.events = api.wakeup = api.latency = api.triggers = None
+    # subscriptions are accepted and ignored
+    api.SubscribeMarketData = api.SubscribeTickByTick = \
+        lambda codes, exchange_id: 0
+    api.UnSubscribeMarketData = api.UnSubscribeTickByTick = \
+        lambda codes, exchange_id: 0
+    return api
+
+
+def offline_store(**kwargs):
+    '''
+    Returns the ``XTPStore`` singleton built over an offline quote api.
+    Brokers and datas created afterwards share it, the ticks of the datas
+    have to be delivered by the caller (e.g. with ``FakeQuoteSource``)
+    '''
+    XTPQuoteAPI._singleton = offline_quote_api(dict())
+    store = XTPStore(**kwargs)
+    store.quotaAPI.rings = store.rings
+    store.quotaAPI.tbtrings = store.tbtrings
+    store.quotaAPI.recorder = store.recorder
+    store.quotaAPI.events = store.events
+    store.quotaAPI.wakeup = store.wakeup
+    store.quotaAPI.latency = store.latency
+    store.quotaAPI.triggers = store.triggers
+    return store
+
+
+class FakeQuoteSource(object):
+    '''
+    Generates depth snapshots for ``tickers`` and delivers them to
+    ``api.OnDepthMarketData`` the way the XTP library does: one struct is
+    reused for every message and only valid for the duration of the call.
+    '''
+
+    def __init__(self, api, tickers, day=20201019):
+        self.api = api
+        self.tickers = [t.encode('utf-8') for t in tickers]
+        self.exchanges = [split_ticker(t)[1] for t in tickers]
+        self.day = day
+        self.md = XTPMarketDataStruct()
+
+    def _fill(self, n):
+        md = self.md
+        md.ticker = self.tickers[n % len(self.tickers)]
+        md.exchange_id = self.exchanges[n % len(self.tickers)]
+        secs = 9 * 3600 + 30 * 60 + (n // len(self.tickers)) % 7200
+        hh, rem = divmod(secs, 3600)
+        mm, ss = divmod(rem, 60)
+        md.data_time = ((self.day * 1000000 + hh * 10000 + mm * 100 + ss) *
+                        1000)
+        price = 10.0 + (n % 97) * 0.01
+        md.last_price = price
+        md.open_price = 10.0
+        md.high_price = 11.0
+        md.low_price = 9.0
+        md.qty = n * 100
+        for lvl in range(10):
+            md.bid[lvl] = price - 0.01 * (lvl + 1)
+            md.ask[lvl] = price + 0.01 * (lvl + 1)
+            md.bid_qty[lvl] = md.ask_qty[lvl] = 100 * (lvl + 1)
+
+    def run(self, count, rate=None, timer=time.perf_counter_ns,
+            templates=0):
+        '''
+        Delivers ``count`` ticks, paced at ``rate`` ticks/s if given, and
+        returns the list of callback durations in nanoseconds.
+
+        With ``templates`` set, that many ticks are generated up front and
+        cycled through (copied into the struct) so that the source is not
+        the bottleneck
+        '''
+        callback = self.api.OnDepthMarketData
+        md = self.md
+        if templates:
+            size = ctypes.sizeof(md)
+            pool = ctypes.create_string_buffer(templates * size)
+            base = ctypes.addressof(pool)
+            for n in range(templates):
+                self._fill(n)
+                ctypes.memmove(base + n * size, ctypes.addressof(md), size)
+
+            def fill(n, dst=ctypes.addressof(md)):
+                ctypes.memmove(dst, base + n % templates * size, size)
+        else:
+            fill = self._fill
+
+        spent = [0] * count
+        start = timer()
+        interval = 1e9 / rate if rate else 0
+        for n in range(count):
+            fill(n)
+            if interval:
+                due = start + n * interval
+                while timer() < due:
+                    pass
+
+            t0 = timer()
+            callback(md, [], 0, 0, [], 0, 0)
+            spent[n] = timer() - t0
+
+        return spent
+
+
+class FakeTickByTickSource(object):
+    '''
+    Generates SZSE style tick by tick messages for ``tickers`` (an entrust
+    followed by the trade it causes, every fifth trade being a cancel) and
+    delivers them to ``api.OnTickByTick`` through a single reused struct.
+    '''
+
+    def __init__(self, api, tickers, day=20201019):
+        self.api = api
+        self.tickers = [t.encode('utf-8') for t in tickers]
+        self.day = day
+        self.tbt = XTPTickByTickStruct()
+        self.tbt.exchange_id = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ
+
+    def _fill(self, n):
+        tbt = self.tbt
+        tbt.ticker = self.tickers[n % len(self.tickers)]
+        seq = n // len(self.tickers)
+        secs = 9 * 3600 + 30 * 60 + (seq // 200) % 7200  # 100 trades/s
+        hh, rem = divmod(secs, 3600)
+        mm, ss = divmod(rem, 60)
+        tbt.data_time = ((self.day * 1000000 + hh * 10000 + mm * 100 + ss) *
+                         1000 + seq % 1000)
+        price = 10.0 + (seq % 97) * 0.01
+        if seq % 2 == 0:
+            tbt.type = XTPEnum.XTP_TBT_TYPE.XTP_TBT_ENTRUST
+            entrust = tbt.entrust
+            entrust.channel_no = 2011
+            entrust.seq = seq + 1
+            entrust.price = price
+            entrust.qty = 100 * (seq % 7 + 1)
+            entrust.side = b'1' if seq % 4 == 0 else b'2'
+            entrust.ord_type = b'2'
+        else:
+            tbt.type = XTPEnum.XTP_TBT_TYPE.XTP_TBT_TRADE
+            trade = tbt.trade
+            trade.channel_no = 2011
+            trade.seq = seq + 1
+            trade.price = price
+            trade.qty = 100 * (seq % 7 + 1)
+            trade.money = trade.price * trade.qty
+            trade.bid_no, trade.ask_no = (seq, seq - 1) if seq % 4 == 1 \
+                else (seq - 1, seq)
+            trade.trade_flag = b'4' if seq % 10 == 9 else b'F'
+
+    def run(self, count, rate=None, timer=time.perf_counter_ns):
+        '''
+        Delivers ``count`` messages, paced at ``rate`` messages/s if given,
+        and returns the list of callback durations in nanoseconds.
+
+        Messages are generated up front and copied into the struct before
+        each call, so that the source keeps up with high rates
+        '''
+        callback = self.api.OnTickByTick
+        tbt = self.tbt
+        size = ctypes.sizeof(tbt)
+        messages = ctypes.create_string_buffer(count * size)
+        base = ctypes.addressof(messages)
+        for n in range(count):
+            self._fill(n)
+            ctypes.memmove(base + n * size, ctypes.addressof(tbt), size)
+
+        spent = [0] * count
+        dst = ctypes.addressof(tbt)
+        memmove = ctypes.memmove
+        start = timer()
+        interval = 1e9 / rate if rate else 0
+        for n in range(count):
+            memmove(dst, base + n * size, size)
+            if interval:
+                due = start + n * interval
+                while timer() < due:
+                    pass
+
+            t0 = timer()
+            callback(tbt)
+            spent[n] = timer() - t0
+
+        self.elapsed = (timer() - start) / 1e9  # seconds spent delivering
+        return spent
+
+
+class FakeTraderServer(LiveTrader):
+    '''
+    ``LiveTrader`` answering orders from a local matching thread instead of
+    an XTP trade server.
+
+    Every accepted order is reported as queued and then, if ``fill`` is
+    set, filled in full at its price (trade report followed by the all
+    traded status) after ``latency`` seconds. Unfilled orders stay queued
+    until cancelled. The structs handed to the callbacks are reused, as
+    the XTP library does.
+
+    The server keeps the account (``cash`` and ``holdings``, by market and
+    ticker) up to date with its fills and answers
+    ``QueryPosition``/``QueryAsset`` from it.
+    '''
+
+    _STATUS = XTPEnum.XTP_ORDER_STATUS_TYPE
+
+    def __init__(self, latency=0.0, fill=True, cash=1000000.0):
+        super(FakeTraderServer, self).__init__()
+        self.latency = latency
+        self.fill = fill
+        self.session_id = 1
+
+        self.cash = cash
+        self.holdings = dict()  # (market, ticker bytes) -> [qty, avg price]
+
+        self._ids = itertools.count(1)
+        # xtp id -> (client id, ticker, price, qty, side, market)
+        self._resting = dict()
+        self._requests = queue.Queue()
+        self._info = XTPOrderInfoStruct()
+        self._trade = XTPTradeReportStruct()
+
+        self._thread = threading.Thread(target=self._t_match)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Login(self, *args):
+        return self.session_id
+
+    def InsertOrder(self, order, session_id):
+        xtpid = next(self._ids)
+        self._requests.put((xtpid, order.order_client_id, order.ticker,
+                            order.price, order.quantity, order.side,
+                            order.market))
+        return xtpid
+
+    def CancelOrder(self, order_xtp_id, session_id):
+        self._requests.put((order_xtp_id, None))
+        return order_xtp_id
+
+    def QueryPosition(self, ticker, session_id, request_id):
+        self._requests.put((request_id, 'position'))
+        return 0
+
+    def QueryAsset(self, session_id, request_id):
+        self._requests.put((request_id, 'asset'))
+        return 0
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def _t_match(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            if self.latency:
+                time.sleep(self.latency)
+
+            xtpid = request[0]
+            if request[1] == 'position':
+                self._answer_positions(request[0])
+                continue
+            if request[1] == 'asset':
+                asset = XTPQueryAssetRspStruct()
+                asset.buying_power = asset.total_asset = self.cash
+                self.OnQueryAsset(asset, None, request[0], True,
+                                  self.session_id)
+                continue
+            if request[1] is None:  # cancel
+                order = self._resting.pop(xtpid, None)
+                if order is not None:
+                    self._order_event(xtpid, order, self._STATUS.
+                                      XTP_ORDER_STATUS_CANCELED)
+                continue
+
+            order = request[1:]
+            self._order_event(xtpid, order,
+                              self._STATUS.XTP_ORDER_STATUS_NOTRADEQUEUEING)
+            if not self.fill:
+                self._resting[xtpid] = order
+                continue
+
+            client_id, ticker, price, qty, side, market = order
+            trade = self._trade
+            trade.order_xtp_id = xtpid
+            trade.order_client_id = client_id
+            trade.ticker = ticker
+            trade.price = price
+            trade.quantity = qty
+            trade.side = side
+            self._book((market, ticker), qty if side != XTPEnum.XTP_SIDE_TYPE.
+                       XTP_SIDE_SELL else -qty, price)
+            self.OnTradeEvent(trade, self.session_id)
+            self._order_event(xtpid, order,
+                              self._STATUS.XTP_ORDER_STATUS_ALLTRADED)
+
+    def _book(self, key, qty, price):
+        self.cash -= qty * price
+        holding = self.holdings.setdefault(key, [0, 0.0])
+        size = holding[0] + qty
+        if qty > 0 and size:
+            holding[1] = (holding[0] * holding[1] + qty * price) / size
+        holding[0] = size
+
+    def _answer_positions(self, request_id):
+        holdings = [(t, h) for t, h in self.holdings.items() if h[0]]
+        if not holdings:
+            self.OnQueryPosition(None, None, request_id, True,
+                                 self.session_id)
+            return
+
+        position = XTPQueryStkPositionRspStruct()
+        for i, ((market, ticker), (qty, price)) in enumerate(holdings):
+            position.market = market
+            position.ticker = ticker
+            position.total_qty = position.sellable_qty = qty
+            position.avg_price = price
+            self.OnQueryPosition(position, None, request_id,
+                                 i == len(holdings) - 1, self.session_id)
+
+    def _order_event(self, xtpid, order, status):
+        client_id, ticker, price, qty, side, _ = order
+        info = self._info
+        info.order_xtp_id = xtpid
+        info.order_client_id = client_id
+        info.ticker = ticker
+        info.price = price
+        info.quantity = qty
+        info.side = side
+        info.order_status = status
+        self.OnOrderEvent(info, None, self.session_id)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from xtp_backtrader_api.barbuilder import BarBuilder
+
+
+def _dt(hhmmss, ms=0, day=20201019):
+    return day * 1000000000 + hhmmss * 1000 + ms
+
+
+def test_barbuilder_sessions():
+    times = [_dt(92500), _dt(93000, 500), _dt(93100), _dt(93100, 1),
+             _dt(113000, 20), _dt(130000, 500), _dt(145659), _dt(145830),
+             _dt(150001)]
+    n = len(times)
+    builder = BarBuilder(60)
+    bars = builder.update(dict(data_time=np.array(times),
+                               last_price=np.arange(1.0, n + 1),
+                               qty=np.arange(1, n + 1) * 100))
+
+    stamps = [bar[0] for bar in bars]
+    # auction folded in the first bar, lunch print in the 11:30 bar
+    assert stamps == [_dt(93100), _dt(93200), _dt(113000), _dt(130100),
+                      _dt(145700)]
+    assert bars[0][1:6] == (1.0, 3.0, 1.0, 3.0, 300)
+
+    assert builder.expire(_dt(150000)) == []
+    last = builder.expire(_dt(150002))[0]
+    # closing auction is a single bar ending at 15:00
+    assert last[0] == _dt(150000)
+    assert last[1:6] == (8.0, 9.0, 8.0, 9.0, 200)
+
+
+def test_barbuilder_batches():
+    builder = BarBuilder(60)
+    first = builder.update(dict(data_time=np.array([_dt(93010)]),
+                                last_price=np.array([10.0]),
+                                qty=np.array([100])))
+    second = builder.update(dict(data_time=np.array([_dt(93020),
+                                                     _dt(93110)]),
+                                 last_price=np.array([9.0, 11.0]),
+                                 qty=np.array([150, 300])))
+    assert first == []
+    assert second[0][1:6] == (10.0, 10.0, 9.0, 9.0, 150)
+
+
+def test_barbuilder_carry():
+    builder = BarBuilder(60, carry=('bid',))
+    bid = np.array([[9.9, 9.8], [9.7, 9.6], [9.5, 9.4]])
+    bars = builder.update(dict(data_time=np.array([_dt(93010), _dt(93050),
+                                                   _dt(93110)]),
+                               last_price=np.array([10.0, 9.8, 9.6]),
+                               qty=np.array([100, 200, 300]), bid=bid))
+    assert list(bars[0][7]) == [9.7, 9.6]  # book at the last tick
+    assert list(builder.expire(_dt(93300))[0][7]) == [9.5, 9.4]
@@ -0,0 +1,118 @@
+import numpy as np
+
+import backtrader as bt
+
+from xtp_backtrader_api.barcache import BAR_DTYPE, BarCache
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.xtpstore import XTPQuoteAPI, XTPStore
+
+
+def _bars(count):
+    bars = np.zeros(count, dtype=BAR_DTYPE)
+    mins = 9 * 60 + 31 + np.arange(count)
+    bars['data_time'] = 20201019000000000 + \
+        (mins // 60 * 10000 + mins % 60 * 100) * 1000
+    bars['close'] = 10.0 + np.sin(np.arange(count) / 5.0)
+    bars['open'] = bars['high'] = bars['low'] = bars['close']
+    bars['volume'] = np.arange(count) * 100
+    return bars
+
+
+def test_append_read(tmp_path):
+    cache = BarCache(str(tmp_path))
+    bars = _bars(10)
+    assert cache.append('600000', bt.TimeFrame.Minutes, 1, bars[:4]) == 4
+    cache.append('600000', bt.TimeFrame.Minutes, 1,
+                 [tuple(bar) for bar in bars[4:].tolist()])
+
+    read = cache.read('600000', bt.TimeFrame.Minutes, 1)
+    assert (read == bars).all()
+    read = cache.read('600000', bt.TimeFrame.Minutes, 1,
+                      start=20201019093300000, end=20201019093500000)
+    assert read['data_time'].tolist() == bars['data_time'][2:5].tolist()
+    assert not len(cache.read('600000', bt.TimeFrame.Minutes, 5))
+
+
+def _run(store, **kwargs):
+    class SmaCross(bt.Strategy):
+        def __init__(self):
+            self.cross = bt.ind.CrossOver(self.data.close,
+                                          bt.ind.SMA(period=5))
+            self.values = []
+
+        def next(self):
+            self.values.append((self.data.datetime[0], self.cross[0]))
+
+    cerebro = bt.Cerebro(stdstats=False, **kwargs)
+    data = store.getdata(dataname='600000', historical=True,
+                         timeframe=bt.TimeFrame.Minutes, compression=1)
+    assert not data.islive()
+    cerebro.adddata(data)
+    cerebro.addstrategy(SmaCross)
+    return cerebro.run()[0].values
+
+
+def test_historical_preload(tmp_path):
+    bars = _bars(100)
+    BarCache(str(tmp_path)).append('600000', bt.TimeFrame.Minutes, 1, bars)
+    XTPStore._singleton = XTPQuoteAPI._singleton = None
+    try:
+        store = XTPStore(barcache=str(tmp_path))  # live, but not logged in
+        preloaded = _run(store)
+        bybar = _run(store, preload=False, runonce=False)
+        assert store._quotaAPI is None and XTPQuoteAPI._singleton is None
+    finally:
+        XTPStore._singleton = XTPQuoteAPI._singleton = None
+
+    assert len(preloaded) == 95  # SMA and crossover warm up
+    assert preloaded == bybar
+    assert bt.num2date(preloaded[-1][0]).strftime('%H%M') == '1110'
+
+
+def test_append_skips_stored(tmp_path):
+    cache = BarCache(str(tmp_path))
+    bars = _bars(10)
+    cache.append('600000', bt.TimeFrame.Minutes, 1, bars[:6])
+    assert BarCache(str(tmp_path)).append(
+        '600000', bt.TimeFrame.Minutes, 1, bars[4:]) == 4
+    assert (cache.read('600000', bt.TimeFrame.Minutes, 1) == bars).all()
+    assert (cache.tail('600000', bt.TimeFrame.Minutes, 1, 3) ==
+            bars[-3:]).all()
+    assert cache.days('600000', bt.TimeFrame.Minutes, 1).tolist() == \
+        [20201019]
+
+
+def test_backfill_and_cache_live_bars(tmp_path):
+    from test_replay import _record
+
+    ticks, cached = str(tmp_path / 'ticks'), str(tmp_path / 'bars')
+    _record(ticks, 200)  # 600000 from 09:30 to 11:46
+    history = _bars(30)
+    history['data_time'] -= 1000000000  # the day before
+    BarCache(cached).append('600000', bt.TimeFrame.Minutes, 1, history)
+
+    class Collect(bt.Strategy):
+        def __init__(self):
+            self.sma = bt.ind.SMA(period=10)
+            self.dts = []
+
+        def next(self):
+            self.dts.append(self.data.datetime.datetime(0))
+
+    XTPStore._singleton = XTPReplayAPI._singleton = None
+    try:
+        store = XTPStore(replay=ticks, barcache=cached, subdebounce=0.01)
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(store.getdata(dataname='600000', backfill=20,
+                                      timeframe=bt.TimeFrame.Minutes,
+                                      compression=1, bargrace=0))
+        cerebro.addstrategy(Collect)
+        dts = cerebro.run()[0].dts
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+
+    assert len(dts) == 20 + 24 - 9  # backfill and live bars, SMA warm up
+    assert dts[0].day == 18 and dts[-1].day == 19
+    stored = BarCache(cached).read('600000', bt.TimeFrame.Minutes, 1)
+    assert len(stored) == 30 + 24
+    assert (stored[:30] == history).all()
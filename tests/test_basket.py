@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+import backtrader as bt
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.xtpstore import XTPStore
+
+from test_replay import _record
+
+
+class _Trader(object):
+    '''Fills every order in full as soon as it is inserted'''
+    session_id = 1
+    gateway = poller = None
+
+    def __init__(self):
+        self.inserted = []
+
+    def insert_order(self, order, session_id):
+        self.inserted.append(order.order_client_id)
+        xtpid = 1000 + order.order_client_id
+        self.gateway.on_order(SimpleNamespace(
+            order_xtp_id=xtpid, order_client_id=order.order_client_id,
+            order_status=XTPEnum.XTP_ORDER_STATUS_TYPE.
+            XTP_ORDER_STATUS_NOTRADEQUEUEING), None)
+        self.gateway.on_trade(SimpleNamespace(
+            order_xtp_id=xtpid, order_client_id=order.order_client_id,
+            quantity=order.quantity, price=order.price, side=order.side))
+        return xtpid
+
+    def QueryAsset(self, session_id, request_id):
+        return 0
+
+    def QueryPosition(self, ticker, session_id, request_id):
+        return 0
+
+    def GetApiLastError(self):
+        return None
+
+
+def test_submit_basket(tmp_path):
+    _record(str(tmp_path), 200)  # 600000 and 000001
+
+    class Rebalance(bt.Strategy):
+        basket = None
+
+        def next(self):
+            if self.basket is None:
+                with pytest.raises(ValueError, match='000001'):
+                    self.broker.submit_basket(self, self.datas, [300, 150],
+                                              [10.5, 11.0])
+                self.basket = self.broker.submit_basket(
+                    self, self.datas, [300, 100], [10.5, 11.0], why='test')
+
+    XTPStore._singleton = XTPReplayAPI._singleton = None
+    try:
+        # one subscription batch for both datas
+        store = XTPStore(replay=str(tmp_path), reconcile=0, assetrefresh=0)
+        store.trader = trader = _Trader()
+        broker = store.getbroker(use_positions=False, starttimeout=0)
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.setbroker(broker)
+        for code in ('600000', '000001'):
+            cerebro.adddata(store.getdata(dataname=code,
+                                          timeframe=bt.TimeFrame.Ticks))
+        cerebro.addstrategy(Rebalance)
+        basket = cerebro.run()[0].basket
+        broker.next()  # events of the last orders
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+
+    assert len(trader.inserted) == 2
+    assert basket.done and basket.progress() == 1.0
+    assert basket.codes == ['600000', '000001']
+    assert basket.summary()['bought'] == 300 * 10.5 + 100 * 11.0
+    assert all(order.info.why == 'test' for order in basket.orders)
+    assert broker.getposition(cerebro.datas[0]).size == 300
+    assert not broker._baskets
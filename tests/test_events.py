@@ -0,0 +1,66 @@
+import asyncio
+
+import threading
+import time
+
+from xtp_backtrader_api.events import (DataEvent, EventHub, OrderEvent,
+                                       StoreEvent, Wakeup)
+from xtp_backtrader_api.ordergateway import OrderGateway
+
+
+def test_hub_coalesces_ticks():
+    loop = asyncio.new_event_loop()
+    hub = EventHub(loop)  # not running yet: events stay scheduled
+    data = hub.queue(DataEvent)
+    for ticker in (b'600000', b'600000', b'000001', b'600000'):
+        hub.postdata(ticker)
+    hub.post(StoreEvent('msg', (1,), {}))  # nobody asked for these
+    assert hub.delivered == 0
+
+    loop.run_until_complete(asyncio.sleep(0))
+    assert [data.get_nowait() for _ in range(data.qsize())] == [
+        DataEvent(b'600000'), DataEvent(b'000001')]
+    assert hub.delivered == 3
+
+    hub.postdata(b'600000')  # delivered, a new tick schedules a new event
+    assert loop.run_until_complete(hub.get(DataEvent)) == \
+        DataEvent(b'600000')
+    loop.close()
+
+
+def test_gateway_posts_order_events():
+    hub = EventHub()  # own loop thread
+    try:
+        events = []
+
+        async def collect():
+            while len(events) < 2:
+                events.append(await hub.get(OrderEvent))
+
+        done = asyncio.run_coroutine_threadsafe(collect(), hub.loop)
+        hub.loop.call_soon_threadsafe(hub.queue, OrderEvent)
+        gateway = OrderGateway(None, 1, hub=hub)
+        gateway._event((OrderGateway.ACCEPTED, 7))
+        gateway._event((OrderGateway.FILL, 7, -200, 10.4))
+        done.result(5)
+    finally:
+        hub.close()
+
+    assert events == [OrderEvent(OrderGateway.ACCEPTED, 7, ()),
+                      OrderEvent(OrderGateway.FILL, 7, (-200, 10.4))]
+    assert len(gateway.drain()) == 2
+
+
+def test_wakeup():
+    wakeup = Wakeup()
+    assert not wakeup.wait(0)
+    wakeup.signal()
+    wakeup.signal()
+    assert wakeup.wait(10) and not wakeup.wait(0)  # one wake per burst
+
+    timer = threading.Timer(0.05, wakeup.signal)
+    timer.start()
+    t0 = time.perf_counter()
+    assert wakeup.wait(10)
+    assert time.perf_counter() - t0 < 5
+    assert wakeup.wakeups == 2
@@ -0,0 +1,161 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+import backtrader as bt
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.latency import (LatencyAnalyzer, LatencyHistogram,
+                                        LatencyMonitor)
+from xtp_backtrader_api.ordergateway import OrderGateway
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.xtpstore import XTPStore
+
+_STATUS = XTPEnum.XTP_ORDER_STATUS_TYPE
+
+
+def test_histogram_percentiles():
+    values = np.random.RandomState(1).lognormal(11, 1.5, 20000).astype(int)
+    histogram = LatencyHistogram()
+    for value in values.tolist():
+        histogram.record(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == len(values)
+    assert snapshot['max'] == values.max()
+    for pct in (50, 90, 99, 99.9):
+        exact = np.percentile(values, pct)
+        assert abs(histogram.percentile(pct) - exact) <= exact * 0.04
+
+    buckets = histogram.cumulative()
+    assert [limit for limit, _ in buckets[:3]] == [64, 128, 256]
+    assert [seen for _, seen in buckets] == sorted(seen for _, seen in buckets)
+    assert buckets[-1][1] == len(values)
+
+
+def test_monitor_order_path():
+    clock = iter(range(1000, 100000, 1000))
+    monitor = LatencyMonitor(clock=lambda: next(clock))
+
+    class Trader(object):
+        def insert_order(self, order, session_id):
+            return 500
+
+    gateway = OrderGateway(Trader(), 1, latency=monitor)
+    monitor.consumed(b'600000')  # no tick stamped, only sets loaded
+    monitor.decided()
+    monitor.ordered(7, monitor.now())
+    gateway.submit(7, '600000', XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH,
+                   True, 100, 10.0, XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT)
+    gateway._insert(*gateway._requests.get()[1:])
+    gateway.on_order(SimpleNamespace(
+        order_xtp_id=500, order_client_id=7, order_status=XTPEnum.
+        XTP_ORDER_STATUS_TYPE.XTP_ORDER_STATUS_NOTRADEQUEUEING), None)
+    gateway.on_order(SimpleNamespace(
+        order_xtp_id=500, order_client_id=7, quantity=100,
+        order_status=_STATUS.XTP_ORDER_STATUS_ALLTRADED), None)
+    gateway.on_trade(SimpleNamespace(
+        order_xtp_id=500, order_client_id=7, quantity=100, price=10.0,
+        side=XTPEnum.XTP_SIDE_TYPE.XTP_SIDE_BUY))
+
+    snapshot = monitor.snapshot()
+    assert snapshot['dispatch']['count'] == 0
+    assert [snapshot[stage]['max'] for stage in (
+        'next', 'decide', 'insert', 'ack', 'fill')] == [
+        1000, 2000, 1000, 1000, 2000]
+    assert not monitor._orders and not monitor._inserts
+
+    text = monitor.prometheus()
+    assert 'xtp_latency_seconds_count{stage="fill"} 1' in text
+    assert 'xtp_latency_seconds_bucket{stage="ack",le="+Inf"} 1' in text
+
+
+def test_monitor_bounded_state():
+    monitor = LatencyMonitor()
+    for minute in range(930, 940):
+        for ticker in (b'600000', b'000001'):
+            monitor.tick((1, ticker), (202010190000 + minute) * 100000 + 500)
+
+    assert monitor._minute[0] == 202010190939  # only the last one kept
+    assert len(monitor._pushed) == 2
+    assert monitor.histograms['exchange'].count == 20
+
+    monitor.reset()
+    assert not monitor._pushed and monitor._minute == (None, 0)
+    assert monitor.histograms['exchange'].count == 0
+
+
+def test_monitor_trades_before_all_traded():
+    monitor = LatencyMonitor()
+
+    class Trader(object):
+        def insert_order(self, order, session_id):
+            return 500
+
+    gateway = OrderGateway(Trader(), 1, latency=monitor)
+    monitor.ordered(7, monitor.now())
+    gateway.submit(7, '600000', XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH,
+                   True, 300, 10.0, XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT)
+    gateway._insert(*gateway._requests.get()[1:])
+    for quantity in (100, 200):  # the last report ahead of the status
+        gateway.on_trade(SimpleNamespace(
+            order_xtp_id=500, order_client_id=7, quantity=quantity,
+            price=10.0, side=XTPEnum.XTP_SIDE_TYPE.XTP_SIDE_BUY))
+    assert 7 in monitor._inserts
+    gateway.on_order(SimpleNamespace(
+        order_xtp_id=500, order_client_id=7, quantity=300,
+        order_status=_STATUS.XTP_ORDER_STATUS_ALLTRADED), None)
+
+    assert monitor.snapshot()['fill']['count'] == 2
+    assert not monitor._inserts and not gateway._traded
+
+
+def test_monitor_trigger():
+    clock = iter(range(1000, 100000, 1000))
+    monitor = LatencyMonitor(clock=lambda: next(clock))  # 1000 taken
+    monitor._pushed[b'600000'] = 0  # tick at 0
+    monitor.triggered(3, b'600000')
+    monitor.triggered(4, b'000001')  # no tick stamped: 2000
+    monitor.inserted(3)  # 3000
+    monitor.inserted(4)  # 4000
+
+    snapshot = monitor.snapshot()
+    assert snapshot['trigger']['count'] == 2
+    assert snapshot['trigger']['max'] == 3000
+    assert snapshot['insert']['count'] == 0
+    monitor.done(3)
+    monitor.done(4)
+    assert not monitor._triggers and not monitor._inserts
+
+
+def test_replay_latency(tmp_path):
+    from test_replay import _record
+
+    _record(str(tmp_path), 200)  # 100 ticks of 600000
+
+    class Count(bt.Strategy):
+        def __init__(self):
+            self.ticks = 0
+
+        def next(self):
+            self.ticks += 1
+
+    XTPStore._singleton = XTPReplayAPI._singleton = None
+    try:
+        store = XTPStore(replay=str(tmp_path), latency=True,
+                         subdebounce=0.01)
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(store.getdata(dataname='600000',
+                                      timeframe=bt.TimeFrame.Ticks))
+        cerebro.addstrategy(Count)
+        cerebro.addanalyzer(LatencyAnalyzer, _name='latency')
+        strat = cerebro.run()[0]
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+
+    snapshot = strat.analyzers.latency.get_analysis()
+    assert strat.ticks == 100
+    assert snapshot['exchange']['count'] == 100
+    assert snapshot['dispatch']['count'] == 100
+    assert snapshot['next']['count'] == 100
+    assert 0 < snapshot['dispatch']['p50'] <= snapshot['dispatch']['max']
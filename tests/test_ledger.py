@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+
+from xtp_backtrader_api.ledger import (AccountPoller, Ledger, PositionView,
+                                       Snapshot)
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpstore import symbol_key
+
+
+def test_ledger_fills():
+    ledger = Ledger(cash=10000.0)
+    ledger.fill('600000', 300, 10.0)
+    ledger.fill('600000', -100, 11.0)
+
+    pos = ledger.position('600000')
+    assert (pos.size, pos.price) == (200, 10.0)
+    assert ledger.cash == 10000.0 - 3000.0 + 1100.0
+    assert not ledger.drift
+
+    ledger.fill('000001', -100, 5.0)  # cannot be short a stock
+    assert ledger.drift
+
+
+def test_ledger_reconcile():
+    ledger = Ledger(cash=10000.0, tolerance=1.0)
+    ledger.fill('600000', 100, 10.0)
+
+    # taken before the fill was applied
+    assert ledger.reconcile(Snapshot({}, 10000.0, 0)) is None
+
+    diffs = ledger.reconcile(Snapshot({'600000': (100, 10.0, 0),
+                                       '000001': (500, 4.0, 500)}, 8999.5, 1))
+    assert diffs == [('000001', 0, 500)]
+    assert ledger.position('000001').size == 500
+    assert ledger.sellable == {'600000': 0, '000001': 500}
+    assert ledger.cash == 8999.5
+
+    diffs = ledger.reconcile(Snapshot({}, 8000.0, 1))
+    assert sorted(diffs) == [('000001', 500, 0), ('600000', 100, 0),
+                             ('cash', 8999.5, 8000.0)]
+
+
+def test_poller_snapshot():
+    queries = []
+    trader = SimpleNamespace(
+        QueryAsset=lambda *args: queries.append(args) and 0,
+        QueryPosition=lambda *args: queries.append(args) and 0)
+    gateway = SimpleNamespace(fills=3)
+    poller = AccountPoller(trader, 1, gateway, interval=0)
+
+    assert poller.request()
+    assert not poller.request()  # one query at a time
+    assert len(queries) == 2
+
+    position = SimpleNamespace(ticker=b'000001', market=2, total_qty=200,
+                               sellable_qty=100, avg_price=10.5)  # SH A
+    poller.on_position(position, None, 1, False)
+    poller.on_position(position, None, 2, True)  # not ours
+    position = SimpleNamespace(ticker=b'000001', market=1, total_qty=300,
+                               sellable_qty=300, avg_price=4.0)  # SZ A
+    poller.on_position(position, None, 1, False)
+    poller.on_position(None, None, 1, True)
+    poller.on_asset(SimpleNamespace(buying_power=900.0,
+                                    withholding_amount=100.0), None, 1, True)
+
+    assert poller.drain() == [
+        Snapshot({symbol_key('000001.SH'): (200, 10.5, 100),
+                  symbol_key('000001'): (300, 4.0, 300)}, 1000.0, 3)]
+    assert poller.request()
+
+
+def test_poller_asset_only():
+    queries = []
+    trader = SimpleNamespace(
+        QueryAsset=lambda *args: queries.append('asset') and 0,
+        QueryPosition=lambda *args: queries.append('position') and 0)
+    poller = AccountPoller(trader, 1, interval=0, assetinterval=1.0)
+
+    assert poller.request(positions=False)
+    assert queries == ['asset']
+    poller.on_asset(SimpleNamespace(buying_power=500.0,
+                                    withholding_amount=0.0), None, 1, True)
+    snapshot = poller.drain()[0]
+    assert snapshot == Snapshot(None, 500.0, 0)
+
+    ledger = Ledger()
+    ledger.fill('600000', 100, 10.0)
+    assert ledger.reconcile(snapshot._replace(fills=1)) == \
+        [('cash', -1000.0, 500.0)]
+    assert ledger.position('600000').size == 100  # left alone
+
+
+def test_ledger_valuation():
+    rings = dict()
+    ledger = Ledger(cash=0.0, rings=rings, capacity=2)
+    keys = [symbol_key(code) for code in ('600000', '600001', '600002')]
+    for i, key in enumerate(keys):
+        ledger.fill(key, 100 * (i + 1), 10.0)
+
+    assert ledger.marketvalue() == 6000.0  # at cost, no ticks yet
+
+    rings[keys[1]] = ring = TickRingBuffer('600001', capacity=4)
+    assert ledger.marketvalue() == 6000.0
+    ring.push(SimpleNamespace(**dict(
+        (name, 12.0 if name == 'last_price' else 0)
+        for name, _ in TickRingBuffer.FIELDS)))
+
+    assert ledger.marketvalue() == 6400.0
+    index = [ledger.slot(keys[1]), ledger.slot(keys[2])]
+    assert ledger.marketvalue(index) == 2400.0 + 3000.0
+
+
+def test_position_view_clone_on_write():
+    ledger = Ledger()
+    ledger.fill('600000', 100, 10.0)
+    cache = dict()
+    view = cache['d'] = PositionView(ledger.position('600000'), cache, 'd')
+
+    ledger.fill('600000', 100, 12.0)
+    assert (view.size, view.price, len(view), bool(view)) == \
+        (200, 11.0, 200, True)
+    assert view.upopened == 100
+
+    view.update(-50, 13.0)  # private copy from now on
+    assert view.size == 150 and ledger.position('600000').size == 200
+    assert 'd' not in cache
+
+    view.size = 0
+    assert ledger.position('600000').size == 200
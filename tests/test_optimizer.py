@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import backtrader as bt
+
+from xtp_backtrader_api import optimizer
+from xtp_backtrader_api.barcache import BAR_DTYPE
+from xtp_backtrader_api.optimizer import (ParameterSweep, SharedBarData,
+                                          SharedBars)
+
+needs_shm = pytest.mark.skipif(optimizer.shared_memory is None,
+                               reason='multiprocessing.shared_memory')
+
+
+class SmaCross(bt.Strategy):
+    params = (('fast', 5), ('slow', 20))
+
+    def __init__(self):
+        self.cross = bt.ind.CrossOver(bt.ind.SMA(period=self.p.fast),
+                                      bt.ind.SMA(period=self.p.slow))
+
+    def next(self):
+        if self.cross[0] > 0:
+            self.buy(size=100)
+        elif self.cross[0] < 0:
+            self.close()
+
+
+def _bars(count, seed):
+    bars = np.zeros(count, dtype=BAR_DTYPE)
+    mins = np.arange(count)
+    bars['data_time'] = (20201019 + mins // 240) * 1000000000 + \
+        ((9 + mins % 240 // 60) * 10000 + mins % 60 * 100) * 1000
+    close = 10.0 + np.cumsum(np.random.RandomState(seed).normal(0, 0.05,
+                                                                count))
+    for name in ('open', 'high', 'low', 'close'):
+        bars[name] = close
+    return bars
+
+
+def _backtest(bars, **params):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(1000000.0)
+    for code, values in bars.items():
+        cerebro.adddata(SharedBarData(bars=values), name=code)
+    cerebro.addstrategy(SmaCross, **params)
+    return cerebro.run()[0].broker.getvalue()
+
+
+@needs_shm
+def test_shared_bars():
+    bars = {'600000': _bars(50, 0), '000001': _bars(30, 1)}
+    shared = SharedBars.create(bars)
+    try:
+        other = SharedBars.attach(shared.name, shared.layout)
+        assert list(other) == ['600000', '000001']
+        assert (other['000001'] == bars['000001']).all()
+        other.close()
+    finally:
+        shared.close()
+
+
+@needs_shm
+def test_sweep_matches_backtests():
+    bars = {'600000': _bars(1000, 0), '000001': _bars(1000, 1)}
+    sweep = ParameterSweep(SmaCross, dict(fast=[5, 10], slow=[20, 30]),
+                           bars, workers=2,
+                           analyzers=[(bt.analyzers.TradeAnalyzer, {})])
+    results = sweep.run()
+
+    assert [r.params for r in results] == sweep.combinations()
+    assert len(results) == 4 and sweep.rate > 0
+    for result in results:
+        assert result.value == _backtest(bars, **result.params)
+        assert result.analyzers[0].total.total > 0
+    assert len(set(r.value for r in results)) > 1
+
+
+def test_sweep_without_shared_memory(monkeypatch):
+    monkeypatch.setattr(optimizer, 'shared_memory', None)
+    with pytest.raises(RuntimeError, match='Python 3.8'):
+        ParameterSweep(SmaCross, dict(fast=[5]), {'600000': _bars(10, 0)})
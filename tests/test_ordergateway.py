@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.ordergateway import OrderGateway
+
+_STATUS = XTPEnum.XTP_ORDER_STATUS_TYPE
+_SH = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH
+_LIMIT = XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT
+
+
+class _Trader(object):
+    def __init__(self):
+        self.inserted = []
+        self.cancelled = []
+
+    def insert_order(self, order, session_id):
+        self.inserted.append(order)
+        return 1000 + len(self.inserted)
+
+    def cancel_order(self, xtpid, session_id):
+        self.cancelled.append(xtpid)
+        return 1
+
+    def GetApiLastError(self):
+        return None
+
+
+def _order(xtpid, oref, status):
+    return SimpleNamespace(order_xtp_id=xtpid, order_client_id=oref,
+                           order_status=status)
+
+
+def test_gateway_lifecycle():
+    trader = _Trader()
+    gateway = OrderGateway(trader, 1)
+    gateway.submit(7, '600000', _SH, False, 200, 10.5, _LIMIT)
+    gateway._insert(*gateway._requests.get()[1:])
+
+    assert gateway.byref[7] == 1001 and gateway.byxtpid[1001] == 7
+    assert trader.inserted[0].quantity == 200
+
+    gateway.on_order(_order(1001, 7, _STATUS.XTP_ORDER_STATUS_NOTRADEQUEUEING),
+                     None)
+    gateway.on_trade(SimpleNamespace(
+        order_xtp_id=1001, order_client_id=7, quantity=200, price=10.4,
+        side=XTPEnum.XTP_SIDE_TYPE.XTP_SIDE_SELL))
+    gateway.on_order(_order(1001, 7, _STATUS.XTP_ORDER_STATUS_ALLTRADED),
+                     None)
+
+    assert gateway.drain() == [(OrderGateway.ACCEPTED, 7),
+                               (OrderGateway.FILL, 7, -200, 10.4)]
+    assert 7 not in gateway.inflight
+
+    gateway._cancel(7)  # already done, nothing sent
+    assert trader.cancelled == []
+
+
+def test_gateway_callback_before_insert_returns():
+    gateway = OrderGateway(_Trader(), 1)
+    gateway.submit(3, '600000', _SH, True, 100, 10.0, _LIMIT)
+
+    # routed by order_client_id while the xtp id is still unknown
+    gateway.on_order(_order(99, 3, _STATUS.XTP_ORDER_STATUS_CANCELED), None)
+    gateway.on_order(_order(98, 4, _STATUS.XTP_ORDER_STATUS_CANCELED), None)
+
+    assert gateway.drain() == [(OrderGateway.CANCELLED, 3)]
@@ -0,0 +1,62 @@
+import time
+
+from xtp_backtrader_api.events import Wakeup
+from xtp_backtrader_api.ordergateway import OrderGateway
+from xtp_backtrader_api.ratelimit import RateLimiter, TokenBucket
+
+from test_ordergateway import _LIMIT, _SH, _Trader
+
+
+def test_bucket():
+    now = [0.0]
+    bucket = TokenBucket(10, 2, clock=lambda: now[0])
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert abs(bucket.take() - 0.1) < 1e-9
+    now[0] = 0.05
+    assert abs(bucket.take() - 0.05) < 1e-9
+    now[0] = 1.0
+    assert bucket.take() == 0 and bucket.take() == 0 and bucket.take()
+    now[0] = 2.0
+    assert bucket.take(5) == 0  # more than the burst takes the burst
+
+
+def test_cancels_first_and_paced():
+    limiter = RateLimiter(insert=50, burst=0.02)  # 1 order in the bucket
+    for oref in range(5):
+        limiter.put((True, oref))
+    limiter.put((False, 3), cancel=True)
+    assert limiter.metrics()['maxdepth'] == 6
+
+    t0 = time.perf_counter()
+    got = [limiter.get() for _ in range(6)]
+    elapsed = time.perf_counter() - t0
+    assert got[0] == (False, 3)
+    assert [r[1] for r in got[1:]] == list(range(5))
+    assert 0.07 < elapsed < 2.0  # 4 orders waited for a token at 50/s
+    assert limiter.throttled['insert'] == 4
+    assert limiter.sent == {'insert': 5, 'cancel': 1}
+
+    assert limiter.take() and limiter.take(count=2)  # queries unlimited
+    limiter.put((True, 9))
+    limiter.put((True, 10))
+    limiter.close()
+    assert limiter.get() is None  # no token left, nothing waits
+    assert len(limiter.dropped) == 2
+
+
+def test_gateway_withdraws_queued_order():
+    trader = _Trader()
+    notes = []
+    gateway = OrderGateway(trader, 1, limiter=RateLimiter(insert=1),
+                           notify=lambda *args: notes.append(args))
+    for oref in (1, 2, 3):
+        gateway.submit(oref, '600000', _SH, True, 100, 10.0, _LIMIT)
+    gateway.cancel(2)
+    gateway.wakeup = Wakeup()
+    gateway.start()
+    assert gateway.wakeup.wait(5)  # the cancel went before the orders
+    gateway.stop()
+
+    assert [o.order_client_id for o in trader.inserted] == [1]
+    assert gateway.drain() == [(OrderGateway.CANCELLED, 2)]
+    assert notes == [('Requests dropped at stop', 1)]
@@ -0,0 +1,51 @@
+import os
+
+from xtpwrapper.xtp_struct.xquote_struct import XTPMarketDataStruct
+
+from xtp_backtrader_api.recorder import TickRecorder, open_ticks
+from xtp_backtrader_api.xtpstore import XTPEnum
+
+SH = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH
+SZ = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ
+
+
+def test_recorder_files(tmp_path):
+    recorder = TickRecorder(str(tmp_path), capacity=8)
+    md = XTPMarketDataStruct()  # reused, as the quote api does
+    for i, (exchange, ticker, day) in enumerate([
+            (SH, b'600000', 20201019), (SZ, b'000001', 20201019),
+            (SH, b'600036', 20201019), (SH, b'600000', 20201020)]):
+        md.exchange_id = exchange
+        md.ticker = ticker
+        md.data_time = day * 1000000000 + 93000000 + i
+        md.last_price = 10.0 + i
+        md.bid[9] = 9.0 - i
+        md.ask_qty[0] = 100 * i
+        recorder.push(md)
+
+    assert recorder.flush() == 4
+    assert list(recorder._files) == [(20201020, SH)]  # older day closed
+    recorder.push(md)
+    recorder.stop()
+    assert not recorder._files
+
+    ticks = open_ticks(recorder.filename(20201019, SH))
+    assert ticks['ticker'].tolist() == [b'600000', b'600036']
+    assert ticks['last_price'].tolist() == [10.0, 12.0]
+    assert ticks['bid'][:, 9].tolist() == [9.0, 7.0]
+    assert open_ticks(recorder.filename(20201019, SZ))['ask_qty'][0, 0] == 100
+    assert len(open_ticks(recorder.filename(20201020, SH))) == 2
+
+
+def test_recorder_partial_record(tmp_path):
+    name = str(tmp_path / '20201019.SH.ticks')
+    recorder = TickRecorder(str(tmp_path))
+    recorder.push(XTPMarketDataStruct(exchange_id=SH,
+                                      data_time=20201019093000000))
+    recorder.flush()
+    f = recorder._files.pop((20201019, SH))
+    f.write(b'\0' * 100)  # record being written
+    f.close()
+
+    assert os.path.getsize(name) == 604
+    assert len(open_ticks(name)) == 1
@@ -0,0 +1,95 @@
+import collections
+import time
+
+import backtrader as bt
+import numpy as np
+
+from xtpwrapper.xtp_struct.xquote_struct import XTPMarketDataStruct
+
+from xtp_backtrader_api.barbuilder import BarBuilder
+from xtp_backtrader_api.recorder import TickRecorder, open_ticks
+from xtp_backtrader_api.replay import XTPReplayAPI, data_datetime
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpdata import graceclock
+from xtp_backtrader_api.xtpstore import XTPEnum, XTPStore, symbol_key
+
+
+def _record(path, count):
+    recorder = TickRecorder(path)
+    md = XTPMarketDataStruct()
+    for i in range(count):
+        md.exchange_id = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH + i % 2
+        md.ticker = b'600000' if i % 2 == 0 else b'000001'
+        secs = 9 * 3600 + 30 * 60 + i * 7
+        md.data_time = 20201019093000000 + \
+            (secs // 3600 * 10000 + secs // 60 % 60 * 100 + secs % 60 -
+             93000) * 1000
+        md.last_price = 10.0 + i % 13 * 0.1
+        md.qty = 100 * (i + 1)
+        recorder.push(md)
+    recorder.stop()
+
+
+def test_replay_same_bars(tmp_path):
+    _record(str(tmp_path), 200)
+    ring = TickRingBuffer('600000', capacity=4)  # backpressure needed
+    XTPReplayAPI._singleton = None
+    api = XTPReplayAPI(files=XTPReplayAPI.findfiles(str(tmp_path)),
+                       rings={symbol_key('600000'): ring})
+    assert data_datetime(api._next) == data_datetime(20201019093000000)
+
+    builder, bars = BarBuilder(60), []
+    api.SubscribeMarketData(['600000'], XTPEnum.XTP_EXCHANGE_TYPE.
+                            XTP_EXCHANGE_SH)
+    deadline = time.time() + 10
+    while time.time() < deadline:  # what XTPData._load_bar does
+        finished = api.finished
+        now = graceclock(api.now(), 2.0)
+        ticks = ring.popmany()
+        if ticks is not None:
+            bars.extend(builder.update(ticks))
+        else:
+            bars.extend(builder.expire(now))
+            if finished:
+                break
+
+    assert api.delivered == 100 and ring.dropped == 0
+    recorded = open_ticks(str(tmp_path / '20201019.SH.ticks'))
+    offline = BarBuilder(60)
+    expected = offline.update(dict(
+        (name, np.asarray(recorded[name]))
+        for name in ('data_time', 'last_price', 'qty',
+                     'total_long_positon')))
+    expected += offline.expire(20201019150100000)
+    assert bars == expected
+    assert len(bars) == 24
+
+
+def test_two_datas_one_ticker(tmp_path):
+    _record(str(tmp_path), 200)
+    seen = collections.defaultdict(list)
+
+    class Watch(bt.Strategy):
+        def next(self):
+            for data in self.datas:
+                seen[data._name].append((len(data), data.close[0]))
+
+    XTPStore._singleton = XTPReplayAPI._singleton = None
+    try:
+        store = XTPStore(replay=str(tmp_path))
+        cerebro = bt.Cerebro(stdstats=False)
+        for name in ('ticks', 'minutes'):
+            timeframe = bt.TimeFrame.Ticks if name == 'ticks' else \
+                bt.TimeFrame.Minutes
+            cerebro.adddata(store.getdata(dataname='600000',
+                                          timeframe=timeframe), name=name)
+        cerebro.addstrategy(Watch)
+        cerebro.run()
+        first = store.rings[symbol_key('600000')]
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+
+    # each data drained its own ring, none stole the ticks of the other
+    assert len(first.copies) == 1
+    assert seen['ticks'][-1][0] == 100
+    assert seen['minutes'][-1][0] == 24
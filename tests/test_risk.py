@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+from xtp_backtrader_api.ledger import Ledger, Snapshot
+from xtp_backtrader_api.risk import RiskEngine
+from xtp_backtrader_api.xtpstore import symbol_key
+
+SH = symbol_key('600000')
+
+
+def _engine(**kwargs):
+    ring = SimpleNamespace(price=10.0)
+    ring.last = lambda: ring.price
+    ledger = Ledger()
+    ledger.fill(SH, 1000, 9.0)  # held overnight
+    risk = RiskEngine(rings={SH: ring}, **kwargs)
+    risk.reset(ledger)
+    return risk, ring
+
+
+def test_limits():
+    risk, ring = _engine(maxsize=5000, maxposition=3000, maxnotional=25000,
+                         maxexposure=28000, band=0.05)
+    assert risk.admit(1, SH, True, 6000) == 'Order size limit'
+    assert risk.admit(1, SH, True, 100, 10.6) == 'Price outside band'
+    assert risk.admit(1, SH, True, 3000, 10.0) == \
+        'Order notional limit'
+    assert risk.admit(1, symbol_key('000001'), True, 100) == 'No last price'
+
+    assert risk.admit(1, SH, True, 1500, 10.0, cash=1e6) is None
+    assert risk.openbuys == 15000.0 and risk.exposure == 9000.0
+    assert risk.admit(2, SH, True, 600) == 'Position limit'
+    assert risk.admit(2, SH, True, 500, cash=1e6) == 'Exposure limit'
+    assert risk.admit(2, SH, True, 100, cash=15500) == \
+        'Insufficient cash'
+
+    risk.release(1)
+    assert risk.openbuys == 0.0
+    assert risk.admit(2, SH, True, 1500, cash=1e6) is None
+    assert sum(risk.rejected.values()) == 7
+
+
+def test_tplus1_and_fills():
+    risk, ring = _engine()
+    assert risk.admit(1, SH, True, 500, 10.0, cash=1e6) is None
+    risk.filled(1, SH, 500, 1500, 9.333333)
+    assert risk.symbols[SH].openbuy == 0 and not risk._orders
+    assert abs(risk.exposure - 14000) < 1e-3
+
+    # bought today: only the 1000 held overnight can be sold
+    assert risk.admit(2, SH, False, 1500) == 'Not sellable'
+    assert risk.admit(2, SH, False, 600) is None
+    assert risk.admit(3, SH, False, 500) == 'Not sellable'
+    risk.filled(2, SH, -200, 1300, 9.333333)
+    risk.release(2)
+    assert risk.symbols[SH].sellable == 800
+    assert risk.admit(3, SH, False, 800) is None
+
+    risk.tplus1 = False
+    assert risk.admit(4, SH, False, 500) is None  # 1300 held
+
+
+def test_tplus1_restart():
+    # restarted in the afternoon: 500 of the 1500 shares were bought today
+    ledger = Ledger()
+    ledger.reconcile(Snapshot({SH: (1500, 9.5, 1000)}, 1e6, 0))
+    risk = RiskEngine()
+    risk.reset(ledger)
+    assert risk.symbols[SH].sellable == 1000
+    assert risk.admit(1, SH, False, 1500, 10.0) == 'Not sellable'
+    assert risk.admit(1, SH, False, 1000, 10.0) is None
+
+    ledger.fill(SH, -1000, 10.0)
+    risk.filled(1, SH, -1000, 500, 9.5)
+    risk.reset(ledger, sellable=False)  # reconciled later that day
+    assert risk.symbols[SH].sellable == 0
+
+
+def test_rate_limit():
+    now = [0.0]
+    risk, ring = _engine(maxrate=3, ratewindow=1.0, clock=lambda: now[0])
+    for oref in range(3):
+        assert risk.admit(oref, SH, True, 100, cash=1e6) is None
+    assert risk.admit(3, SH, True, 100, cash=1e6) == 'Order rate limit'
+    now[0] = 1.0
+    assert risk.admit(3, SH, True, 100, cash=1e6) is None
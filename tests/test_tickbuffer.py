@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+
+
+def _tick(i):
+    fields = dict((name, 0) for name, _ in TickRingBuffer.FIELDS)
+    fields.update(data_time=20201019093000000 + i * 1000,
+                  last_price=10.0 + i, qty=100 * i)
+    return SimpleNamespace(**fields)
+
+
+def test_ring_fifo():
+    ring = TickRingBuffer('600000', capacity=8)
+    for i in range(5):
+        assert ring.push(_tick(i))
+
+    assert len(ring) == 5
+    assert [ring.pop().last_price for _ in range(5)] == \
+        [10.0, 11.0, 12.0, 13.0, 14.0]
+    assert ring.pop() is None
+
+
+def test_ring_dropoldest():
+    ring = TickRingBuffer('600000', capacity=4)
+    for i in range(10):
+        ring.push(_tick(i))
+
+    ticks = ring.popmany()
+    assert list(ticks['qty']) == [700, 800, 900]
+    assert ring.dropped == 7
+
+
+def test_ring_alert():
+    alerts = []
+    ring = TickRingBuffer('600000', capacity=4, overflow='alert',
+                          onalert=alerts.append)
+    pushed = [ring.push(_tick(i)) for i in range(6)]
+
+    assert pushed == [True] * 4 + [False] * 2
+    assert ring.overflows == 2
+    assert alerts == [ring]
+    assert ring.pop().last_price == 10.0
+
+
+def test_ring_block_timeout():
+    ring = TickRingBuffer('600000', capacity=2, overflow='block',
+                          blocktimeout=0.01)
+    assert ring.push(_tick(0)) and ring.push(_tick(1))
+    assert not ring.push(_tick(2))
+    assert ring.overflows == 1
+
+
+def test_ring_lean_depth():
+    ring = TickRingBuffer('600000', capacity=4, layout='lean', depth=2)
+    tick = _tick(1)
+    tick.bid, tick.ask = [9.9, 9.8, 9.7], [10.1, 10.2, 10.3]
+    tick.bid_qty, tick.ask_qty = [100, 200, 300], [400, 500, 600]
+    ring.push(tick)
+
+    out = ring.pop()
+    assert 'turnover' not in out._fields
+    assert list(out.bid) == [9.9, 9.8]
+    assert list(out.ask_qty) == [400, 500]
+
+
+def test_ring_last():
+    ring = TickRingBuffer('600000', capacity=4)
+    assert ring.last() is None
+    for i in range(6):
+        ring.push(_tick(i))
+
+    assert ring.last() == 15.0
+    assert ring.last('qty') == 500
+    assert len(ring) == 4  # nothing consumed
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from xtpwrapper.xtp_struct.xquote_struct import XTPTickByTickStruct
+
+from xtp_backtrader_api.barbuilder import OrderFlowBuilder
+from xtp_backtrader_api.tickbuffer import TickByTickBuffer
+from xtp_backtrader_api.xtpdata import XTPTickByTickData
+from xtp_backtrader_api.xtpstore import XTPStore
+
+ENTRUST, TRADE, CANCEL = (TickByTickBuffer.ENTRUST, TickByTickBuffer.TRADE,
+                          TickByTickBuffer.CANCEL)
+
+
+def _dt(hhmmss, ms=0, day=20201019):
+    return day * 1000000000 + hhmmss * 1000 + ms
+
+
+def test_tbt_ring_struct_layout():
+    ring = TickByTickBuffer('000001', capacity=4)
+    tbt = XTPTickByTickStruct()
+    tbt.ticker = b'000001'
+    tbt.data_time = _dt(93000)
+    tbt.type = ENTRUST
+    tbt.entrust.seq = 7
+    tbt.entrust.price = 10.5
+    tbt.entrust.qty = 300
+    tbt.entrust.side = b'2'
+    ring.push(tbt)  # copied, the struct is reused by the library
+
+    tbt.type = TRADE
+    trade = tbt.trade
+    trade.channel_no, trade.seq, trade.price, trade.qty = 2011, 8, 10.4, 200
+    trade.bid_no, trade.ask_no, trade.trade_flag = 9, 7, b'F'
+    ring.push(tbt)
+    trade.bid_no, trade.ask_no, trade.trade_flag = 0, 7, b'4'
+    ring.push(tbt)
+
+    events = ring.popmany()
+    assert events['kind'].tolist() == [ENTRUST, TRADE, CANCEL]
+    assert events['side'].tolist() == [-1, 1, -1]
+    assert events['price'].tolist() == [10.5, 10.4, 10.4]
+    assert events['qty'].tolist() == [300, 200, 200]
+    assert events['channel_seq'].tolist() == [7, 8, 8]
+    assert events['bid_no'].tolist() == [0, 9, 0]
+    assert ring.popmany() is None
+
+
+def test_tbt_ring_plain_objects():
+    ring = TickByTickBuffer('600000', capacity=4)
+    for flag in (b'B', b'S', b'N'):
+        ring.push(SimpleNamespace(ticker=b'600000', data_time=_dt(93000),
+                                  type=TRADE, seq=1, price=5.0, qty=100,
+                                  money=500.0, bid_no=1, ask_no=2,
+                                  trade_flag=flag))
+
+    events = ring.popmany()
+    assert events['kind'].tolist() == [TRADE] * 3
+    assert events['side'].tolist() == [1, -1, 0]
+
+
+def test_order_flow_builder():
+    events = dict(
+        data_time=np.array([_dt(93000, 100), _dt(93000, 200),
+                            _dt(93000, 300), _dt(93000, 900),
+                            _dt(93001, 500)]),
+        kind=np.array([TRADE, ENTRUST, TRADE, CANCEL, TRADE]),
+        side=np.array([1, 1, -1, 1, 1]),
+        price=np.array([10.0, 10.2, 9.9, 10.0, 10.1]),
+        qty=np.array([300, 999, 100, 999, 200]))
+
+    flow = OrderFlowBuilder(1)
+    assert flow.update(dict((k, v[:1]) for k, v in events.items())) == []
+    bars = flow.update(dict((k, v[1:]) for k, v in events.items()))
+    assert bars == [(_dt(93001), 10.0, 10.0, 9.9, 9.9, 400, 300, 100, 200,
+                     2)]
+    assert flow.expire(_dt(93003)) == [
+        (_dt(93002), 10.1, 10.1, 10.1, 10.1, 200, 200, 0, 200, 1)]
+
+
+def test_tbt_data_class():
+    assert XTPStore.TickByTickDataCls is XTPTickByTickData
+    assert 'netvolume' in XTPTickByTickData.lines.getlinealiases()
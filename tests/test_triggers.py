@@ -0,0 +1,166 @@
+from types import SimpleNamespace
+
+import backtrader as bt
+
+from xtp_backtrader_api.replay import XTPReplayAPI
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.triggers import TriggerBook, Triggers
+from xtp_backtrader_api.xtpstore import XTPQuoteAPI, XTPStore, symbol_key
+
+from test_basket import _Trader
+from test_replay import _record
+
+SH, SZ = symbol_key('600000'), symbol_key('000001')
+
+
+def test_trigger_book():
+    book = TriggerBook()
+    book.add(1, 10.5, True)  # buy stop
+    book.add(2, 11.0, True)
+    book.add(3, 9.5, False)  # sell stop
+    book.add(4, 9.8, False)
+    book.add(5, 10.5, True)
+    assert book.cross(10.0) == []
+    assert book.remove(5) and not book.remove(5)
+    assert book.cross(10.6) == [(10.5, 1)]
+    assert book.cross(9.0) == [(9.8, 4), (9.5, 3)]  # nearest level first
+    assert len(book) == 1 and 2 in book
+    assert book.cross(11.0) == [(11.0, 2)] and not book
+
+
+def test_trigger_book_trailing():
+    book = TriggerBook()
+    book.addtrail(1, 9.5, False, amount=0.5)  # sell stop trailing 10.0
+    book.addtrail(2, 10.5, True, percent=0.05)  # buy stop trailing 10.0
+    book.follow(10.4)
+    assert book.level(1) == 9.9 and book.level(2) == 10.5
+    book.follow(10.2)  # below the peak, stays
+    assert book.level(1) == 9.9
+    book.follow(9.6)
+    assert abs(book.level(2) - 9.6 * 1.05) < 1e-9
+    assert book.cross(9.9) == [(9.9, 1)]
+    assert book.peaks == [] and len(book.troughs) == 1
+    assert book.remove(2) and not book.troughs and not book
+
+
+def test_triggers_tick():
+    sent = []
+    triggers = Triggers(send=lambda oref, request: sent.append(request) or
+                        True)
+    triggers.add(1, SH, 10.0, True, ('buy', 1))
+    triggers.add(2, SH, 11.0, True, ('take', 2), group='b')
+    triggers.add(3, SH, 9.0, False, ('stop', 3), group='b')
+    triggers.add(4, SZ, 9.5, False, (4, '000001', 2, False, 100, 9.4, 1),
+                 amount=0.5, offset=0.1)
+    triggers.tick(symbol_key('300001'), 10.0)  # no triggers
+    triggers.tick(SH, 9.5)
+    triggers.tick(SH, 0.0)  # no trade yet, not a fall to 0
+    triggers.tick(SZ, 0.0)
+    assert sent == [] and len(triggers) == 4 and triggers.level(4) == 9.5
+
+    triggers.tick(SH, 10.2)
+    triggers.tick(SH, 11.0)  # take profit, cancels its stop
+    assert sent == [('buy', 1), ('take', 2)]
+    assert 3 not in triggers and SH not in triggers.books
+    assert not triggers.remove(2)  # fired, not collected yet
+    assert triggers.collect() == [(1, 10.0, True), (2, 11.0, True)]
+    assert triggers.collect() == []
+
+    triggers.tick(SZ, 10.3)  # trails up to 9.8
+    assert triggers.level(4) == 9.8
+    triggers.tick(SZ, 9.7)
+    assert sent[-1] == (4, '000001', 2, False, 100, 9.7, 1)  # 9.8 - 0.1
+    assert triggers.collect() == [(4, 9.8, True)]
+    assert not triggers and not triggers.books and not triggers._groups
+
+
+def test_zero_price_snapshot():
+    sent = []
+    triggers = Triggers(send=lambda oref, request: sent.append(oref) or True)
+    triggers.add(1, SH, 9.0, False, None)  # sell stop
+    triggers.add(2, SH, 10.5, True, None, amount=0.5)  # trailing buy
+    api = SimpleNamespace(rings={SH: TickRingBuffer('600000')},
+                          triggers=triggers, latency=None, recorder=None,
+                          wakeup=None, events=None)
+    tick = dict((name, 0) for name, _ in TickRingBuffer.FIELDS)
+
+    def push(price):
+        tick['last_price'] = price
+        XTPQuoteAPI.OnDepthMarketData(
+            api, SimpleNamespace(exchange_id=SH[0], ticker=SH[1], **tick),
+            0, 0, 0, 0, 0, 0)
+
+    push(0.0)  # pre-open snapshot, nothing traded yet
+    assert sent == [] and len(triggers) == 2
+    assert triggers.level(1) == 9.0 and triggers.level(2) == 10.5
+    push(8.9)
+    assert sent == [1] and triggers.level(2) == 8.9 + 0.5
+
+
+def test_bracket_and_oco(tmp_path):
+    _record(str(tmp_path), 200)  # prices between 10.0 and 11.2
+    notified, closed = [], []
+
+    class Contingent(bt.Strategy):
+        bracket = None
+
+        def notify_order(self, order):
+            notified.append((order.ref, order.getstatusname()))
+
+        def notify_trade(self, trade):
+            if trade.isclosed and trade.data is self.data0:
+                closed.append(trade.pnl)
+
+        def next(self):
+            if self.bracket is not None:
+                return
+            self.bracket = self.buy_bracket(
+                self.data0, size=100, price=10.0, exectype=bt.Order.Limit,
+                stopprice=9.5, limitprice=10.95)
+            self.up = self.buy(self.data1, size=100, price=10.85,
+                               exectype=bt.Order.Stop)
+            self.down = self.sell(self.data1, size=100, price=9.0,
+                                  exectype=bt.Order.Stop, oco=self.up)
+            self.trail = self.sell(self.data1, size=100,
+                                   exectype=bt.Order.StopTrail,
+                                   trailamount=0.3)
+            self.level = self.trail.created.price
+
+    XTPStore._singleton = XTPReplayAPI._singleton = None
+    try:
+        # one subscription batch for both datas
+        store = XTPStore(replay=str(tmp_path), reconcile=0, assetrefresh=0)
+        store.trader = trader = _Trader()
+        broker = store.getbroker(use_positions=False, starttimeout=0)
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.setbroker(broker)
+        for code in ('600000', '000001'):  # small rings pace the replay
+            cerebro.adddata(store.getdata(dataname=code, ringsize=4,
+                                          timeframe=bt.TimeFrame.Ticks))
+        cerebro.addstrategy(Contingent)
+        strategy = cerebro.run()[0]
+        broker.next()
+    finally:
+        XTPStore._singleton = XTPReplayAPI._singleton = None
+
+    parent, stop, limit = strategy.bracket
+
+    def statuses(order):
+        return [s for ref, s in notified if ref == order.ref]
+
+    assert statuses(parent)[-1] == 'Completed'
+    assert statuses(limit) == ['Accepted', 'Completed']
+    assert statuses(stop) == ['Accepted', 'Canceled']
+    assert statuses(strategy.up) == ['Accepted', 'Completed']
+    assert statuses(strategy.down) == ['Accepted', 'Canceled']
+    # followed the price up to the top of the saw before it dropped
+    assert statuses(strategy.trail) == ['Accepted', 'Completed']
+    assert strategy.trail.created.price > strategy.level
+    assert round(strategy.trail.created.price + 0.3, 2) in (11.1, 11.2)
+    # held orders never reached the trader
+    assert sorted(trader.inserted) == sorted(
+        [parent.ref, limit.ref, strategy.up.ref, strategy.trail.ref])
+    assert broker.getposition(cerebro.datas[0]).size == 0
+    assert len(closed) == 1 and abs(closed[0] - 100 * 0.95) < 1e-6
+    assert broker.getposition(cerebro.datas[1]).size == 0
+    assert not broker.triggers and not broker.brackets and not broker._ocos
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import numpy as np
+
+from backtrader import date2num
+
+from xtp_backtrader_api.xtpdata import DataTimeConverter, DepthBook, XTPData
+from xtp_backtrader_api.xtpstore import XTPStore
+
+
+def test_datatime_converter():
+    values = [20201019092500000, 20201019113000123, 20201020145959999]
+    expected = [date2num(datetime.strptime(str(v), '%Y%m%d%H%M%S%f'))
+                for v in values]
+
+    conv = DataTimeConverter()
+    assert np.allclose([conv(v) for v in values], expected,
+                       rtol=0, atol=1e-9)
+    assert np.allclose(conv.convert(values), expected, rtol=0, atol=1e-9)
+
+
+def test_depth_book():
+    book = DepthBook(2, capacity=2)
+    for i in range(3):
+        book.append([10.0 - i, 9.9], [10.1, 10.2 + i], [100, 200], [i, 400])
+
+    assert len(book) == 3
+    assert book.bid[:, 0].tolist() == [10.0, 9.0, 8.0]
+    assert book.columns()['ask_qty'].tolist() == [[0, 400], [1, 400],
+                                                  [2, 400]]
+
+
+def test_depth_lines_class():
+    cls = XTPData.withdepth(3)
+    assert cls is XTPData.withdepth(3)
+    assert cls._depthlevels == 3
+    assert 'askvol3' in cls.lines.getlinealiases()
+    assert 'bid4' not in cls.lines.getlinealiases()
+    assert XTPStore.DataCls is XTPData
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+from xtp_backtrader_api.xtpstore import Subscriptions, split_ticker, \
+    symbol_key, XTPEnum, XTPQuoteAPI, XTPStore
+
+
+SH = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH
+SZ = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ
+
+
+def test_split_ticker():
+    assert split_ticker('600000') == ('600000', SH)
+    assert split_ticker('688158') == ('688158', SH)
+    assert split_ticker('300750') == ('300750', SZ)
+    assert split_ticker('000001.SH') == ('000001', SH)
+    with pytest.raises(ValueError):
+        split_ticker('999999')
+    assert symbol_key('000001.SH') == (1, b'000001')
+    assert symbol_key('000001') == (2, b'000001')
+
+
+def test_subscriptions_batch_per_exchange():
+    calls = []
+    subs = Subscriptions(lambda codes, ex: calls.append((ex, codes)) or 0,
+                         debounce=60)
+    for ticker in ('600000', '000001', '600036', '300750', '600000'):
+        subs.add(ticker)
+    subs.flush()
+
+    assert calls == [(SH, ['600000', '600036']), (SZ, ['000001', '300750'])]
+
+
+def test_subscriptions_same_code_both_exchanges():
+    calls = []
+    subs = Subscriptions(lambda codes, ex: calls.append((ex, codes)) or 0,
+                         debounce=60)
+    for ticker in ('000001.SH', '000001', '000001.SZ', '000001.SH'):
+        subs.add(ticker)
+    subs.flush()
+
+    assert calls == [(SH, ['000001']), (SZ, ['000001'])]
+    assert subs.subscribed == set([('000001', SH), ('000001', SZ)])
+
+
+def test_rings_per_exchange():
+    # the SSE composite index and Ping An Bank share their code
+    store = SimpleNamespace(rings=dict(), _ring_overflow=None)
+    index = XTPStore.register_ring(store, '000001.SH')
+    bank = XTPStore.register_ring(store, '000001.SZ')
+    assert index is not bank
+
+    api = SimpleNamespace(rings=store.rings, triggers=None, latency=None,
+                          recorder=None, wakeup=None, events=None)
+    tick = dict((name, 0) for name, _ in TickRingBuffer.FIELDS)
+    for exchange, price in ((SH, 3300.0), (SZ, 15.0)):
+        tick['last_price'] = price
+        md = SimpleNamespace(exchange_id=int(exchange), ticker=b'000001',
+                             **tick)
+        XTPQuoteAPI.OnDepthMarketData(api, md, 0, 0, 0, 0, 0, 0)
+
+    assert len(index) == len(bank) == 1
+    assert index.last() == 3300.0 and bank.last() == 15.0
@@ -1,8 +1,13 @@
 from .xtpstore import XTPStore
 from .xtpbroker import XTPBroker
-from .xtpdata import XTPData
+from .xtpdata import XTPData, XTPTickByTickData
+from .replay import XTPReplayAPI
+from .optimizer import ParameterSweep
+from .latency import LatencyAnalyzer
+from .risk import RiskEngine
 
 __all__ = [
-    'XTPStore', 'XTPBroker', 'XTPData',
+    'XTPStore', 'XTPBroker', 'XTPData', 'XTPTickByTickData', 'XTPReplayAPI',
+    'ParameterSweep', 'LatencyAnalyzer', 'RiskEngine',
 ]
 __version__ = '0.13.1'
@@ -0,0 +1,269 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+from xtp_backtrader_api.tickbuffer import TickByTickBuffer
+
+
+# SSE/SZSE sessions in milliseconds since midnight
+_MS = 1000
+_AM_OPEN = (9 * 3600 + 30 * 60) * _MS
+_AM_CLOSE = (11 * 3600 + 30 * 60) * _MS
+_PM_OPEN = 13 * 3600 * _MS
+_PM_AUCTION = (14 * 3600 + 57 * 60) * _MS  # closing call auction starts
+_PM_CLOSE = 15 * 3600 * _MS
+
+_AM_LEN = _AM_CLOSE - _AM_OPEN
+_SESSION_LEN = _AM_LEN + (_PM_CLOSE - _PM_OPEN)
+_AUCTION_START = _AM_LEN + (_PM_AUCTION - _PM_OPEN)
+
+_BUCKETS_PER_DAY = 1000000  # spacing of bucket keys between trading days
+
+
+def split_data_time(data_time):
+    '''
+    Splits XTP ``data_time`` values (YYYYMMDDHHMMSSsss) into the trading
+    day (YYYYMMDD) and milliseconds since midnight. Works on ints and numpy
+    integer arrays.
+    '''
+    day, clock = data_time // 1000000000, data_time % 1000000000
+    hh, mm, ms = clock // 10000000, clock // 100000 % 100, clock % 100000
+    return day, (hh * 3600 + mm * 60) * _MS + ms
+
+
+def session_ms(clock_ms):
+    '''
+    Maps milliseconds since midnight to milliseconds of continuous trading
+    since the open, with the lunch break removed. Works on scalars and
+    numpy arrays.
+
+    The opening call auction maps to the open, the lunch break to the end
+    of the morning session and everything after the close to the close,
+    so that those prints end up in the first bar, the last morning bar and
+    the last bar of the day respectively.
+    '''
+    clock_ms = np.asarray(clock_ms, dtype=np.int64)
+    am = np.clip(clock_ms - _AM_OPEN, 0, _AM_LEN)
+    pm = np.clip(clock_ms - _PM_OPEN, 0, _PM_CLOSE - _PM_OPEN)
+    return am + pm
+
+
+def clock_seconds(session):
+    '''Inverse of ``session_ms`` for bar edges, in seconds since midnight'''
+    session = min(session, _SESSION_LEN)
+    if session <= _AM_LEN:
+        return (_AM_OPEN + session) // _MS
+    return (_PM_OPEN + session - _AM_LEN) // _MS
+
+
+class BarBuilder(object):
+    '''
+    Aggregates batches of ticks into OHLCV bars of ``seconds`` seconds
+    aligned to the SSE/SZSE trading sessions.
+
+    Ticks are consumed in batches as returned by ``TickRingBuffer.popmany``
+    and grouped with numpy, so the cost per tick is a few vectorized
+    operations instead of a pass through backtrader's resampler.
+
+    Bars are stamped with their right edge (the backtrader convention) as an
+    XTP ``data_time`` integer. The
+    closing call auction (14:57-15:00) is merged into a single bar ending at
+    15:00, the opening call auction is folded into the first bar of the day
+    and nothing is ever produced for the lunch break.
+
+    Only completed bars are returned. A bar completes when a tick for a
+    later bar arrives or when ``expire`` is called with a later time.
+
+    The value of each tick column named in ``carry`` at the last tick of a
+    bar (for example the order book at the close) is appended to the bar.
+    '''
+
+    def __init__(self, seconds, carry=()):
+        self.barms = int(seconds * _MS)
+        if self.barms <= 0:
+            raise ValueError('Bar length must be positive')
+
+        self.carry = tuple(carry)
+
+        self._cur = None  # [key, open, high, low, close, cumqty, oi]
+        self._lastkey = 0  # key of the last completed bar
+        self._prevcum = 0  # cumulative volume at the end of the last bar
+        self._prevday = None
+
+    def keys(self, data_time):
+        '''Returns the bar keys for an array of XTP ``data_time`` values'''
+        day, clock_ms = split_data_time(np.asarray(data_time, dtype=np.int64))
+        session = session_ms(clock_ms)
+        # the closing auction is a single bar ending at the close
+        session = np.where(session > _AUCTION_START, _SESSION_LEN, session)
+        # right edge of the bar, the open belongs to the first bar
+        bucket = np.maximum(-(-session // self.barms), 1)
+        return day * _BUCKETS_PER_DAY + bucket
+
+    def update(self, ticks):
+        '''
+        Adds a batch of ticks (dictionary of arrays with at least
+        ``data_time``, ``last_price`` and ``qty``) and returns the list of
+        bars completed by it
+        '''
+        keys = self.keys(ticks['data_time'])
+        # skip auction snapshots without a match and ticks for bars which
+        # have already been delivered
+        valid = (ticks['last_price'] > 0.0) & (keys > self._lastkey)
+        if not valid.all():
+            ticks = dict((k, v[valid]) for k, v in ticks.items())
+            keys = keys[valid]
+
+        if not len(keys):
+            return []
+
+        price = ticks['last_price']
+        if self._cur is not None:  # late ticks go into the current bar
+            keys[0] = max(keys[0], self._cur[0])
+        keys = np.maximum.accumulate(keys)
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)] - 1
+
+        bkeys = keys[starts]
+        opens = price[starts]
+        highs = np.maximum.reduceat(price, starts)
+        lows = np.minimum.reduceat(price, starts)
+        closes = price[ends]
+        cums = ticks['qty'][ends]
+        ois = ticks.get('total_long_positon', np.zeros_like(keys))[ends]
+
+        columns = [bkeys.tolist(), opens.tolist(), highs.tolist(),
+                   lows.tolist(), closes.tolist(), cums.tolist(), ois.tolist()]
+        columns.extend(ticks[name][ends] for name in self.carry)
+        rows = list(zip(*columns))
+
+        done = []
+        cur = self._cur
+        if cur is not None:
+            if cur[0] == rows[0][0]:
+                first = rows[0]
+                rows[0] = (cur[0], cur[1], max(cur[2], first[2]),
+                           min(cur[3], first[3])) + first[4:]
+            else:
+                done.append(tuple(cur))
+
+        done.extend(rows[:-1])
+        self._cur = list(rows[-1])
+        return [self._makebar(row) for row in done]
+
+    def expire(self, data_time):
+        '''
+        Completes the pending bar if ``data_time`` is past its right edge
+        and returns it in a list (empty if nothing completed)
+
+        The comparison is made on the wall clock, so the last bar before the
+        lunch break and the closing auction bar complete right after 11:30
+        and 15:00 respectively.
+        '''
+        if self._cur is None:
+            return []
+
+        day, bucket = divmod(self._cur[0], _BUCKETS_PER_DAY)
+        edge = clock_seconds(bucket * self.barms) * _MS
+        if split_data_time(int(data_time)) <= (day, edge):
+            return []
+
+        row, self._cur = tuple(self._cur), None
+        return [self._makebar(row)]
+
+    def pending(self):
+        '''Returns the right edge of the pending bar (``None`` if none)'''
+        return self._stamp(self._cur[0]) if self._cur is not None else None
+
+    def _makebar(self, row):
+        key, o, h, l, c, cum, oi = row[:7]
+        self._lastkey = key
+        day = key // _BUCKETS_PER_DAY
+        if day != self._prevday:  # qty is cumulative per trading day
+            self._prevday = day
+            self._prevcum = 0
+
+        volume, self._prevcum = cum - self._prevcum, cum
+        return (self._stamp(key), o, h, l, c, volume, oi) + tuple(row[7:])
+
+    def _stamp(self, key):
+        # right edge of the bar as an XTP data_time
+        day, bucket = divmod(key, _BUCKETS_PER_DAY)
+        secs = clock_seconds(bucket * self.barms)
+        hhmmss = secs // 3600 * 10000 + secs // 60 % 60 * 100 + secs % 60
+        return (day * 1000000 + hhmmss) * 1000
+
+
+class OrderFlowBuilder(BarBuilder):
+    '''
+    Aggregates batches of tick by tick trades into bars of ``seconds``
+    seconds with the same session alignment as ``BarBuilder``.
+
+    Events are consumed as returned by ``TickByTickBuffer.popmany``, only
+    trades are taken into account. Each bar is a tuple::
+
+      (data_time, open, high, low, close, volume, buyvolume, sellvolume,
+       netvolume, trades)
+
+    where ``buyvolume``/``sellvolume`` is the volume of the trades
+    initiated by buyers/sellers and ``netvolume`` their difference.
+    '''
+
+    def update(self, events):
+        '''
+        Adds a batch of decoded tick by tick events and returns the list of
+        bars completed by it
+        '''
+        keys = self.keys(events['data_time'])
+        valid = (events['kind'] == TickByTickBuffer.TRADE) & \
+            (keys > self._lastkey)
+        if not valid.any():
+            return []
+
+        keys = keys[valid]
+        price = events['price'][valid]
+        qty = events['qty'][valid]
+        side = events['side'][valid]
+
+        if self._cur is not None:  # late trades go into the current bar
+            keys[0] = max(keys[0], self._cur[0])
+        keys = np.maximum.accumulate(keys)
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)] - 1
+
+        columns = [
+            keys[starts].tolist(),
+            price[starts].tolist(),
+            np.maximum.reduceat(price, starts).tolist(),
+            np.minimum.reduceat(price, starts).tolist(),
+            price[ends].tolist(),
+            np.add.reduceat(qty, starts).tolist(),
+            np.add.reduceat(np.where(side > 0, qty, 0), starts).tolist(),
+            np.add.reduceat(np.where(side < 0, qty, 0), starts).tolist(),
+            np.diff(np.r_[starts, len(keys)]).tolist(),
+        ]
+        rows = list(zip(*columns))
+
+        done = []
+        cur = self._cur
+        if cur is not None:
+            if cur[0] == rows[0][0]:
+                first = rows[0]
+                rows[0] = (cur[0], cur[1], max(cur[2], first[2]),
+                           min(cur[3], first[3]), first[4]) + \
+                    tuple(a + b for a, b in zip(cur[5:], first[5:]))
+            else:
+                done.append(tuple(cur))
+
+        done.extend(rows[:-1])
+        self._cur = list(rows[-1])
+        return [self._makebar(row) for row in done]
+
+    def _makebar(self, row):
+        key, o, h, l, c, volume, buys, sells, trades = row
+        self._lastkey = key
+        return (self._stamp(key), o, h, l, c, volume, buys, sells,
+                buys - sells, trades)
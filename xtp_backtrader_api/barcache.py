@@ -0,0 +1,110 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+import numpy as np
+
+import backtrader as bt
+
+
+# One bar, stamped with its right edge as an XTP data_time
+BAR_DTYPE = np.dtype([
+    ('data_time', np.int64),
+    ('open', np.float64),
+    ('high', np.float64),
+    ('low', np.float64),
+    ('close', np.float64),
+    ('volume', np.float64),
+    ('openinterest', np.float64),
+])
+
+
+class BarCache(object):
+    '''
+    Bars kept on disk in fixed width binary files of ``BAR_DTYPE`` records,
+    one per symbol, timeframe and compression
+    (``<path>/<code>.<Timeframe>.<compression>.bars``), in time order.
+
+    Files are read back as numpy memmaps, so loading years of minute bars
+    costs a ``mmap`` and the columns can be handed to numpy (or the line
+    buffers of a data) as they are. Being sorted by ``data_time`` a file is
+    its own date index: ``read`` finds a range of dates with a binary
+    search and ``tail`` the last bars without touching the rest. 56 bytes
+    per bar, a year of minute bars of 500 symbols takes 1.6 GB.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._lasttimes = dict()  # filename -> data_time of the last bar
+
+    def filename(self, code, timeframe, compression):
+        return os.path.join(self.path, '%s.%s.%d.bars' % (
+            code, bt.TimeFrame.getname(timeframe, 2), compression))
+
+    def append(self, code, timeframe, compression, bars):
+        '''
+        Appends ``bars`` (an array of ``BAR_DTYPE`` or a sequence of
+        ``(data_time, open, high, low, close, volume, openinterest)``
+        tuples) in time order. Bars not later than the last one stored are
+        left out, so that the bars of a restarted session can be appended
+        again. Returns how many were appended
+        '''
+        bars = np.asarray(bars, dtype=BAR_DTYPE) \
+            if isinstance(bars, np.ndarray) else \
+            np.array([tuple(bar[:7]) for bar in bars], dtype=BAR_DTYPE)
+        name = self.filename(code, timeframe, compression)
+        last = self._lasttime(name)
+        if len(bars) and bars['data_time'][0] <= last:
+            bars = bars[bars['data_time'] > last]
+        if not len(bars):
+            return 0
+
+        with open(name, 'ab') as f:
+            f.write(np.ascontiguousarray(bars).data)
+        self._lasttimes[name] = int(bars['data_time'][-1])
+        return len(bars)
+
+    def _lasttime(self, name):
+        last = self._lasttimes.get(name)
+        if last is None:
+            bars = self._open(name)
+            last = int(bars['data_time'][-1]) if len(bars) else -1
+            self._lasttimes[name] = last
+        return last
+
+    def _open(self, name):
+        count = os.path.getsize(name) // BAR_DTYPE.itemsize \
+            if os.path.exists(name) else 0
+        if not count:
+            return np.zeros(0, dtype=BAR_DTYPE)
+        return np.memmap(name, dtype=BAR_DTYPE, mode='r', shape=(count,))
+
+    def read(self, code, timeframe, compression, start=None, end=None):
+        '''
+        Returns the stored bars with ``start <= data_time <= end`` (XTP
+        ``data_time`` integers, ``None`` for no limit) as a read only
+        memmap of ``BAR_DTYPE``
+        '''
+        bars = self._open(self.filename(code, timeframe, compression))
+        times = bars['data_time']
+        lo = 0 if start is None else np.searchsorted(times, start, 'left')
+        hi = len(bars) if end is None else \
+            np.searchsorted(times, end, 'right')
+        return bars[lo:hi]
+
+    def tail(self, code, timeframe, compression, count, end=None):
+        '''
+        Returns the last ``count`` stored bars with ``data_time <= end``
+        (``None`` for no limit)
+        '''
+        bars = self.read(code, timeframe, compression, end=end)
+        return bars[max(len(bars) - count, 0):]
+
+    def days(self, code, timeframe, compression):
+        '''Returns the days (YYYYMMDD) with stored bars'''
+        bars = self.read(code, timeframe, compression)
+        return np.unique(bars['data_time'] // 1000000000)
@@ -0,0 +1,65 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+
+import numpy as np
+
+
+class Basket(object):
+    '''
+    Handle on the orders of one ``XTPBroker.submit_basket`` call.
+
+    Legs are kept in aligned numpy arrays: ``codes``, signed ``sizes`` (to
+    buy if positive), ``filled`` (signed, as executed so far), ``value``
+    (executed value) and ``ended`` (the order can fill no further). ``refs``
+    holds the order ref of each leg and ``orders`` the backtrader orders,
+    notified to their owner as usual. The broker moves the arrays as the
+    fills and the cancellations come in, in its ``next``.
+    '''
+
+    def __init__(self, orders, codes, sizes):
+        self.orders = orders
+        self.refs = [order.ref for order in orders]
+        self.codes = codes
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self.filled = np.zeros(len(orders))
+        self.value = np.zeros(len(orders))
+        self.ended = np.zeros(len(orders), dtype=bool)
+        self.legs = dict((ref, leg) for leg, ref in enumerate(self.refs))
+
+    def __len__(self):
+        return len(self.refs)
+
+    def _fill(self, leg, size, price):
+        self.filled[leg] += size
+        self.value[leg] += size * price
+        if self.filled[leg] == self.sizes[leg]:
+            self.ended[leg] = True
+
+    def _end(self, leg):
+        self.ended[leg] = True
+
+    @property
+    def done(self):
+        '''All legs filled, cancelled or rejected'''
+        return bool(self.ended.all())
+
+    def progress(self):
+        '''Returns the fraction of the shares of the basket executed'''
+        total = np.abs(self.sizes).sum()
+        return float(np.abs(self.filled).sum() / total) if total else 1.0
+
+    def remaining(self):
+        '''Returns the signed shares of each leg still to execute'''
+        return np.where(self.ended, 0.0, self.sizes - self.filled)
+
+    def summary(self):
+        return collections.OrderedDict([
+            ('legs', len(self)),
+            ('done', int(self.ended.sum())),
+            ('filled', int((self.filled == self.sizes).sum())),
+            ('progress', self.progress()),
+            ('bought', float(self.value[self.value > 0].sum())),
+            ('sold', float(-self.value[self.value < 0].sum())),
+        ])
@@ -0,0 +1,123 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import asyncio
+import collections
+import threading
+
+
+# Ticks (or tick by tick messages) for ``ticker`` (bytes) are in its ring
+DataEvent = collections.namedtuple('DataEvent', ['ticker'])
+# An ``OrderGateway`` event: ``kind`` (ACCEPTED, FILL, ...), order ref and
+# the rest of the event tuple
+OrderEvent = collections.namedtuple('OrderEvent', ['kind', 'oref', 'args'])
+# A store notification
+StoreEvent = collections.namedtuple('StoreEvent', ['msg', 'args', 'kwargs'])
+
+
+class Wakeup(object):
+    '''
+    Wakes the cerebro thread when there is something for it.
+
+    The api callbacks (ticks, order events) and the store ``signal`` it
+    right after handing data over, the datas ``wait`` on it when they have
+    nothing to deliver. Signalling when already signalled is a flag read,
+    so a burst of ticks costs a single ``threading.Event.set``. A wait
+    returns right away if anything was signalled since the previous one,
+    no signal is lost between a data finding its ring empty and waiting.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.wakeups = 0  # waits ended by a signal
+
+    def signal(self):
+        '''Any thread'''
+        if not self._event.is_set():
+            self._event.set()
+
+    def wait(self, timeout):
+        '''
+        Blocks until signalled or for ``timeout`` seconds. Returns ``True``
+        if signalled
+        '''
+        event = self._event
+        woken = event.is_set() or event.wait(timeout)
+        if woken:
+            event.clear()
+            self.wakeups += 1
+        return woken
+
+
+class EventHub(object):
+    '''
+    Hands the events of the XTP api threads to an asyncio event loop.
+
+    The callbacks ``post`` typed events (``DataEvent``, ``OrderEvent``,
+    ``StoreEvent``), which are scheduled on ``loop`` with
+    ``call_soon_threadsafe`` and put into an ``asyncio.Queue`` per event
+    type. Coroutines ``await hub.get(DataEvent)`` and so on. A queue exists
+    from the first time its type is asked for, events nobody asked for are
+    not kept.
+
+    ``postdata`` coalesces ticks: a ``DataEvent`` means the ring of the
+    ticker has ticks, whatever their number, and no new one is scheduled
+    for a ticker until the pending one has been delivered. A consumer
+    draining the ring after receiving the event sees every tick pushed
+    before it.
+
+    Without ``loop`` a new one is run in a daemon thread until ``close``.
+    '''
+
+    def __init__(self, loop=None):
+        self.thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=loop.run_forever)
+            self.thread.daemon = True
+            self.thread.start()
+
+        self.loop = loop
+        self.delivered = 0  # events delivered to the loop so far
+        self._queues = dict()  # event type -> asyncio.Queue, loop side only
+        self._pending = set()  # tickers with a DataEvent scheduled
+
+    def queue(self, kind):
+        '''Returns the queue of events of type ``kind``. Loop thread only'''
+        q = self._queues.get(kind)
+        if q is None:
+            q = self._queues[kind] = asyncio.Queue()
+        return q
+
+    async def get(self, kind):
+        '''Waits for the next event of type ``kind``'''
+        return await self.queue(kind).get()
+
+    def post(self, event):
+        '''Schedules ``event`` for delivery. Any thread'''
+        self.loop.call_soon_threadsafe(self._deliver, event)
+
+    def postdata(self, ticker):
+        '''Signals ticks for ``ticker`` (key of its ring). Any thread'''
+        if ticker not in self._pending:
+            self._pending.add(ticker)
+            self.loop.call_soon_threadsafe(self._deliverdata, ticker)
+
+    def close(self):
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+            self.loop.close()
+
+    def _deliverdata(self, ticker):
+        # pending is cleared first: a tick pushed from here on schedules a
+        # new event, any earlier one is in the ring already
+        self._pending.discard(ticker)
+        self._deliver(DataEvent(ticker))
+
+    def _deliver(self, event):
+        self.delivered += 1
+        q = self._queues.get(type(event))
+        if q is not None:
+            q.put_nowait(event)
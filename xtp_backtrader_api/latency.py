@@ -0,0 +1,274 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import time
+from datetime import datetime
+
+import backtrader as bt
+
+try:
+    _perf_counter_ns = time.perf_counter_ns
+    _time_ns = time.time_ns
+except AttributeError:  # Python < 3.7
+    def _perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+
+    def _time_ns():
+        return int(time.time() * 1e9)
+
+
+class LatencyHistogram(object):
+    '''
+    Log-linear (HDR style) histogram of nanosecond durations with a fixed,
+    preallocated set of buckets: values below ``2 ** subbits`` have their
+    own bucket, above that each power of two is split in ``2 ** (subbits -
+    1)`` buckets, so every value is kept within ``2 ** (1 - subbits)`` of
+    its magnitude (3% with the default 6 bits) up to ``2 ** maxbits`` ns.
+
+    ``record`` is a ``bit_length``, a shift and a list increment, cheap
+    enough for the callbacks of the XTP api. Larger values are counted in
+    the last bucket.
+    '''
+
+    def __init__(self, subbits=6, maxbits=40):
+        self.subbits = subbits
+        self.half = 1 << (subbits - 1)
+        self.counts = [0] * ((maxbits - subbits + 2) * self.half)
+        self.total = 0
+        self.max = 0
+        self._last = len(self.counts) - 1
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self.subbits
+        if shift > 0:
+            idx = shift * self.half + (value >> shift)
+            if idx > self._last:
+                idx = self._last
+        else:
+            idx = value
+        self.counts[idx] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def bucketlimit(self, idx):
+        '''Returns the highest value counted in bucket ``idx``'''
+        if idx < 2 * self.half:
+            return idx
+        shift, mantissa = divmod(idx, self.half)
+        shift -= 1
+        mantissa += self.half
+        return ((mantissa + 1) << shift) - 1
+
+    def percentile(self, pct, count=None):
+        '''Returns the upper bound of the ``pct`` percentile (0-100)'''
+        count = self.count if count is None else count
+        if not count:
+            return 0
+        rank = max(1, int(round(count * pct / 100.0)))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bucketlimit(idx), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = self.max = 0
+
+    def snapshot(self):
+        '''Returns count, mean, max and the usual percentiles, in ns'''
+        count = self.count
+        return collections.OrderedDict([
+            ('count', count),
+            ('mean', self.total // count if count else 0),
+            ('p50', self.percentile(50, count)),
+            ('p90', self.percentile(90, count)),
+            ('p99', self.percentile(99, count)),
+            ('p999', self.percentile(99.9, count)),
+            ('max', self.max),
+        ])
+
+    def cumulative(self):
+        '''
+        Returns ``(upper bound, cumulative count)`` pairs at every power of
+        two ns, for exposition formats with coarse buckets
+        '''
+        pairs, seen = [], 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if idx >= 2 * self.half - 1 and (idx + 1) % self.half == 0:
+                pairs.append((self.bucketlimit(idx) + 1, seen))
+        return pairs
+
+
+class LatencyMonitor(object):
+    '''
+    Timestamps along the quote -> data -> strategy -> order -> fill path,
+    as durations between consecutive steps in one ``LatencyHistogram`` per
+    stage (``STAGES``):
+
+      - ``exchange``: ``data_time`` of a tick to ``OnDepthMarketData``
+        (wall clock, meaningful only with the host synchronized to the
+        exchange and not when replaying)
+      - ``dispatch``: ``OnDepthMarketData`` to the data loading the tick
+        (or the bar it completed)
+      - ``next``: data load to the end of the strategy's ``next``
+        (recorded by ``LatencyAnalyzer``)
+      - ``decide``: data load to ``XTPBroker.buy``/``sell``
+      - ``insert``: ``buy``/``sell`` to ``InsertOrder`` returning
+      - ``trigger``: ``OnDepthMarketData`` of a tick to ``InsertOrder``
+        returning for an order held by the broker which the tick triggered
+        (stops, bracket children)
+      - ``ack``: ``InsertOrder`` return to the order being queued
+        (``OnOrderEvent``)
+      - ``fill``: ``InsertOrder`` return to each ``OnTradeEvent``
+
+    The store creates it with ``latency=True``, every hook then checks for
+    ``None`` only when it is off. ``snapshot`` and ``prometheus`` export
+    the histograms.
+    '''
+
+    STAGES = ('exchange', 'dispatch', 'next', 'decide', 'insert', 'trigger',
+              'ack', 'fill')
+
+    def __init__(self, clock=_perf_counter_ns):
+        self.now = clock
+        self.histograms = collections.OrderedDict(
+            (stage, LatencyHistogram()) for stage in self.STAGES)
+        self._h = self.histograms
+        self.loaded = 0  # time of the last tick or bar loaded by a data
+        self._pushed = dict()  # ticker -> time of its last tick
+        self._orders = dict()  # order ref -> time of buy/sell
+        self._triggers = dict()  # order ref -> time of the triggering tick
+        self._inserts = dict()  # order ref -> time InsertOrder returned
+        self._minute = (None, 0)  # last YYYYMMDDHHMM and clock at its start
+        self._offset = _time_ns() - clock()  # clock -> epoch ns
+
+    def record(self, stage, value):
+        self._h[stage].record(value)
+
+    # quote thread
+    def tick(self, ticker, data_time):
+        now = self.now()
+        self._pushed[ticker] = now
+        minute, ms = divmod(data_time, 100000)
+        last, base = self._minute
+        if minute != last:  # ticks come in time order, one minute at a time
+            base = self._minuteclock(minute)
+            self._minute = (minute, base)
+        self._h['exchange'].record(now - base - ms * 1000000)
+
+    def triggered(self, oref, ticker):
+        pushed = self._pushed.get(ticker)
+        self._triggers[oref] = pushed if pushed is not None else self.now()
+
+    def _minuteclock(self, minute):
+        # YYYYMMDDHHMM (local time) on the monitor clock
+        day, hhmm = divmod(minute, 10000)
+        epoch = time.mktime(datetime(
+            day // 10000, day // 100 % 100, day % 100,
+            hhmm // 100, hhmm % 100).timetuple())
+        return int(epoch) * 1000000000 - self._offset
+
+    # cerebro thread
+    def consumed(self, ticker):
+        now = self.loaded = self.now()
+        pushed = self._pushed.get(ticker)
+        if pushed is not None:
+            self._h['dispatch'].record(now - pushed)
+
+    def decided(self):
+        if self.loaded:
+            self._h['next'].record(self.now() - self.loaded)
+
+    def ordered(self, oref, entry):
+        self._orders[oref] = entry
+        if self.loaded:
+            self._h['decide'].record(entry - self.loaded)
+
+    # order gateway thread
+    def inserted(self, oref):
+        now = self.now()
+        entry = self._orders.pop(oref, None)
+        if entry is not None:
+            self._inserts[oref] = now
+            self._h['insert'].record(now - entry)
+        elif self._triggers:
+            entry = self._triggers.pop(oref, None)
+            if entry is not None:
+                self._inserts[oref] = now
+                self._h['trigger'].record(now - entry)
+
+    # trader api thread
+    def acked(self, oref):
+        inserted = self._inserts.get(oref)
+        if inserted is not None:
+            self._h['ack'].record(self.now() - inserted)
+
+    def filled(self, oref):
+        inserted = self._inserts.get(oref)
+        if inserted is not None:
+            self._h['fill'].record(self.now() - inserted)
+
+    def done(self, oref):
+        self._orders.pop(oref, None)
+        self._triggers.pop(oref, None)
+        self._inserts.pop(oref, None)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self._pushed.clear()
+        self._minute = (None, 0)
+
+    def snapshot(self):
+        '''Returns the ``snapshot`` of every stage histogram, in ns'''
+        return collections.OrderedDict(
+            (stage, h.snapshot()) for stage, h in self.histograms.items())
+
+    def prometheus(self, name='xtp_latency_seconds'):
+        '''Returns the histograms in the Prometheus text format'''
+        lines = ['# HELP %s XTP pipeline latency by stage' % name,
+                 '# TYPE %s histogram' % name]
+        for stage, h in self.histograms.items():
+            for limit, seen in h.cumulative():
+                lines.append('%s_bucket{stage="%s",le="%.9g"} %d' % (
+                    name, stage, limit / 1e9, seen))
+            lines.append('%s_bucket{stage="%s",le="+Inf"} %d' % (
+                name, stage, h.count))
+            lines.append('%s_sum{stage="%s"} %.9f' % (name, stage,
+                                                      h.total / 1e9))
+            lines.append('%s_count{stage="%s"} %d' % (name, stage, h.count))
+        return '\n'.join(lines) + '\n'
+
+
+class LatencyAnalyzer(bt.Analyzer):
+    '''
+    Records the ``next`` stage of the store's ``LatencyMonitor``: analyzers
+    run right after the strategy's ``next``. ``get_analysis`` returns the
+    monitor snapshot
+    '''
+
+    def start(self):
+        self.monitor = None
+        for data in self.strategy.datas:
+            store = getattr(data, 'o', None)
+            self.monitor = getattr(store, 'latency', None)
+            if self.monitor is not None:
+                break
+
+    def next(self):
+        if self.monitor is not None:
+            self.monitor.decided()
+
+    def get_analysis(self):
+        return self.monitor.snapshot() if self.monitor is not None else {}
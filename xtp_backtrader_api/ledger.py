@@ -0,0 +1,407 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from backtrader.position import Position
+
+import xtpwrapper.xtp_enum as XTPEnum
+
+
+# Account state reported by the trade server. ``positions`` maps symbol keys
+# (``xtpstore.symbol_key``) to ``(size, price, sellable)`` (``None`` for an
+# asset only query), ``sellable`` being the shares that can be sold today,
+# and ``fills`` is the number of fills the gateway had routed when the
+# answers came in
+Snapshot = collections.namedtuple('Snapshot', 'positions cash fills')
+
+# exchange of the quotes of a position, from its market
+_EXCHANGES = {
+    XTPEnum.XTP_MARKET_TYPE.XTP_MKT_SH_A:
+        int(XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH),
+    XTPEnum.XTP_MARKET_TYPE.XTP_MKT_SZ_A:
+        int(XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ),
+}
+
+
+class PositionView(object):
+    '''
+    Read-only looking view over a ledger ``Position``. Attribute reads go
+    to the live position, so a view handed out once stays current without
+    copying anything.
+
+    The first mutation (attribute assignment, ``update``, ``set`` or
+    ``fix``) clones the position and detaches the view from the ledger:
+    the caller keeps working on its private copy and the view is dropped
+    from ``cache`` so that later readers get a fresh one.
+    '''
+
+    __slots__ = ('_pos', '_cache', '_key')
+
+    def __init__(self, pos, cache=None, key=None):
+        object.__setattr__(self, '_pos', pos)
+        object.__setattr__(self, '_cache', cache)
+        object.__setattr__(self, '_key', key)
+
+    @property
+    def size(self):
+        return self._pos.size
+
+    @property
+    def price(self):
+        return self._pos.price
+
+    def __getattr__(self, name):
+        return getattr(self._pos, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._own(), name, value)
+
+    def __len__(self):
+        return abs(self._pos.size)
+
+    def __bool__(self):
+        return bool(self._pos.size != 0)
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        return str(self._pos)
+
+    def _own(self):
+        cache = self._cache
+        if cache is not None:  # first write, clone and detach
+            if cache.get(self._key) is self:
+                del cache[self._key]
+            object.__setattr__(self, '_cache', None)
+            object.__setattr__(self, '_pos', self._pos.clone())
+        return self._pos
+
+    def clone(self):
+        return self._pos.clone()
+
+    def pseudoupdate(self, size, price):
+        return self._pos.pseudoupdate(size, price)
+
+    def update(self, size, price, dt=None):
+        return self._own().update(size, price, dt)
+
+    def set(self, size, price):
+        return self._own().set(size, price)
+
+    def fix(self, size, price):
+        return self._own().fix(size, price)
+
+
+class Ledger(object):
+    '''
+    Positions and cash of the account, kept up to date by applying every
+    fill as it is reported instead of querying the trade server.
+
+    Positions are ``backtrader`` ``Position`` instances keyed like the
+    store's tick rings (``xtpstore.symbol_key``: exchange and code bytes),
+    the broker hands them out for its datas. Cash moves by the value of
+    each fill, fees are only picked up when reconciling.
+
+    ``drift`` is set when a fill leaves the ledger in a state the account
+    cannot be in (a short stock position), which calls for an early
+    reconciliation. ``sellable`` keeps the shares of each position the
+    account could sell that day (T+1) when the positions were last
+    reconciled.
+
+    For valuation every code also gets a slot in three aligned numpy
+    arrays: ``sizes``, ``costs`` (average price) and ``prices`` (last
+    traded price). The tick ring of the code, looked up in ``rings`` under
+    the same key, writes its last price straight into ``prices`` so that
+    valuing any set of positions is a dot product.
+    '''
+
+    def __init__(self, cash=0.0, tolerance=1.0, rings=None, capacity=256):
+        self.positions = dict()
+        self.cash = cash
+        self.tolerance = tolerance  # cash difference ignored on reconcile
+        self.fills = 0  # fills applied so far
+        self.drift = False
+        self.sellable = dict()  # key -> sellable shares at the last reconcile
+
+        self.rings = rings if rings is not None else dict()
+        self.slots = dict()  # key -> index in the arrays
+        self.sizes = np.zeros(capacity)
+        self.costs = np.zeros(capacity)
+        self.prices = np.zeros(capacity)
+        self._bound = dict()  # slot -> ring writing into prices
+        self._unbound = dict()  # slot -> key of a code without a ring yet
+        self._nrings = -1  # size of rings at the last binding attempt
+
+    def position(self, code):
+        pos = self.positions.get(code)
+        if pos is None:
+            pos = self.positions[code] = Position()
+            self._addslot(code)
+        return pos
+
+    def slot(self, code):
+        '''Returns the index of ``code`` in the valuation arrays'''
+        slot = self.slots.get(code)
+        if slot is None:
+            self.position(code)
+            slot = self.slots[code]
+        return slot
+
+    def _addslot(self, code):
+        slot = self.slots[code] = len(self.slots)
+        if slot == len(self.sizes):
+            n = 2 * slot
+            self.sizes = np.resize(self.sizes, n)
+            self.costs = np.resize(self.costs, n)
+            self.prices = np.resize(self.prices, n)
+            for bslot, ring in self._bound.items():  # rebind new array
+                ring.board = (self.prices, bslot)
+
+        self.sizes[slot] = self.costs[slot] = self.prices[slot] = 0.0
+        self._unbound[slot] = code
+        self._nrings = -1
+
+    def _bindrings(self):
+        self._nrings = len(self.rings)
+        for slot, key in list(self._unbound.items()):
+            ring = self.rings.get(key)
+            if ring is not None:
+                del self._unbound[slot]
+                self._bound[slot] = ring
+                self.prices[slot] = ring.last() or 0.0
+                ring.board = (self.prices, slot)
+
+    def _setslot(self, code, pos):
+        slot = self.slots[code]
+        self.sizes[slot] = pos.size
+        self.costs[slot] = pos.price
+
+    def marketvalue(self, index=None):
+        '''
+        Returns the value of the positions at the ``index`` slots (all if
+        ``None``) priced at the last traded price, or at cost for codes
+        without ticks
+        '''
+        if self._unbound and self._nrings != len(self.rings):
+            self._bindrings()
+
+        n = len(self.slots)
+        prices, costs, sizes = self.prices, self.costs, self.sizes
+        if index is None:
+            prices, costs, sizes = prices[:n], costs[:n], sizes[:n]
+        else:
+            prices, costs, sizes = prices[index], costs[index], sizes[index]
+
+        return float(np.dot(sizes, np.where(prices > 0.0, prices, costs)))
+
+    def fill(self, code, size, price):
+        '''
+        Applies a fill of ``size`` (negative to sell) at ``price``. Returns
+        ``(size, price, opened, closed)`` like ``Position.update``
+        '''
+        self.fills += 1
+        self.cash -= size * price
+        pos = self.position(code)
+        ret = pos.update(size, price)
+        self._setslot(code, pos)
+        if pos.size < 0:
+            self.drift = True
+        return ret
+
+    def reconcile(self, snapshot, positions=True):
+        '''
+        Adopts the state in ``snapshot`` and returns the discrepancies found
+        as a list of ``(code, local, broker)`` tuples (``cash`` as code for
+        the cash). Returns ``None`` without changing anything if fills have
+        been applied since the snapshot was taken.
+
+        With ``positions`` set to ``False`` only the cash is reconciled
+        '''
+        if snapshot.fills != self.fills:
+            return None
+
+        diffs = []
+        if positions and snapshot.positions is not None:
+            self.sellable = dict((code, sellable) for code, (_, _, sellable)
+                                 in snapshot.positions.items())
+            for code in set(self.positions).union(snapshot.positions):
+                size, price, _ = snapshot.positions.get(code, (0, 0.0, 0))
+                pos = self.position(code)
+                if pos.size != size:
+                    diffs.append((code, pos.size, size))
+                pos.set(size, price)
+                self._setslot(code, pos)
+
+        if abs(self.cash - snapshot.cash) > self.tolerance:
+            diffs.append(('cash', self.cash, snapshot.cash))
+        self.cash = snapshot.cash
+
+        self.drift = False
+        return diffs
+
+
+class AccountPoller(object):
+    '''
+    Queries positions and assets from the trade server every ``interval``
+    seconds (or on ``request``), and the assets alone every
+    ``assetinterval`` seconds, and turns the answers into ``Snapshot``
+    instances appended to ``snapshots``.
+
+    Answers arrive on the trader api thread through ``on_position`` and
+    ``on_asset``. Only one query is in flight at any time, and none is sent
+    while ``limiter`` (a ``RateLimiter``) has no query tokens left.
+    '''
+
+    def __init__(self, trader, session_id, gateway=None, interval=60.0,
+                 assetinterval=0.0, notify=None, limiter=None):
+        self.trader = trader
+        self.session_id = session_id
+        self.gateway = gateway
+        self.interval = interval
+        self.assetinterval = assetinterval
+        self.notify = notify
+        self.limiter = limiter
+
+        self.snapshots = collections.deque()
+        self._reqids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = None  # [reqid, positions, cash, done, fills]
+        self._ready = threading.Event()  # set when a query completes
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval or self.assetinterval:
+            self._thread = threading.Thread(target=self._t_poll)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _t_poll(self):
+        now = time.time()
+        nextfull = now + self.interval if self.interval else None
+        nextasset = now + self.assetinterval if self.assetinterval else None
+        while True:
+            due = min(t for t in (nextfull, nextasset) if t is not None)
+            if self._stop.wait(max(0.0, due - time.time())):
+                break
+
+            now = time.time()
+            if nextfull is not None and now >= nextfull:
+                self.request()
+                nextfull = now + self.interval
+                if nextasset is not None:  # assets came with it
+                    nextasset = now + self.assetinterval
+            elif nextasset is not None and now >= nextasset:
+                self.request(positions=False)
+                nextasset = now + self.assetinterval
+
+    def _fills(self):
+        return self.gateway.fills if self.gateway is not None else 0
+
+    def request(self, positions=True):
+        '''
+        Sends a position (unless ``positions`` is ``False``) and an asset
+        query unless one is already pending or the rate limit is reached.
+        Returns ``True`` if the queries were sent
+        '''
+        with self._lock:
+            if self._pending is not None:
+                return False
+            if self.limiter is not None and \
+                    not self.limiter.take(count=2 if positions else 1):
+                return False
+            reqid = next(self._reqids)
+            self._pending = [reqid, dict() if positions else None, None,
+                             not positions, set()]
+
+        if self.trader.QueryAsset(self.session_id, reqid) or (
+                positions and
+                self.trader.QueryPosition('', self.session_id, reqid)):
+            with self._lock:
+                self._pending = None
+            if self.notify is not None:
+                self.notify('Account query failed',
+                            self.trader.GetApiLastError())
+            return False
+
+        return True
+
+    def wait(self, timeout=None):
+        '''
+        Requests a snapshot and waits up to ``timeout`` seconds for it.
+        Returns it or ``None``
+        '''
+        self._ready.clear()
+        self.request()
+        if not self._ready.wait(timeout) or not self.snapshots:
+            return None
+        return self.snapshots.pop()
+
+    def drain(self):
+        '''Returns the snapshots received so far'''
+        snapshots = self.snapshots
+        return [snapshots.popleft() for _ in range(len(snapshots))]
+
+    def _get(self, request_id):
+        pending = self._pending
+        if pending is None or pending[0] != request_id:
+            return None
+        return pending
+
+    # Callbacks from the trader api thread
+    def on_position(self, position, error_info, request_id, is_last):
+        pending = self._get(request_id)
+        if pending is None or pending[1] is None:
+            return
+
+        # an empty account is reported as an error with no position
+        if position is not None and not (error_info and error_info.error_id):
+            key = (_EXCHANGES.get(position.market, 0), position.ticker)
+            pending[1][key] = (position.total_qty, position.avg_price,
+                               position.sellable_qty)
+
+        if is_last:
+            pending[3] = True
+            pending[4].add(self._fills())
+            self._complete(pending)
+
+    def on_asset(self, asset, error_info, request_id, is_last):
+        pending = self._get(request_id)
+        if pending is None:
+            return
+
+        if error_info and error_info.error_id:
+            pending[2] = False
+        else:
+            # cash withheld for pending orders has not been spent yet
+            pending[2] = asset.buying_power + asset.withholding_amount
+        pending[4].add(self._fills())
+        self._complete(pending)
+
+    def _complete(self, pending):
+        if not pending[3] or pending[2] is None:
+            return
+
+        with self._lock:
+            self._pending = None
+
+        if pending[2] is False:
+            if self.notify is not None:
+                self.notify('Account query failed', 'QueryAsset')
+        elif len(pending[4]) == 1:  # no fill in between the two answers
+            self.snapshots.append(Snapshot(pending[1], pending[2],
+                                           pending[4].pop()))
+
+        self._ready.set()
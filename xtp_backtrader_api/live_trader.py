@@ -1,5 +1,6 @@
 import backtrader as bt
 from xtpwrapper import * 
+import xtpwrapper.xtp_enum as XTPEnum
 import time
 
 
@@ -30,6 +31,49 @@ class LiveTrader(TraderApi):
         self.m_iquest_id: int = 0
         self.save_to_file_: str = ""
 
+        self.gateway = None  # OrderGateway receiving order/trade events
+        self.poller = None  # AccountPoller receiving position/asset answers
+
+    def connect(self, userid, password, client_id, server_ip, server_port,
+                software_key, protocol=1, save_file_path='trader'):
+        """
+        创建并登录交易接口
+
+        :return: session_id，登录失败时为0
+        """
+        self.userid = userid
+        self.password = password
+        self.client_id = client_id
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.protocol = protocol
+
+        self.CreateTrader(client_id, save_file_path,
+                          XTPEnum.XTP_LOG_LEVEL.XTP_LOG_LEVEL_INFO)
+        self.SubscribePublicTopic(XTPEnum.XTP_TE_RESUME_TYPE.XTP_TERT_QUICK)
+        self.SetSoftwareVersion("1.1.1")
+        self.SetSoftwareKey(software_key)
+        self.SetHeartBeatInterval(10)
+
+        self.session_id = self.Login(server_ip, server_port, userid,
+                                     password, protocol) or 0
+        self.connect_status = self.login_status = bool(self.session_id)
+        return self.session_id
+
+    def insert_order(self, order, session_id):
+        """
+        报单录入，返回order_xtp_id，为0表示报单发送失败
+        """
+        self.insert_order_num += 1
+        return self.InsertOrder(order, session_id)
+
+    def cancel_order(self, order_xtp_id, session_id):
+        """
+        撤单，返回order_cancel_xtp_id，为0表示撤单发送失败
+        """
+        self.cancel_order_num += 1
+        return self.CancelOrder(order_xtp_id, session_id)
+
     
     def OnDisconnected(self, session_id, reason):
         """
@@ -71,7 +115,9 @@ class LiveTrader(TraderApi):
         :param session_id: 
         :return: 
         """
-        pass
+        self.order_num += 1
+        if self.gateway is not None:
+            self.gateway.on_order(order_info, error_info)
 
     def OnTradeEvent(self, trade_info, session_id):
         """
@@ -86,7 +132,9 @@ class LiveTrader(TraderApi):
         :param session_id: 
         :return: 
         """
-        pass
+        self.trade_num += 1
+        if self.gateway is not None:
+            self.gateway.on_trade(trade_info)
 
     def OnCancelOrderError(self, cancel_info, error_info, session_id):
         """
@@ -142,11 +190,10 @@ class LiveTrader(TraderApi):
         :param session_id: 
         :return: 
         """
-        pass
+        if self.poller is not None:
+            self.poller.on_position(position, error_info, request_id, is_last)
 
     def OnQueryAsset(self, asset, error_info, request_id, is_last, session_id):
-        print(asset)
-
         """
         请求查询资金账户响应，需要快速返回，否则会堵塞后续消息，当堵塞严重时，会触发断线
 
@@ -157,7 +204,8 @@ class LiveTrader(TraderApi):
         :param session_id: 
         :return: 
         """
-        pass
+        if self.poller is not None:
+            self.poller.on_asset(asset, error_info, request_id, is_last)
 
     def OnQueryStructuredFund(self, fund_info, error_info, request_id, is_last, session_id):
         """
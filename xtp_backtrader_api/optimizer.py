@@ -0,0 +1,216 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import itertools
+import multiprocessing
+import time
+
+import numpy as np
+
+import backtrader as bt
+from backtrader.feed import DataBase
+
+from xtp_backtrader_api.barcache import BAR_DTYPE
+from xtp_backtrader_api.xtpdata import barcolumns, preloadcolumns
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8, the package imports without the sweep
+    shared_memory = None
+
+
+SweepResult = collections.namedtuple('SweepResult',
+                                     ['params', 'value', 'analyzers'])
+
+
+def _shared_memory():
+    if shared_memory is None:
+        raise RuntimeError('SharedBars and ParameterSweep need Python 3.8 '
+                           'or later (multiprocessing.shared_memory)')
+    return shared_memory
+
+
+class SharedBars(object):
+    '''
+    Bars (``BAR_DTYPE`` records) of several symbols in one shared memory
+    block. ``layout`` holds the symbol, first record and count of each, so
+    that other processes can ``attach`` by ``name`` and get numpy views of
+    the same memory instead of a pickled copy.
+    '''
+
+    def __init__(self, shm, layout, owner=False):
+        self.shm = shm
+        self.name = shm.name
+        self.layout = layout
+        self._owner = owner
+        records = np.ndarray((sum(n for _, _, n in layout),),
+                             dtype=BAR_DTYPE, buffer=shm.buf)
+        self._bars = collections.OrderedDict(
+            (code, records[start:start + count])
+            for code, start, count in layout)
+
+    @classmethod
+    def create(cls, bars):
+        '''Copies ``bars`` (symbol -> ``BAR_DTYPE`` array) to a new block'''
+        layout, start = [], 0
+        for code, values in bars.items():
+            layout.append((code, start, len(values)))
+            start += len(values)
+
+        shm = _shared_memory().SharedMemory(
+            create=True, size=max(start * BAR_DTYPE.itemsize, 1))
+        shared = cls(shm, layout, owner=True)
+        for code, values in bars.items():
+            shared[code][:] = values
+        return shared
+
+    @classmethod
+    def fromcache(cls, barcache, codes, timeframe, compression, start=None,
+                  end=None):
+        '''Copies the bars of ``codes`` in ``barcache`` to a new block'''
+        return cls.create(collections.OrderedDict(
+            (code, barcache.read(code, timeframe, compression, start, end))
+            for code in codes))
+
+    @classmethod
+    def attach(cls, name, layout):
+        return cls(_shared_memory().SharedMemory(name=name), layout)
+
+    def __getitem__(self, code):
+        return self._bars[code]
+
+    def __iter__(self):
+        return iter(self._bars)
+
+    def close(self):
+        '''Releases the block, freeing it if it was created here'''
+        self._bars = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+class SharedBarData(DataBase):
+    '''
+    Data feed over an array of ``BAR_DTYPE`` records (``bars``), e.g. a
+    view of ``SharedBars``. Preloaded into the line buffers at once when
+    possible, bar by bar otherwise.
+    '''
+    params = (
+        ('bars', None),
+    )
+
+    def start(self):
+        super(SharedBarData, self).start()
+        self._columns = barcolumns(self.p.bars)
+        self._idx = 0
+
+    def preload(self):
+        if preloadcolumns(self, self._columns):
+            self._idx = len(self._columns['datetime'])
+        else:
+            super(SharedBarData, self).preload()
+
+    def _load(self):
+        i = self._idx
+        if i >= len(self._columns['datetime']):
+            return False
+
+        self._idx = i + 1
+        for name, values in self._columns.items():
+            getattr(self.lines, name)[0] = values[i]
+        return True
+
+
+# State of the worker processes, set up by _t_init
+_worker = dict()
+
+
+def _t_init(name, layout, settings):
+    _worker['bars'] = SharedBars.attach(name, layout)
+    _worker['settings'] = settings
+
+
+def _t_backtest(params):
+    bars = _worker['bars']
+    s = _worker['settings']
+    cerebro = bt.Cerebro(stdstats=False, **s['cerebro'])
+    cerebro.broker.setcash(s['cash'])
+    for code in bars:
+        cerebro.adddata(SharedBarData(bars=bars[code],
+                                      timeframe=s['timeframe'],
+                                      compression=s['compression']),
+                        name=code)
+    for analyzer, kwargs in s['analyzers']:
+        cerebro.addanalyzer(analyzer, **kwargs)
+
+    cerebro.addstrategy(s['strategy'], **params)
+    strat = cerebro.run()[0]
+    return SweepResult(params, strat.broker.getvalue(),
+                       [a.get_analysis() for a in strat.analyzers])
+
+
+class ParameterSweep(object):
+    '''
+    Runs a backtest of ``strategy`` for every combination of ``grid``
+    (parameter name -> values) on a pool of ``workers`` processes (all cores
+    if ``None``), over the same ``bars``.
+
+    ``bars`` (symbol -> ``BAR_DTYPE`` array, or ``SharedBars``) is copied
+    once to shared memory, which the workers map at start: a backtest ships
+    its parameters and result only, whatever the size of the data. Each
+    symbol is added as a data named after it, in ``bars`` order.
+
+    ``run`` returns a ``SweepResult`` (parameters, final broker value and
+    the ``get_analysis`` of every analyzer in ``analyzers``, a sequence of
+    ``(class, kwargs)``) per combination in grid order. ``elapsed`` and
+    ``rate`` (backtests per minute) of the last run are kept.
+
+    Shared memory needs Python 3.8 or later, before that creating a sweep
+    raises ``RuntimeError``.
+    '''
+
+    def __init__(self, strategy, grid, bars, workers=None,
+                 timeframe=bt.TimeFrame.Minutes, compression=1,
+                 cash=1000000.0, analyzers=(), chunksize=1, **kwargs):
+        _shared_memory()  # fail here rather than in run
+        self.strategy = strategy
+        self.grid = collections.OrderedDict(grid)
+        self.bars = bars
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.settings = dict(strategy=strategy, timeframe=timeframe,
+                             compression=compression, cash=cash,
+                             analyzers=list(analyzers), cerebro=kwargs)
+        self.elapsed = 0.0
+        self.rate = 0.0
+
+    def combinations(self):
+        names = list(self.grid)
+        return [dict(zip(names, values))
+                for values in itertools.product(*self.grid.values())]
+
+    def run(self):
+        combos = self.combinations()
+        shared = self.bars
+        if not isinstance(shared, SharedBars):
+            shared = SharedBars.create(shared)
+
+        t0 = time.perf_counter()
+        try:
+            pool = multiprocessing.Pool(
+                self.workers, initializer=_t_init,
+                initargs=(shared.name, shared.layout, self.settings))
+            try:
+                results = pool.map(_t_backtest, combos, self.chunksize)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            if shared is not self.bars:
+                shared.close()
+
+        self.elapsed = time.perf_counter() - t0
+        self.rate = len(combos) / self.elapsed * 60.0
+        return results
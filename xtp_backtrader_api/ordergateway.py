@@ -0,0 +1,252 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+
+import xtpwrapper.xtp_enum as XTPEnum
+from xtpwrapper.xtp_struct.xoms_struct import XTPOrderInsertInfoStruct
+
+from xtp_backtrader_api.events import OrderEvent
+from xtp_backtrader_api.ratelimit import RateLimiter
+
+
+_STATUS = XTPEnum.XTP_ORDER_STATUS_TYPE
+_SELL = XTPEnum.XTP_SIDE_TYPE.XTP_SIDE_SELL
+
+_MARKETS = {
+    XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH:
+        XTPEnum.XTP_MARKET_TYPE.XTP_MKT_SH_A,
+    XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ:
+        XTPEnum.XTP_MARKET_TYPE.XTP_MKT_SZ_A,
+}
+
+
+class OrderGateway(object):
+    '''
+    Sends orders to the XTP trader api from a worker thread and turns the
+    order/trade callbacks into events for the broker.
+
+    ``submit``/``cancel`` only enqueue a request, so ``cerebro.next`` never
+    waits for ``InsertOrder`` to return. Backtrader order refs and XTP
+    order ids are kept in two dictionaries for O(1) lookups both ways, and
+    the ref is also passed as ``order_client_id`` so that callbacks which
+    overtake the ``InsertOrder`` return value can still be routed.
+
+    Events are appended to ``events`` (a thread-safe deque) as tuples whose
+    first element is one of ``ACCEPTED``, ``FILL``, ``CANCELLED`` or
+    ``REJECTED`` followed by the order ref. ``FILL`` also carries the signed
+    size and price of the execution, ``REJECTED`` the error message.
+    With a ``hub`` (``EventHub``) each event is also posted to it as an
+    ``OrderEvent``, and ``wakeup`` (a ``Wakeup``) is signalled.
+
+    Requests go through ``limiter`` (a ``RateLimiter``, unlimited by
+    default), which sends cancels ahead of queued orders and paces both to
+    the flow limits of the session. A cancel overtaking the insert of its
+    order withdraws the insert from the queue: the order is reported
+    ``CANCELLED`` without ever being sent.
+
+    With ``latency`` (a ``LatencyMonitor``) the return of ``InsertOrder``
+    is timed against the broker's ``buy``/``sell``, and the first
+    ``ACCEPTED`` and every ``FILL`` against that return.
+    '''
+
+    ACCEPTED, FILL, CANCELLED, REJECTED = range(4)
+
+    def __init__(self, trader, session_id, notify=None, hub=None,
+                 wakeup=None, latency=None, limiter=None):
+        self.trader = trader
+        self.session_id = session_id
+        self.notify = notify
+        self.hub = hub
+        self.wakeup = wakeup
+        self.latency = latency
+
+        self.events = collections.deque()
+        self.byref = dict()  # order ref -> xtp order id
+        self.byxtpid = dict()  # xtp order id -> order ref
+        self.inflight = dict()  # order ref -> accepted flag, until terminal
+        self.submitted = set()  # refs of every order sent in this session
+        self.fills = 0  # fills routed so far
+
+        self._queued = dict()  # order ref -> insert request not sent yet
+        self._traded = dict()  # order ref -> (traded, quantity), timed ones
+        self._requests = limiter if limiter is not None else RateLimiter()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._t_requests)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._requests.close()
+            self._thread.join()
+            self._thread = None
+            dropped = self._requests.dropped
+            if dropped and self.notify is not None:
+                self.notify('Requests dropped at stop', len(dropped))
+
+    def submit(self, oref, code, exchange, isbuy, size, price, pricetype):
+        '''Queues an order for ``InsertOrder``'''
+        self.submitmany(((oref, code, exchange, isbuy, size, price,
+                          pricetype),))
+
+    def submitmany(self, orders):
+        '''
+        Queues ``(oref, code, exchange, isbuy, size, price, pricetype)``
+        tuples at once, the worker sends them back to back
+        '''
+        requests = []
+        for order in orders:
+            oref = order[0]
+            self.inflight[oref] = False
+            self.submitted.add(oref)
+            request = self._queued[oref] = (True,) + tuple(order)
+            requests.append(request)
+        self._requests.putmany(requests)
+
+    def cancel(self, oref):
+        '''Queues a ``CancelOrder`` for the order with ``oref``'''
+        self._requests.put((False, oref), cancel=True)
+
+    def drain(self):
+        '''Returns the events received so far'''
+        events = self.events
+        return [events.popleft() for _ in range(len(events))]
+
+    def _t_requests(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            if request[0]:
+                self._insert(*request[1:])
+            else:
+                self._cancel(request[1])
+
+    def _insert(self, oref, code, exchange, isbuy, size, price, pricetype):
+        self._queued.pop(oref, None)
+        side = XTPEnum.XTP_SIDE_TYPE.XTP_SIDE_BUY if isbuy else _SELL
+        order = XTPOrderInsertInfoStruct(
+            oref, code, price, size, _MARKETS[exchange], side,
+            XTPEnum.XTP_POSITION_EFFECT_TYPE.XTP_POSITION_EFFECT_INIT,
+            price_type=pricetype)
+
+        xtpid = self.trader.insert_order(order, self.session_id)
+        if self.latency is not None:
+            self.latency.inserted(oref)
+        if not xtpid:
+            self.inflight.pop(oref, None)
+            if self.latency is not None:
+                self.latency.done(oref)
+            self._event((self.REJECTED, oref,
+                         self._lasterror('InsertOrder failed')))
+            return
+
+        self.byref[oref] = xtpid
+        self.byxtpid[xtpid] = oref
+
+    def _cancel(self, oref):
+        xtpid = self.byref.get(oref)
+        if oref not in self.inflight:
+            return  # rejected or already done
+        if xtpid is None:  # insert still queued, withdraw it
+            request = self._queued.pop(oref, None)
+            if request is not None and self._requests.remove(request):
+                self.inflight.pop(oref, None)
+                if self.latency is not None:
+                    self.latency.done(oref)
+                self._event((self.CANCELLED, oref))
+            return
+
+        if not self.trader.cancel_order(xtpid, self.session_id) and \
+                self.notify is not None:
+            self.notify('CancelOrder failed', oref,
+                        self._lasterror('CancelOrder failed'))
+
+    def _event(self, event):
+        self.events.append(event)
+        if self.wakeup is not None:
+            self.wakeup.signal()
+        if self.hub is not None:
+            self.hub.post(OrderEvent(event[0], event[1], event[2:]))
+
+    def _lasterror(self, default):
+        error = self.trader.GetApiLastError()
+        if error is None or not error.error_id:
+            return default
+        return error.error_msg
+
+    def _oref(self, xtpid, client_id):
+        oref = self.byxtpid.get(xtpid)
+        if oref is None and client_id in self.submitted:
+            oref = client_id  # callback overtook the InsertOrder return
+        return oref
+
+    # Callbacks from the trader api thread. The structs are only valid
+    # during the call, copy what is needed
+    def on_order(self, order_info, error_info):
+        oref = self._oref(order_info.order_xtp_id,
+                          order_info.order_client_id)
+        if oref is None:
+            return  # another client of the same account
+
+        status = order_info.order_status
+        if status == _STATUS.XTP_ORDER_STATUS_NOTRADEQUEUEING:
+            if not self.inflight.get(oref, True):
+                self.inflight[oref] = True
+                if self.latency is not None:
+                    self.latency.acked(oref)
+                self._event((self.ACCEPTED, oref))
+
+        elif status in (_STATUS.XTP_ORDER_STATUS_CANCELED,
+                        _STATUS.XTP_ORDER_STATUS_PARTTRADEDNOTQUEUEING):
+            self.inflight.pop(oref, None)
+            if self.latency is not None:
+                self._traded.pop(oref, None)
+                self.latency.done(oref)
+            self._event((self.CANCELLED, oref))
+
+        elif status == _STATUS.XTP_ORDER_STATUS_REJECTED:
+            self.inflight.pop(oref, None)
+            if self.latency is not None:
+                self._traded.pop(oref, None)
+                self.latency.done(oref)
+            msg = error_info.error_msg if error_info is not None else ''
+            self._event((self.REJECTED, oref, msg))
+
+        elif status == _STATUS.XTP_ORDER_STATUS_ALLTRADED:
+            self.inflight.pop(oref, None)  # fills come with OnTradeEvent
+            if self.latency is not None:
+                self._alltraded(oref, 0, order_info.quantity)
+
+    def on_trade(self, trade_info):
+        oref = self._oref(trade_info.order_xtp_id,
+                          trade_info.order_client_id)
+        if oref is None:
+            return
+
+        size = trade_info.quantity
+        if trade_info.side == _SELL:
+            size = -size
+
+        self.fills += 1
+        if self.latency is not None:
+            self.latency.filled(oref)
+            self._alltraded(oref, trade_info.quantity, None)
+        self._event((self.FILL, oref, size, trade_info.price))
+
+    def _alltraded(self, oref, traded, quantity):
+        # the timing of an order ends with its last trade report, which may
+        # come before or after the all traded status (giving ``quantity``)
+        seen, total = self._traded.pop(oref, (0, None))
+        seen += traded
+        if quantity is not None:
+            total = quantity
+        if total is not None and seen >= total:
+            self.latency.done(oref)
+        else:
+            self._traded[oref] = (seen, total)
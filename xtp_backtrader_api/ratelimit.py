@@ -0,0 +1,158 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+import time
+
+
+class TokenBucket(object):
+    '''
+    ``rate`` tokens per second, up to ``burst`` of them saved up. ``take``
+    returns 0 if the tokens were taken, or the seconds until they are
+    available. Taking more than ``burst`` at once takes ``burst``
+    '''
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.clock = clock
+        self.tokens = self.burst
+        self._stamp = clock()
+
+    def take(self, count=1):
+        count = min(count, self.burst)
+        now = self.clock()
+        tokens = min(self.burst,
+                     self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if tokens >= count:
+            self.tokens = tokens - count
+            return 0.0
+        self.tokens = tokens
+        return (count - tokens) / self.rate
+
+
+class RateLimiter(object):
+    '''
+    Paces the requests of a trader session to stay below the flow limits of
+    the XTP counter: a ``TokenBucket`` of ``insert``, ``cancel`` and
+    ``query`` requests per second (0 for no limit) each, holding up to
+    ``burst`` seconds worth of requests.
+
+    Orders and cancels are queued with ``put`` and taken by the order
+    gateway thread with ``get``, which blocks until a request can be sent:
+    cancels go first, then orders in the order they were put, each as soon
+    as its own bucket allows. Queries take their tokens with ``take`` and
+    are skipped rather than delayed when there is none.
+
+    ``metrics`` reports the depth of the queues and how often requests had
+    to wait for a token.
+    '''
+
+    INSERT, CANCEL, QUERY = 'insert', 'cancel', 'query'
+
+    def __init__(self, insert=0.0, cancel=0.0, query=0.0, burst=1.0,
+                 clock=time.monotonic):
+        self.buckets = dict(
+            (kind, TokenBucket(rate, rate * burst, clock) if rate else None)
+            for kind, rate in ((self.INSERT, insert), (self.CANCEL, cancel),
+                               (self.QUERY, query)))
+        self.orders = collections.deque()
+        self.cancels = collections.deque()
+        self.maxdepth = 0  # most requests queued at once
+        self.sent = collections.Counter()  # kind -> requests let through
+        self.throttled = collections.Counter()  # kind -> had to wait
+        self.skipped = 0  # queries without a token
+        self.dropped = []  # requests still queued when closed
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, request, cancel=False):
+        '''Queues ``request`` (an order or a cancel). Any thread'''
+        self.putmany((request,), cancel)
+
+    def putmany(self, requests, cancel=False):
+        '''Queues several orders (or cancels) at once. Any thread'''
+        with self._cond:
+            (self.cancels if cancel else self.orders).extend(requests)
+            depth = len(self.orders) + len(self.cancels)
+            if depth > self.maxdepth:
+                self.maxdepth = depth
+            self._cond.notify()
+
+    def get(self):
+        '''
+        Returns the next request once its bucket has a token. Single
+        consumer. Once closed the requests which can go right away are
+        still returned, then ``None``
+        '''
+        throttled = set()
+        with self._cond:
+            while True:
+                wait = None
+                for queue, kind in ((self.cancels, self.CANCEL),
+                                    (self.orders, self.INSERT)):
+                    if not queue:
+                        continue
+                    bucket = self.buckets[kind]
+                    due = bucket.take() if bucket is not None else 0.0
+                    if not due:
+                        self.sent[kind] += 1
+                        if kind in throttled:
+                            self.throttled[kind] += 1
+                        return queue.popleft()
+                    throttled.add(kind)
+                    wait = due if wait is None else min(wait, due)
+
+                if self._closed:
+                    self.dropped.extend(self.cancels)
+                    self.dropped.extend(self.orders)
+                    self.cancels.clear()
+                    self.orders.clear()
+                    return None
+                self._cond.wait(wait)
+
+    def remove(self, request):
+        '''Removes a queued order. Returns ``False`` if not queued'''
+        with self._cond:
+            try:
+                self.orders.remove(request)
+            except ValueError:
+                return False
+            return True
+
+    def take(self, kind=QUERY, count=1):
+        '''Takes ``count`` tokens of ``kind`` if available. Any thread'''
+        bucket = self.buckets[kind]
+        with self._cond:
+            if bucket is not None and bucket.take(count):
+                if kind == self.QUERY:
+                    self.skipped += 1
+                return False
+            self.sent[kind] += count
+            return True
+
+    def close(self):
+        '''
+        Makes ``get`` return ``None`` instead of waiting for a token, the
+        requests left in the queues are then moved to ``dropped``
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def depth(self):
+        '''Returns the number of queued requests'''
+        return len(self.orders) + len(self.cancels)
+
+    def metrics(self):
+        return collections.OrderedDict([
+            ('orders', len(self.orders)),
+            ('cancels', len(self.cancels)),
+            ('maxdepth', self.maxdepth),
+            ('sent', dict(self.sent)),
+            ('throttled', dict(self.throttled)),
+            ('skipped', self.skipped),
+            ('dropped', len(self.dropped)),
+        ])
@@ -0,0 +1,163 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import threading
+
+import numpy as np
+
+import xtpwrapper.xtp_enum as XTPEnum
+
+from xtp_backtrader_api.tickbuffer import RecordRing, SpscRing
+
+
+# Leading 504 bytes of XTPMarketDataStruct, everything up to the stock and
+# option extension union. Offsets are those of the C struct
+TICK_DTYPE = np.dtype(dict(
+    names=['exchange_id', 'ticker', 'last_price', 'pre_close_price',
+           'open_price', 'high_price', 'low_price', 'close_price',
+           'pre_total_long_positon', 'total_long_positon', 'pre_settl_price',
+           'settl_price', 'upper_limit_price', 'lower_limit_price',
+           'pre_delta', 'curr_delta', 'data_time', 'qty', 'turnover',
+           'avg_price', 'bid', 'ask', 'bid_qty', 'ask_qty', 'trades_count',
+           'ticker_status'],
+    formats=[np.int32, 'S16', np.float64, np.float64,
+             np.float64, np.float64, np.float64, np.float64,
+             np.int64, np.int64, np.float64,
+             np.float64, np.float64, np.float64,
+             np.float64, np.float64, np.int64, np.int64, np.float64,
+             np.float64, (np.float64, 10), (np.float64, 10),
+             (np.int64, 10), (np.int64, 10), np.int64,
+             'S8'],
+    offsets=[0, 4, 24, 32,
+             40, 48, 56, 64,
+             72, 80, 88,
+             96, 104, 112,
+             120, 128, 136, 144, 152,
+             160, 168, 248, 328, 408, 488,
+             496],
+    itemsize=504,
+))
+
+_EXCHANGES = {
+    XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH: 'SH',
+    XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ: 'SZ',
+}
+
+
+def open_ticks(filename):
+    '''
+    Returns the ticks recorded in ``filename`` as a read only numpy memmap
+    of ``TICK_DTYPE``. A record still being written at the end of the file
+    is left out
+    '''
+    count = os.path.getsize(filename) // TICK_DTYPE.itemsize
+    if not count:
+        return np.zeros(0, dtype=TICK_DTYPE)
+    return np.memmap(filename, dtype=TICK_DTYPE, mode='r', shape=(count,))
+
+
+class TickRecorder(object):
+    '''
+    Records every depth snapshot received by the quote api in fixed width
+    binary files, one per trading day and exchange
+    (``<path>/<YYYYMMDD>.<SH|SZ>.ticks``).
+
+    Each record is the raw ``XTPMarketDataStruct`` up to the extension
+    union, described by ``TICK_DTYPE``, so a file is read back with
+    ``open_ticks`` (a ``numpy.memmap``) without any parsing.
+
+    ``push`` is meant to be called from ``OnDepthMarketData``: it copies the
+    struct into a ``RecordRing`` with a single ``memmove`` and never touches
+    the disk. A background thread writes the ring out every
+    ``flushinterval`` seconds. If the writer falls more than ``capacity``
+    ticks behind, new ticks are dropped, counted in ``ring.overflows`` and
+    reported through ``notify``.
+
+    Throughput (``benchmarks/bench_recorder.py``, local SSD): the writer
+    alone moves about 400 MB/s (800k ticks/s). Fed from
+    ``OnDepthMarketData`` it sustains 150k ticks/s without drops, which is
+    the rate the Python side delivering the ticks tops out at, and adds
+    about 2us to the callback. A whole market day at 3 second snapshots
+    (4000 symbols, 19.2M ticks) takes 9.7 GB.
+    '''
+
+    def __init__(self, path, capacity=65536, flushinterval=0.2,
+                 notify=None):
+        self.path = path
+        self.flushinterval = flushinterval
+        self.notify = notify
+        self.ring = RecordRing(TICK_DTYPE, capacity=capacity,
+                               overflow=SpscRing.OVERFLOW_ALERT,
+                               onalert=self._overflow)
+        self.push = self.ring.push
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.records = 0  # ticks written so far
+        self._files = dict()  # (day, exchange_id) -> open file
+        self._stop = threading.Event()
+        self._thread = None
+
+    def filename(self, day, exchange_id):
+        exchange = _EXCHANGES.get(exchange_id, str(exchange_id))
+        return os.path.join(self.path, '%d.%s.ticks' % (day, exchange))
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._t_flush)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''Writes out the pending ticks and closes the files'''
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def flush(self):
+        '''Writes the ticks in the ring, returns how many were written'''
+        batch = self.ring.popmany()
+        if batch is None:
+            return 0
+
+        records = batch['record']
+        keys = (records['data_time'] // 1000000000) * 16 + \
+            records['exchange_id']
+        ukeys = np.unique(keys)
+        for key in ukeys.tolist():
+            day, exchange_id = divmod(key, 16)
+            chunk = records if len(ukeys) == 1 else records[keys == key]
+            f = self._files.get((day, exchange_id))
+            if f is None:
+                f = open(self.filename(day, exchange_id), 'ab')
+                self._files[(day, exchange_id)] = f
+            f.write(chunk.data)
+            f.flush()
+
+        # files of previous trading days are complete
+        last = ukeys[-1] // 16
+        for day, exchange_id in [k for k in self._files if k[0] < last]:
+            self._files.pop((day, exchange_id)).close()
+
+        self.records += len(records)
+        return len(records)
+
+    def _t_flush(self):
+        while not self._stop.wait(self.flushinterval):
+            self.flush()
+
+    def _overflow(self, ring):
+        # called from the quote thread
+        if self.notify is not None:
+            self.notify('Tick recorder overflow', overflows=ring.overflows)
@@ -0,0 +1,255 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import ctypes
+import glob
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from xtpwrapper.xtp_struct.xquote_struct import XTPMarketDataStruct
+
+from xtp_backtrader_api import xtpstore
+from xtp_backtrader_api.recorder import TICK_DTYPE, open_ticks
+from xtp_backtrader_api.xtpdata import DataTimeConverter
+
+
+def data_datetime(data_time):
+    '''Returns the ``datetime`` of an XTP ``data_time`` integer'''
+    day, clock = divmod(int(data_time), 1000000000)
+    hhmmss, ms = divmod(clock, 1000)
+    return datetime(day // 10000, day // 100 % 100, day % 100,
+                    hhmmss // 10000, hhmmss // 100 % 100, hhmmss % 100,
+                    ms * 1000)
+
+
+def _full(ring):
+    # dropoldest rings only guarantee capacity - 1 slots
+    return len(ring) >= ring.capacity - 1 or \
+        any(len(copy) >= copy.capacity - 1 for copy in ring.copies)
+
+
+class XTPReplayAPI(xtpstore.XTPQuoteAPI):
+    '''
+    Stand-in for ``XTPQuoteAPI`` delivering the ticks of files written by
+    ``TickRecorder`` instead of a quote server.
+
+    The files are opened as memmaps and, from the first subscription on, a
+    thread copies each record of a subscribed symbol into a reused
+    ``XTPMarketDataStruct`` and calls ``OnDepthMarketData`` with it, so the
+    ticks take the same path (rings, ``XTPData``, bar builder) as live
+    ones. Records of several files are merged by ``data_time``, a single
+    file is played in recording order.
+
+    Params:
+
+      - ``files``: recorded files to play (see ``findfiles``)
+
+      - ``speed`` (default: ``0``): ``0`` plays as fast as possible, ``1``
+        at the pace of the recording (wall clock) and ``N`` N times faster
+
+      - ``backpressure`` (default: ``True``): wait for the consumer of a
+        full ring instead of overwriting ticks. Keeps replays as fast as
+        possible lossless
+
+      - ``autoplay`` (default: ``True``): start playing at the first
+        subscription. Otherwise ``play`` has to be called, the store does
+        once its first batch of subscriptions (every exchange) is in. The
+        symbols are selected a chunk of records at a time, symbols
+        subscribed after the start may miss the ticks of a chunk
+
+    ``now`` returns the time of the replay, which the datas use instead of
+    the wall clock to complete bars: never later than the next tick to be
+    delivered, so that the bars are those live ticks would have produced.
+    ``finished`` is set once every tick has been delivered, the datas then
+    report the end of their data.
+    '''
+
+    params = (
+        ('files', ()),
+        ('speed', 0.0),
+        ('backpressure', True),
+        ('autoplay', True),
+        ('chunksize', 65536),  # records selected and scheduled at once
+    )
+
+    @staticmethod
+    def findfiles(path, day=None):
+        '''
+        Returns the recorded files of ``day`` (YYYYMMDD, all days if
+        ``None``) in directory ``path``. Lists of files are returned as is
+        '''
+        if not isinstance(path, (str, bytes)):
+            return list(path)
+
+        pattern = '%s.*.ticks' % (day if day is not None else '*',)
+        return sorted(glob.glob(os.path.join(path, pattern)))
+
+    def __init__(self):
+        # no quote server to log in to
+        super(xtpstore.XTPQuoteAPI, self).__init__()
+        self.notifs = self.p.notifs
+        self.rings = self.p.rings
+        self.tbtrings = self.p.tbtrings
+        self.recorder = self.p.recorder
+        self.events = self.p.events
+        self.wakeup = self.p.wakeup
+        self.latency = self.p.latency
+        self.triggers = self.p.triggers
+
+        self.subscribed = set()  # symbol keys being delivered
+        self.delivered = 0
+        self.finished = False
+
+        self._md = XTPMarketDataStruct()
+        self._ticks = [open_ticks(name) for name in self.p.files]
+        self._ticks = [ticks for ticks in self._ticks if len(ticks)]
+        if not self._ticks:
+            self.finished = True
+            self.notifs.append(('Nothing to replay', (self.p.files,), {}))
+
+        self._offsets = np.cumsum([0] + [len(t) for t in self._ticks])
+        self._next = None  # data_time of the next tick to deliver
+        if not self.finished:
+            self._next = int(min(t['data_time'][0] for t in self._ticks))
+
+        # pacing origin: wall clock, replay data_time and replay seconds
+        self._t0 = self._sim0 = self._simsecs = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def SubscribeMarketData(self, codes, exchange_id):
+        self.subscribed.update((int(exchange_id), code.encode('utf-8'))
+                               for code in codes)
+        if self.p.autoplay:
+            self.play()
+        return 0
+
+    def play(self):
+        '''Starts delivering the ticks of the subscribed symbols'''
+        if self._thread is None and not self.finished:
+            self._thread = threading.Thread(target=self._t_replay)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def UnSubscribeMarketData(self, codes, exchange_id):
+        self.subscribed.difference_update(
+            (int(exchange_id), code.encode('utf-8')) for code in codes)
+        return 0
+
+    def SubscribeTickByTick(self, codes, exchange_id):
+        self.notifs.append(('Tick by tick data is not recorded', (codes,),
+                            {}))
+        return 0
+
+    def Close(self):
+        self._stop.set()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def now(self):
+        if self.finished:
+            return datetime.max
+
+        now = data_datetime(self._next)
+        if self.p.speed and self._t0 is not None:
+            elapsed = (time.perf_counter() - self._t0) * self.p.speed
+            now = min(now, data_datetime(self._sim0) +
+                      timedelta(seconds=elapsed))
+        return now
+
+    def _playorder(self):
+        if len(self._ticks) == 1:
+            return np.arange(len(self._ticks[0]), dtype=np.int64)
+
+        times = np.concatenate([t['data_time'] for t in self._ticks])
+        return np.argsort(times, kind='stable')
+
+    def _chunk(self, order):
+        # file and row of the records, their exchanges, tickers and times
+        fileno = np.searchsorted(self._offsets, order, side='right') - 1
+        rows = order - self._offsets[fileno]
+        exchanges = np.empty(len(order), dtype=TICK_DTYPE['exchange_id'])
+        tickers = np.empty(len(order), dtype=TICK_DTYPE['ticker'])
+        times = np.empty(len(order), dtype=np.int64)
+        for f, ticks in enumerate(self._ticks):
+            mine = fileno == f
+            if mine.any():
+                exchanges[mine] = ticks['exchange_id'][rows[mine]]
+                tickers[mine] = ticks['ticker'][rows[mine]]
+                times[mine] = ticks['data_time'][rows[mine]]
+
+        addrs = np.array([t.ctypes.data for t in self._ticks],
+                         dtype=np.int64)[fileno] + rows * TICK_DTYPE.itemsize
+        return addrs, exchanges, tickers, times
+
+    def _subscribed(self, exchanges, tickers):
+        # codes are only unique within an exchange
+        byexchange = collections.defaultdict(list)
+        for exchange, ticker in list(self.subscribed):
+            byexchange[exchange].append(ticker)
+
+        keep = np.zeros(len(tickers), dtype=bool)
+        for exchange, codes in byexchange.items():
+            keep |= (exchanges == exchange) & np.isin(tickers, codes)
+        return keep
+
+    def _t_replay(self):
+        order = self._playorder()
+        size = TICK_DTYPE.itemsize
+        md = self._md
+        dst = ctypes.addressof(md)
+        memmove = ctypes.memmove
+        callback = self.OnDepthMarketData
+        rings = self.rings
+        speed = self.p.speed
+        backpressure = self.p.backpressure
+        seconds = DataTimeConverter()
+        wait = self._stop.wait
+
+        for start in range(0, len(order), self.p.chunksize):
+            addrs, exchanges, tickers, times = self._chunk(
+                order[start:start + self.p.chunksize])
+            keep = self._subscribed(exchanges, tickers)
+            addrs, times = addrs[keep], times[keep]
+            keys = zip(exchanges[keep].tolist(), tickers[keep].tolist())
+            if not len(times):
+                continue
+
+            dues = None
+            if speed:
+                secs = seconds.convert(times) * 86400.0
+                if self._t0 is None:
+                    self._t0, self._sim0 = time.perf_counter(), int(times[0])
+                    self._simsecs = secs[0]
+                dues = ((secs - self._simsecs) / speed + self._t0).tolist()
+
+            for i, (addr, key, data_time) in enumerate(
+                    zip(addrs.tolist(), keys, times.tolist())):
+                self._next = data_time  # everything before it is delivered
+                if dues is not None:
+                    delay = dues[i] - time.perf_counter()
+                    if delay > 0 and wait(delay):
+                        return
+
+                ring = rings.get(key)
+                while backpressure and ring is not None and _full(ring):
+                    if wait(0.0005):
+                        return
+
+                memmove(dst, addr, size)
+                callback(md, [], 0, 0, [], 0, 0)
+
+            self.delivered += len(times)
+            if self._stop.is_set():
+                return
+
+        self.finished = True
+
+
+xtpstore.XTPStore.ReplayCls = XTPReplayAPI
@@ -0,0 +1,225 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import time
+
+from xtp_backtrader_api.xtpstore import symbol_key
+
+
+class _Symbol(object):
+    '''Risk counters of one code'''
+
+    __slots__ = ('size', 'held', 'openbuy', 'opensell', 'sellable',
+                 'limit', 'ring')
+
+    def __init__(self, limit):
+        self.size = 0  # position
+        self.held = 0.0  # position value at cost
+        self.openbuy = 0  # quantity of the live buy orders
+        self.opensell = 0  # quantity of the live sell orders
+        self.sellable = 0  # quantity that can be sold today (T+1)
+        self.limit = limit  # maximum position, None for no limit
+        self.ring = None  # tick ring of the code, once there is one
+
+
+class RiskEngine(object):
+    '''
+    Pre-trade checks run by ``XTPBroker`` on every order before it is handed
+    to the order gateway, so that an order the limits forbid is rejected
+    locally instead of costing a round trip to the exchange.
+
+    Limits (``None`` disables a check):
+
+      - ``maxsize``: quantity of a single order
+      - ``maxposition``: position of a code, counting its live buy orders.
+        ``positions`` maps tickers (``000001.SZ``, ``600000``) to their own
+        limit
+      - ``maxnotional``: value of a single order
+      - ``maxexposure``: value at cost of all positions plus the live buy
+        orders of the account
+      - ``checkcash``: buy orders must fit in the cash left by the live
+        ones
+      - ``maxrate``: orders admitted per ``ratewindow`` seconds
+      - ``band``: limit prices must be within this fraction of the last
+        traded price of the code
+      - ``tplus1``: sell orders are limited to the shares held since the
+        last ``reset``, as A-shares bought today cannot be sold before
+        tomorrow
+
+    Market orders are valued at the last traded price, read from the tick
+    ring of the code in ``rings`` and rejected while there is none. Codes
+    are keyed like the rings of the store (``xtpstore.symbol_key``).
+
+    All checks read counters kept per code and for the account, which are
+    moved by the broker as orders are admitted (``admit``), filled
+    (``filled``) and end (``release``), so the cost of a check does not
+    depend on the number of positions or orders. ``reset`` loads the
+    positions of a ``Ledger``, the broker calls it at start and after
+    every reconciliation.
+    '''
+
+    def __init__(self, maxsize=None, maxposition=None, positions=None,
+                 maxnotional=None, maxexposure=None, checkcash=True,
+                 maxrate=None, ratewindow=1.0, band=None, tplus1=True,
+                 rings=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.maxposition = maxposition
+        self.positions = dict((symbol_key(ticker), limit) for ticker, limit
+                              in dict(positions or ()).items())
+        self.maxnotional = maxnotional
+        self.maxexposure = maxexposure
+        self.checkcash = checkcash
+        self.ratewindow = ratewindow
+        self.band = band
+        self.tplus1 = tplus1
+        self.rings = rings  # the broker sets the store's if None
+        self.clock = clock
+
+        self.symbols = dict()  # symbol key -> _Symbol
+        self.exposure = 0.0  # value at cost of all positions
+        self.openbuys = 0.0  # value of the live buy orders
+        self.rejected = collections.Counter()  # reason -> orders rejected
+        self._orders = dict()  # oref -> [symbol, isbuy, remaining, price]
+        self._stamps = None  # times of the last maxrate admitted orders
+        if maxrate:
+            self._stamps = collections.deque(maxlen=maxrate)
+
+    def symbol(self, code):
+        sym = self.symbols.get(code)
+        if sym is None:
+            sym = self.symbols[code] = _Symbol(
+                self.positions.get(code, self.maxposition))
+        return sym
+
+    def reset(self, ledger, sellable=True):
+        '''
+        Adopts the positions of ``ledger``. With ``sellable`` the sellable
+        quantities are the ones the account reported (``Ledger.sellable``,
+        shares bought today excluded) or the whole positions if it did not,
+        otherwise they are only cut down to the positions
+        '''
+        self.exposure = 0.0
+        for code, pos in ledger.positions.items():
+            sym = self.symbol(code)
+            sym.size = pos.size
+            sym.held = abs(pos.size) * pos.price
+            self.exposure += sym.held
+            held = max(pos.size, 0)
+            if sellable:
+                sym.sellable = min(held, ledger.sellable.get(code, held))
+            else:
+                sym.sellable = min(sym.sellable, held)
+
+    def lastprice(self, sym, code):
+        ring = sym.ring
+        if ring is None:
+            if not self.rings:
+                return None
+            ring = sym.ring = self.rings.get(code)
+            if ring is None:
+                return None
+        last = ring.last()
+        return float(last) if last is not None else None
+
+    def admit(self, oref, code, isbuy, size, price=None, cash=None):
+        '''
+        Checks an order for ``size`` (positive) shares of ``code`` at limit
+        ``price`` (``None`` for a market order) against the limits, with
+        ``cash`` available in the account. Returns ``None`` and counts the
+        order as live if it passes, the reason of the rejection otherwise
+        '''
+        if self.maxsize is not None and size > self.maxsize:
+            return self._reject('Order size limit')
+
+        sym = self.symbol(code)
+        last = self.lastprice(sym, code)
+        if price is None:
+            if last is None:
+                return self._reject('No last price')
+            price = last
+        elif self.band is not None:
+            if last is None:
+                return self._reject('No last price')
+            if abs(price - last) > last * self.band:
+                return self._reject('Price outside band')
+
+        notional = size * price
+        if self.maxnotional is not None and notional > self.maxnotional:
+            return self._reject('Order notional limit')
+
+        if isbuy:
+            if sym.limit is not None and \
+                    sym.size + sym.openbuy + size > sym.limit:
+                return self._reject('Position limit')
+            if self.maxexposure is not None and \
+                    self.exposure + self.openbuys + notional > \
+                    self.maxexposure:
+                return self._reject('Exposure limit')
+            if self.checkcash and cash is not None and \
+                    self.openbuys + notional > cash:
+                return self._reject('Insufficient cash')
+        else:
+            held = sym.sellable if self.tplus1 else sym.size
+            if sym.opensell + size > held:
+                return self._reject('Not sellable')
+
+        stamps = self._stamps
+        if stamps is not None:
+            now = self.clock()
+            if len(stamps) == stamps.maxlen and \
+                    now - stamps[0] < self.ratewindow:
+                return self._reject('Order rate limit')
+            stamps.append(now)
+
+        if isbuy:
+            sym.openbuy += size
+            self.openbuys += notional
+        else:
+            sym.opensell += size
+        self._orders[oref] = [sym, isbuy, size, price]
+        return None
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        return reason
+
+    def filled(self, oref, code, size, psize, pprice):
+        '''
+        Moves the counters by a fill of order ``oref`` for ``size``
+        (negative to sell) shares of ``code`` which left the position at
+        ``psize`` and ``pprice``
+        '''
+        sym = self.symbol(code)
+        order = self._orders.get(oref)
+        if order is not None:
+            isbuy, remaining, price = order[1:]
+            filled = min(abs(size), remaining)
+            order[2] = remaining - filled
+            if isbuy:
+                sym.openbuy -= filled
+                self.openbuys -= filled * price
+            else:
+                sym.opensell -= filled
+            if not order[2]:
+                del self._orders[oref]
+
+        if size < 0:
+            sym.sellable = max(sym.sellable + size, 0)
+        sym.size = psize
+        held = abs(psize) * pprice
+        self.exposure += held - sym.held
+        sym.held = held
+
+    def release(self, oref):
+        '''Drops what is left of order ``oref`` (cancelled or rejected)'''
+        order = self._orders.pop(oref, None)
+        if order is None:
+            return
+
+        sym, isbuy, remaining, price = order
+        if isbuy:
+            sym.openbuy -= remaining
+            self.openbuys -= remaining * price
+        else:
+            sym.opensell -= remaining
@@ -0,0 +1,535 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import ctypes
+import time
+
+import numpy as np
+
+
+class SpscRing(object):
+    '''
+    Base of the fixed capacity rings written by exactly one producer (an
+    SPI callback thread) and read by exactly one consumer.
+
+    Subclasses store their records in the preallocated numpy arrays of
+    ``columns`` (one row per slot) and publish a record by advancing
+    ``_head`` once the slot is complete. ``capacity``, ``overflow``,
+    ``onalert`` and ``blocktimeout`` are documented in ``TickRingBuffer``.
+
+    A ring has a single consumer, the rings of the other consumers of the
+    same symbol are kept in ``copies`` and the producer pushes every
+    record into them too.
+    '''
+
+    OVERFLOW_DROPOLDEST = 'dropoldest'
+    OVERFLOW_BLOCK = 'block'
+    OVERFLOW_ALERT = 'alert'
+
+    OverflowPolicies = (OVERFLOW_DROPOLDEST, OVERFLOW_BLOCK, OVERFLOW_ALERT)
+
+    def __init__(self, capacity=4096, overflow=OVERFLOW_DROPOLDEST,
+                 onalert=None, blocktimeout=1.0):
+        if overflow not in self.OverflowPolicies:
+            raise ValueError('Unknown overflow policy %r' % (overflow,))
+
+        self.capacity = 1 << max(1, int(capacity) - 1).bit_length()
+        self.overflow = overflow
+        self.onalert = onalert
+        self.blocktimeout = blocktimeout
+        self.columns = collections.OrderedDict()
+        self.copies = ()  # rings of the other consumers, replaced not grown
+
+        self._mask = self.capacity - 1
+        self._head = 0  # next sequence to write, owned by the producer
+        self._tail = 0  # next sequence to read, owned by the consumer
+
+        self.dropped = 0  # records overwritten before being read
+        self.overflows = 0  # records refused by the producer
+        self._alerted = False
+
+    def __len__(self):
+        return min(self._head - self._tail, self.capacity)
+
+    def _makeroom(self, head):
+        if self.overflow == self.OVERFLOW_DROPOLDEST:
+            return True  # the consumer notices and skips the lost slots
+
+        if self.overflow == self.OVERFLOW_BLOCK:
+            timeout = time.time() + self.blocktimeout
+            while head - self._tail >= self.capacity:
+                if time.time() > timeout:
+                    break
+                time.sleep(0)
+            else:
+                return True
+
+        self.overflows += 1
+        if not self._alerted:
+            self._alerted = True
+            if self.onalert is not None:
+                self.onalert(self)
+
+        return False
+
+    def _firstvalid(self):
+        # With ``dropoldest`` the producer may be writing the slot of
+        # sequence ``head`` right now, hence only ``capacity - 1`` slots
+        # behind ``head`` are guaranteed to be intact
+        if self.overflow != self.OVERFLOW_DROPOLDEST:
+            return self._tail
+        return max(self._tail, self._head - self.capacity + 1)
+
+    def _skiplost(self):
+        first = self._firstvalid()
+        if first > self._tail:
+            self.dropped += first - self._tail
+            self._tail = first
+
+    def popmany(self, maxn=None):
+        '''
+        Returns all unread records (or at most ``maxn``) as a dictionary of
+        numpy arrays keyed by column name or ``None`` if the ring is empty
+        '''
+        self._skiplost()
+        tail = self._tail
+        n = self._head - tail
+        if maxn is not None:
+            n = min(n, maxn)
+
+        if n <= 0:
+            self._alerted = False
+            return None
+
+        idx = np.arange(tail, tail + n, dtype=np.int64) & self._mask
+        out = dict((name, col.take(idx, axis=0))
+                   for name, col in self.columns.items())
+
+        lost = min(self._firstvalid() - tail, n)
+        if lost > 0:  # overwritten while being copied
+            self.dropped += lost
+            out = dict((name, col[lost:]) for name, col in out.items())
+
+        self._tail = tail + n
+        return out if n > lost else None
+
+
+class TickRingBuffer(SpscRing):
+    '''
+    Fixed capacity ring of depth snapshots for a single symbol.
+
+    The ring is written by exactly one producer (the quote SPI thread) and
+    read by exactly one consumer (the ``XTPData`` owning it). Each field is
+    stored in its own preallocated numpy column so that writing a tick is a
+    handful of scalar stores and no Python object outlives the callback.
+
+    Producer and consumer only ever advance their own counter (``_head``
+    and ``_tail``), which makes the ring lock free under the GIL.
+
+    Params:
+
+      - ``ticker``: symbol the ring belongs to
+
+      - ``capacity`` (default: ``4096``): number of slots, rounded up to the
+        next power of two
+
+      - ``overflow`` (default: ``dropoldest``): what to do when the producer
+        finds the ring full
+
+        - ``dropoldest``: overwrite the oldest unread tick. The consumer
+          detects the overwrite and skips the lost ticks
+
+        - ``block``: the producer waits up to ``blocktimeout`` seconds for
+          the consumer to make room and then falls back to ``alert``
+
+        - ``alert``: drop the incoming tick, count it in ``overflows`` and
+          call ``onalert(ring)`` once per overflow burst
+
+      - ``onalert`` (default: ``None``): callable invoked with the ring when
+        an overflow burst starts (``alert`` and ``block`` policies)
+
+      - ``layout`` (default: ``full``): ``full`` copies every scalar listed
+        in ``FIELDS``, ``lean`` only the ones ``XTPData`` consumes
+        (``LEAN_FIELDS``) to keep the quote callback as short as possible
+
+      - ``depth`` (default: ``0``): number of order book levels (up to 10)
+        to copy into the ``bid``, ``ask``, ``bid_qty`` and ``ask_qty``
+        columns, which are 2d with one row per tick
+
+    ``board`` can be set to an ``(array, index)`` pair which then receives
+    the last price of every tick pushed (used for portfolio valuation)
+    '''
+
+    # Columns copied from ``XTPMarketDataStruct``
+    FIELDS = (
+        ('data_time', np.int64),
+        ('last_price', np.float64),
+        ('pre_close_price', np.float64),
+        ('open_price', np.float64),
+        ('high_price', np.float64),
+        ('low_price', np.float64),
+        ('close_price', np.float64),
+        ('upper_limit_price', np.float64),
+        ('lower_limit_price', np.float64),
+        ('qty', np.int64),
+        ('turnover', np.float64),
+        ('avg_price', np.float64),
+        ('trades_count', np.int64),
+        ('total_long_positon', np.int64),
+    )
+
+    # Columns actually consumed by ``XTPData``
+    LEAN_FIELDS = (
+        ('data_time', np.int64),
+        ('last_price', np.float64),
+        ('open_price', np.float64),
+        ('high_price', np.float64),
+        ('low_price', np.float64),
+        ('qty', np.int64),
+        ('total_long_positon', np.int64),
+    )
+
+    Layouts = dict(full=FIELDS, lean=LEAN_FIELDS)
+
+    MAX_DEPTH = 10
+
+    # Same layout as the contiguous book arrays of ``XTPMarketDataStruct``
+    BOOK_DTYPE = np.dtype([
+        ('bid', np.float64, MAX_DEPTH),
+        ('ask', np.float64, MAX_DEPTH),
+        ('bid_qty', np.int64, MAX_DEPTH),
+        ('ask_qty', np.int64, MAX_DEPTH),
+    ])
+
+    def __init__(self, ticker, capacity=4096,
+                 overflow=SpscRing.OVERFLOW_DROPOLDEST, onalert=None,
+                 blocktimeout=1.0, layout='full', depth=0):
+        super(TickRingBuffer, self).__init__(capacity, overflow, onalert,
+                                             blocktimeout)
+        if layout not in self.Layouts:
+            raise ValueError('Unknown tick layout %r' % (layout,))
+        if not 0 <= depth <= self.MAX_DEPTH:
+            raise ValueError('depth must be between 0 and %d' %
+                             self.MAX_DEPTH)
+
+        self.ticker = ticker
+        self.layout = layout
+        self.depth = depth
+
+        for name, dtype in self.Layouts[layout]:
+            self.columns[name] = np.zeros(self.capacity, dtype=dtype)
+        self._cols = tuple(self.columns.items())
+
+        self._book = None
+        self._depthcols = ()
+        if depth:
+            # full book rows are stored and views expose the first levels
+            self._book = np.zeros(self.capacity, dtype=self.BOOK_DTYPE)
+            for name in self.BOOK_DTYPE.names:
+                self.columns[name] = self._book[name][:, :depth]
+            self._depthcols = tuple(
+                (name, self.columns[name], range(depth))
+                for name in self.BOOK_DTYPE.names)
+
+        self.names = tuple(self.columns)
+        self.Tick = collections.namedtuple('Tick', self.names)
+        self._get = None  # attribute getter bound on the first push
+        self._lastcol = self.columns['last_price']
+        self.board = None  # (array, index) receiving the last price
+        self._memcopy = None  # raw copy of the book levels, if possible
+
+    def push(self, market_data):
+        '''
+        Copies the fields of ``market_data`` into the next slot. Returns
+        ``False`` if the tick was refused by the overflow policy
+        '''
+        head = self._head
+        if head - self._tail >= self.capacity and not self._makeroom(head):
+            return False
+
+        get = self._get
+        if get is None:
+            get = self._bind(market_data)
+
+        i = head & self._mask
+        for name, col in self._cols:
+            col[i] = get(market_data, name)
+
+        if self._memcopy is not None:
+            dst, offset, size = self._memcopy
+            ctypes.memmove(dst + i * size,
+                           ctypes.addressof(market_data) + offset, size)
+        elif self._depthcols:
+            for name, col, levels in self._depthcols:
+                src = get(market_data, name)
+                row = col[i]
+                for lvl in levels:
+                    row[lvl] = src[lvl]
+
+        board = self.board
+        if board is not None:
+            board[0][board[1]] = self._lastcol[i]
+
+        self._head = head + 1  # publish only once the slot is complete
+        return True
+
+    def _bind(self, market_data):
+        self._get = getattr
+        self._memcopy = None
+        if not isinstance(market_data, ctypes.Structure):
+            return self._get
+
+        # xtpwrapper structs override __getattribute__ in Python to map
+        # enum fields. None of the copied fields is an enum, so go straight
+        # to the ctypes descriptors and skip a Python frame per field
+        self._get = ctypes.Structure.__getattribute__
+
+        # The book arrays are contiguous in the C struct and match
+        # BOOK_DTYPE: copy all of them with a single memmove
+        if self._book is not None:
+            cls = type(market_data)
+            offset = getattr(cls, 'bid').offset
+            for name in self.BOOK_DTYPE.names:
+                field = getattr(cls, name)
+                dtype, pos = self.BOOK_DTYPE.fields[name]
+                if (field.offset - offset, field.size) != \
+                        (pos, dtype.itemsize):
+                    return self._get
+
+            self._memcopy = (self._book.ctypes.data, offset,
+                             self.BOOK_DTYPE.itemsize)
+
+        return self._get
+
+    def pop(self):
+        '''
+        Returns the oldest unread tick as a ``Tick`` namedtuple or ``None``
+        if the ring is empty
+        '''
+        while True:
+            self._skiplost()
+            tail = self._tail
+            if tail >= self._head:
+                self._alerted = False
+                return None
+
+            i = tail & self._mask
+            tick = self.Tick(*[col[i].copy() if col.ndim > 1 else col[i]
+                               for col in self.columns.values()])
+            if self._firstvalid() <= tail:
+                self._tail = tail + 1
+                return tick
+
+    def last(self, name='last_price', default=None):
+        '''
+        Returns field ``name`` of the newest tick without consuming it, or
+        ``default`` if nothing was ever written. Safe to call from the
+        consumer side at any time
+        '''
+        head = self._head
+        if not head:
+            return default
+        return self.columns[name][(head - 1) & self._mask]
+
+
+class RecordRing(SpscRing):
+    '''
+    Fixed capacity ring of raw C structs, stored in a numpy record array of
+    ``dtype`` (``RECORD_DTYPE`` of the subclass by default).
+
+    The dtype mirrors the layout of the leading ``itemsize`` bytes of the
+    structs pushed, so a ctypes struct whose fields sit at the same offsets
+    is copied with a single ``memmove``. Other objects (replays, tests) are
+    copied field by field by name.
+
+    ``popmany`` returns the raw records under the ``record`` key. The other
+    params are those of ``TickRingBuffer``
+    '''
+
+    RECORD_DTYPE = None
+
+    # Attribute names of the fields of the dtype, where they differ
+    _SOURCES = dict()
+
+    def __init__(self, dtype=None, capacity=65536,
+                 overflow=SpscRing.OVERFLOW_DROPOLDEST, onalert=None,
+                 blocktimeout=1.0):
+        super(RecordRing, self).__init__(capacity, overflow, onalert,
+                                         blocktimeout)
+        self.dtype = np.dtype(dtype if dtype is not None
+                              else self.RECORD_DTYPE)
+        self._records = np.zeros(self.capacity, dtype=self.dtype)
+        self.columns['record'] = self._records
+        self._address = self._records.ctypes.data
+        self._size = self.dtype.itemsize
+        self._copy = None  # bound on the first push
+
+    def push(self, struct):
+        '''
+        Copies ``struct`` into the next slot. Returns ``False`` if it was
+        refused by the overflow policy
+        '''
+        head = self._head
+        if head - self._tail >= self.capacity and not self._makeroom(head):
+            return False
+
+        copy = self._copy
+        if copy is None:
+            copy = self._bind(struct)
+
+        copy(head & self._mask, struct)
+        self._head = head + 1  # publish only once the slot is complete
+        return True
+
+    def _bind(self, struct):
+        self._copy = self._copyfields
+        if not isinstance(struct, ctypes.Structure) or \
+                ctypes.sizeof(struct) < self._size:
+            return self._copy
+
+        cls = type(struct)
+        for name, (dtype, offset) in self.dtype.fields.items():
+            field = getattr(cls, name, None)
+            if field is not None and field.offset != offset:
+                return self._copy  # not the layout the dtype describes
+
+        self._copy = self._memcopy
+        return self._copy
+
+    def _memcopy(self, i, struct):
+        size = self._size
+        ctypes.memmove(self._address + i * size, ctypes.addressof(struct),
+                       size)
+
+    def _skipfields(self, obj):
+        return ()
+
+    def _copyfields(self, i, obj):
+        records = self._records
+        records[i] = 0
+        skip = self._skipfields(obj)
+        for name, (dtype, _) in self.dtype.fields.items():
+            value = getattr(obj, self._SOURCES.get(name, name), None)
+            if value is None or name in skip:
+                continue
+            if isinstance(value, bytes) and dtype.kind != 'S':
+                value = ord(value) if value else 0
+            records[name][i] = value
+
+
+class TickByTickBuffer(RecordRing):
+    '''
+    Fixed capacity ring of tick by tick messages (order entrusts and
+    trades) for a single symbol.
+
+    Tick by tick data arrives at many times the rate of depth snapshots, so
+    the producer does not pick fields: every message is copied verbatim
+    into ``RECORD_DTYPE``, which mirrors the C layout of
+    ``XTPTickByTickStruct`` (entrust and trade overlap as in the union),
+    with a single ``memmove`` (see ``RecordRing``). Decoding into columns
+    is left to the consumer and done a batch at a time by ``popmany``.
+
+    Params are those of ``TickRingBuffer`` without ``layout`` and ``depth``
+    '''
+
+    ENTRUST, TRADE, CANCEL = 1, 2, 3  # values of the decoded ``kind``
+
+    # XTPTickByTickStruct, the union starts at offset 48
+    RECORD_DTYPE = np.dtype(dict(
+        names=['exchange_id', 'ticker', 'seq', 'data_time', 'type',
+               'channel_no', 'channel_seq', 'price', 'qty', 'side',
+               'ord_type', 'money', 'bid_no', 'ask_no', 'trade_flag'],
+        formats=[np.int32, 'S16', np.int64, np.int64, np.int32,
+                 np.int32, np.int64, np.float64, np.int64, np.uint8,
+                 np.uint8, np.float64, np.int64, np.int64, np.uint8],
+        offsets=[0, 4, 24, 32, 40,
+                 48, 56, 64, 72, 80,
+                 81, 80, 88, 96, 104],
+        itemsize=112,
+    ))
+
+    # Ctypes names of the fields above, where they differ
+    _SOURCES = dict(channel_seq='seq')
+    _ENTRUST_ONLY = ('side', 'ord_type')
+    _TRADE_ONLY = ('money', 'bid_no', 'ask_no', 'trade_flag')
+
+    # Columns returned by ``popmany``
+    COLUMNS = (
+        ('data_time', np.int64),
+        ('kind', np.int8),  # ENTRUST, TRADE or CANCEL
+        ('side', np.int8),  # 1 buy, -1 sell, 0 unknown (aggressor if trade)
+        ('price', np.float64),
+        ('qty', np.int64),
+        ('channel_no', np.int32),
+        ('channel_seq', np.int64),
+        ('bid_no', np.int64),  # trades and cancels only
+        ('ask_no', np.int64),
+    )
+
+    def __init__(self, ticker, capacity=65536,
+                 overflow=SpscRing.OVERFLOW_DROPOLDEST, onalert=None,
+                 blocktimeout=1.0):
+        super(TickByTickBuffer, self).__init__(None, capacity, overflow,
+                                               onalert, blocktimeout)
+        self.ticker = ticker
+
+    def _skipfields(self, tbt_data):
+        # only the union member of the message type is meaningful
+        if tbt_data.type == self.TRADE:
+            return self._ENTRUST_ONLY
+        return self._TRADE_ONLY
+
+    def popmany(self, maxn=None):
+        '''
+        Returns the unread messages (or at most ``maxn``) decoded into the
+        numpy arrays of ``COLUMNS``, keyed by column name, or ``None`` if
+        the ring is empty
+        '''
+        out = super(TickByTickBuffer, self).popmany(maxn)
+        if out is None:
+            return None
+        return self.decode(out['record'])
+
+    @classmethod
+    def decode(cls, records):
+        '''
+        Decodes an array of ``RECORD_DTYPE`` into columns.
+
+        The aggressor of a trade is taken from the SSE flag ('B'/'S'). SZSE
+        does not publish it: the later of the two orders (the highest order
+        number) is the one which crossed the spread. SZSE cancels are
+        reported as trades with flag '4' and become ``CANCEL`` events on
+        the side of the cancelled order.
+        '''
+        trade = records['type'] == cls.TRADE
+        # the flag is past the end of an entrust, ignore whatever is there
+        flag = np.where(trade, records['trade_flag'], 0)
+        bid_no = np.where(trade, records['bid_no'], 0)
+        ask_no = np.where(trade, records['ask_no'], 0)
+
+        cancel = trade & (flag == ord('4'))
+        kind = np.where(trade, cls.TRADE, cls.ENTRUST).astype(np.int8)
+        kind[cancel] = cls.CANCEL
+
+        side = np.select(
+            [~trade & (records['side'] == ord('1')),
+             ~trade & (records['side'] == ord('2')),
+             flag == ord('B'), flag == ord('S'),
+             (flag == ord('F')) & (bid_no > ask_no),
+             flag == ord('F'),
+             cancel & (bid_no > 0),
+             cancel],
+            [1, -1, 1, -1, 1, -1, 1, -1], 0).astype(np.int8)
+
+        return dict(
+            data_time=records['data_time'].astype(np.int64),
+            kind=kind,
+            side=side,
+            price=records['price'].astype(np.float64),
+            qty=records['qty'].astype(np.int64),
+            channel_no=records['channel_no'].astype(np.int32),
+            channel_seq=records['channel_seq'].astype(np.int64),
+            bid_no=bid_no,
+            ask_no=ask_no,
+        )
@@ -0,0 +1,266 @@
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import bisect
+import collections
+import threading
+
+_INF = float('inf')
+
+
+class TriggerBook(object):
+    '''
+    Resting triggers of one symbol sorted by price level. ``above``
+    triggers fire once the price reaches their level from below (buy
+    stops, sell limits), ``below`` ones once it falls to their level (sell
+    stops, buy limits).
+
+    Trailing stops also keep the price they trail, sorted: the highest
+    price seen for those below (``peaks``), the lowest for those above
+    (``troughs``). A price beyond some of them moves just those.
+
+    ``cross`` and ``follow`` find the triggers a price fires or moves by
+    bisection, a tick costs O(log n) whatever the number of resting
+    triggers. The prices given must be traded ones: 0.0 (no trade yet)
+    would cross every ``below`` trigger and drag the trailing ones.
+    '''
+
+    def __init__(self):
+        self.above = []  # sorted (level, oref)
+        self.below = []  # sorted (level, oref)
+        self.peaks = []  # sorted (highest price, oref), trailing below
+        self.troughs = []  # sorted (lowest price, oref), trailing above
+        self._keys = dict()  # oref -> (level, above)
+        self._trails = dict()  # oref -> (extreme, amount, percent)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, oref):
+        return oref in self._keys
+
+    def level(self, oref):
+        return self._keys[oref][0]
+
+    def add(self, oref, level, above):
+        bisect.insort(self.above if above else self.below, (level, oref))
+        self._keys[oref] = (level, above)
+
+    def addtrail(self, oref, level, above, amount=0.0, percent=0.0):
+        '''
+        Adds a stop at ``level`` trailing the price by ``amount`` or by
+        ``percent`` (a fraction) of it
+        '''
+        if above:  # buy stop, above the lowest price
+            extreme = level - amount if amount else level / (1 + percent)
+            bisect.insort(self.troughs, (extreme, oref))
+        else:
+            extreme = level + amount if amount else level / (1 - percent)
+            bisect.insort(self.peaks, (extreme, oref))
+        self._trails[oref] = (extreme, amount, percent)
+        self.add(oref, level, above)
+
+    def remove(self, oref):
+        '''Removes the trigger of ``oref``. Returns ``False`` if none'''
+        key = self._keys.pop(oref, None)
+        if key is None:
+            return False
+        side = self.above if key[1] else self.below
+        del side[bisect.bisect_left(side, (key[0], oref))]
+        self._untrail(oref, key[1])
+        return True
+
+    def _untrail(self, oref, above):
+        trail = self._trails.pop(oref, None)
+        if trail is not None:
+            extremes = self.troughs if above else self.peaks
+            del extremes[bisect.bisect_left(extremes, (trail[0], oref))]
+
+    def cross(self, price):
+        '''
+        Removes and returns the ``(level, oref)`` of the triggers fired by
+        ``price``, the nearest levels first
+        '''
+        fired = []
+        above, below = self.above, self.below
+        if above and price >= above[0][0]:
+            i = bisect.bisect_right(above, (price, _INF))
+            fired = above[:i]
+            del above[:i]
+        if below and price <= below[-1][0]:
+            i = bisect.bisect_left(below, (price, -_INF))
+            fired.extend(reversed(below[i:]))
+            del below[i:]
+
+        keys, trails = self._keys, self._trails
+        for _, oref in fired:
+            side = keys.pop(oref)[1]
+            if trails:
+                self._untrail(oref, side)
+        return fired
+
+    def follow(self, price):
+        '''Moves the trailing stops ``price`` is beyond'''
+        peaks, troughs = self.peaks, self.troughs
+        if peaks and price > peaks[0][0]:
+            i = bisect.bisect_left(peaks, (price, -_INF))
+            moved = peaks[:i]
+            del peaks[:i]
+            for _, oref in moved:
+                _, amount, percent = self._trails[oref]
+                self._move(oref, price - (amount or price * percent), False)
+                self._trails[oref] = (price, amount, percent)
+                bisect.insort(peaks, (price, oref))
+
+        if troughs and price < troughs[-1][0]:
+            i = bisect.bisect_right(troughs, (price, _INF))
+            moved = troughs[i:]
+            del troughs[i:]
+            for _, oref in moved:
+                _, amount, percent = self._trails[oref]
+                self._move(oref, price + (amount or price * percent), True)
+                self._trails[oref] = (price, amount, percent)
+                bisect.insort(troughs, (price, oref))
+
+    def _move(self, oref, level, above):
+        side = self.above if above else self.below
+        old = self._keys[oref][0]
+        del side[bisect.bisect_left(side, (old, oref))]
+        bisect.insort(side, (level, oref))
+        self._keys[oref] = (level, above)
+
+
+class Triggers(object):
+    '''
+    Orders held by the broker until the price of their symbol reaches
+    their level, in a ``TriggerBook`` per symbol.
+
+    The quote api calls ``tick`` with the last price of every tick, in its
+    own thread, right after storing the tick. The orders it fires are
+    handed to ``send(oref, request)`` there and then (``request`` as given
+    to ``add``, with the limit price of trailing stop limits updated) and
+    queued for the broker to collect. Only the symbols with triggers cost
+    more than a dictionary lookup. Prices of 0.0 (snapshots before the
+    first trade) are ignored.
+
+    Triggers added with the same ``group`` (the children of a bracket, an
+    oco group) are one-cancels-all: the first fired takes the others out
+    of the books in the same tick, the broker cancels them when it
+    collects it.
+
+    With the store's ``latency`` monitor the time from the tick to the
+    ``InsertOrder`` of the orders it fired is recorded (``trigger``
+    stage).
+    '''
+
+    def __init__(self, send=None, latency=None):
+        self.send = send
+        self.latency = latency
+        self.books = dict()  # symbol key (ring key) -> TriggerBook
+        self.fired = collections.deque()  # (oref, level, sent), for next
+        self._orders = dict()  # oref -> (ticker, request, group, offset)
+        self._groups = dict()  # group -> orefs
+        self._sent = set()  # orefs fired and not yet collected
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, oref):
+        return oref in self._orders
+
+    def add(self, oref, ticker, level, above, request, group=None,
+            amount=0.0, percent=0.0, offset=None):
+        '''
+        Rests ``oref`` on ``level`` of symbol ``ticker`` (the key of its
+        ring, see ``xtpstore.symbol_key``), trailing the price by ``amount``
+        or ``percent`` if given, the limit price of the request then
+        staying ``offset`` below the stop level
+        '''
+        with self._lock:
+            book = self.books.get(ticker)
+            if book is None:
+                book = self.books[ticker] = TriggerBook()
+            if amount or percent:
+                book.addtrail(oref, level, above, amount, percent)
+            else:
+                book.add(oref, level, above)
+            self._orders[oref] = (ticker, request, group, offset)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(oref)
+
+    def remove(self, oref):
+        '''
+        Takes ``oref`` out of the books. Returns ``False`` if it has
+        already been fired (and sent)
+        '''
+        with self._lock:
+            if oref in self._sent:
+                return False
+            self._drop(oref)
+            return True
+
+    def _drop(self, oref):
+        entry = self._orders.pop(oref, None)
+        if entry is None:
+            return
+        ticker, _, group, _ = entry
+        book = self.books[ticker]
+        book.remove(oref)
+        if not book:
+            del self.books[ticker]
+        members = self._groups.get(group)
+        if members is not None:
+            members.discard(oref)
+            if not members:
+                del self._groups[group]
+
+    def level(self, oref):
+        '''Returns the current level of resting trigger ``oref``'''
+        with self._lock:
+            return self.books[self._orders[oref][0]].level(oref)
+
+    def tick(self, ticker, price):
+        '''Quote thread: applies ``price``, the last one of ``ticker``'''
+        book = self.books.get(ticker)
+        if book is None or price <= 0.0:
+            return  # no triggers, or no trade yet (pre-open, auctions)
+
+        with self._lock:
+            for level, oref in book.cross(price):
+                entry = self._orders.pop(oref, None)
+                if entry is None:
+                    continue  # dropped by a member of its group
+                _, request, group, offset = entry
+                if group is not None:
+                    for other in self._groups.pop(group):
+                        if other != oref:
+                            self._drop(other)
+                self._fire(oref, ticker, request, level, offset)
+
+            if book.peaks or book.troughs:
+                book.follow(price)
+            if not book and self.books.get(ticker) is book:
+                del self.books[ticker]
+
+    def _fire(self, oref, ticker, request, level, offset):
+        self._sent.add(oref)
+        if offset is not None:  # trailing stop limit
+            request = request[:5] + (round(level - offset, 2),) + \
+                request[6:]
+        if self.latency is not None:
+            self.latency.triggered(oref, ticker)
+        sent = self.send is not None and self.send(oref, request)
+        self.fired.append((oref, level, bool(sent)))
+
+    def collect(self):
+        '''
+        Strategy thread: returns the ``(oref, level, sent)`` of the orders
+        fired since the last call
+        '''
+        fired = self.fired
+        out = [fired.popleft() for _ in range(len(fired))]
+        if out:
+            with self._lock:
+                self._sent.difference_update(oref for oref, _, _ in out)
+        return out
@@ -3,12 +3,16 @@ from __future__ import (absolute_import, division, print_function,
 
 import collections
 
+import numpy as np
+
 from backtrader import BrokerBase, Order, BuyOrder, SellOrder
-from backtrader.utils.py3 import with_metaclass, iteritems
+from backtrader.utils.py3 import with_metaclass
 from backtrader.comminfo import CommInfoBase
-from backtrader.position import Position
 
 from xtp_backtrader_api import xtpstore
+from xtp_backtrader_api.basket import Basket
+from xtp_backtrader_api.ledger import Ledger, PositionView
+from xtp_backtrader_api.ordergateway import OrderGateway
 
 
 class XTPCommInfo(CommInfoBase):
@@ -47,10 +51,58 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
         provider use the existing positions to kickstart the broker.
 
         Set to ``False`` during instantiation to disregard any existing
-        position
+        position. Positions are then only tracked from the fills and never
+        reconciled against the broker
+
+      - ``tolerance`` (default: ``1.0``): cash difference with the broker
+        which is adopted silently when reconciling
+
+      - ``starttimeout`` (default: ``5.0``): seconds to wait at start for
+        the account to be queried
+
+      - ``risk`` (default: ``None``): ``RiskEngine`` checking every order
+        before it is sent. Orders it refuses are rejected with a store
+        notification giving the reason
+
+    Positions and cash are kept in a ``Ledger`` which applies fills as they
+    are reported. It is reconciled with the account queried by the store
+    every ``reconcile`` seconds (store parameter) or as soon as a fill
+    leaves it inconsistent, and discrepancies are reported as store
+    notifications. The cash alone is refreshed every ``assetrefresh``
+    seconds (store parameter).
+
+    The portfolio value is marked to market with the last tick of each
+    position once per ``next`` and ``getvalue``/``getcash`` return the
+    cached values without calling the trade server.
+
+    XTP has no contingent orders, they are managed by the broker itself:
+
+      - ``Stop``, ``StopLimit``, ``StopTrail`` and ``StopTrailLimit``
+        orders are accepted and held locally until the price reaches their
+        stop, they are then sent as a market order (a limit order at
+        ``plimit`` for the limit ones). Trailing stops follow the price by
+        ``trailamount`` or ``trailpercent``
+
+      - the children of a bracket (``parent``/``transmit``) are held until
+        the parent has been completely filled. The ``Limit`` and ``Stop``
+        children then rest on their price and the first one triggered is
+        sent, the others are cancelled. If the parent is cancelled or
+        rejected so are the children
+
+      - the orders of an ``oco`` group are cancelled as soon as one of
+        them is triggered, gets a fill or is cancelled
+
+    The held orders are checked against every tick by the quote callback
+    (the store's ``Triggers``, levels sorted by symbol), which sends those
+    triggered right away. The broker is told in its next ``next``. Held
+    orders go through the ``risk`` checks when they start resting on their
+    price, not when triggered.
     """
     params = (
         ('use_positions', True),
+        ('tolerance', 1.0),
+        ('starttimeout', 5.0),
+        ('risk', None),
     )
 
     def __init__(self, **kwargs):
@@ -64,43 +116,39 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
         self.opending = collections.defaultdict(list)  # pending transmission
         self.brackets = dict()  # confirmed brackets
 
+        self.ledger = Ledger(tolerance=self.p.tolerance, rings=self.o.rings)
+        self.risk = self.p.risk
+        if self.risk is not None and self.risk.rings is None:
+            self.risk.rings = self.o.rings
+        self._keys = dict()  # data -> symbol key of ledger, risk, triggers
+        self._indices = dict()  # ids of a list of datas -> ledger slots
+        self._views = dict()  # data -> PositionView handed by getposition
+        self._baskets = dict()  # order ref -> Basket of the live legs
+        self.triggers = self.o.triggers  # armed stops and children
+        self.triggers.send = self._t_send
+        self._held = set()  # refs of the orders accepted but not yet sent
+        self._ocos = dict()  # order ref -> ref of its oco group leader
+        self._ocol = dict()  # oco group leader ref -> member refs
+
         self.startingcash = self.cash = 0.0
         self.startingvalue = self.value = 0.0
         self.addcommissioninfo(self, XTPCommInfo(mult=1.0, stocklike=False))
 
-    def update_positions(self):
-        """
-        this method syncs the XTP real broker positions and the Backtrader
-        broker instance. the positions is defined in BrokerBase(in getposition)
-        and used in bbroker (the backtrader broker instance) with Data as the
-        key. so we do the same here. we create a defaultdict of Position() with
-        data as the key.
-        :return: collections.defaultdict ({data: Position})
-        """
-        positions = collections.defaultdict(Position)
-        if self.p.use_positions:
-            broker_positions = self.o.oapi.list_positions()
-            broker_positions_symbols = [p.symbol for p in broker_positions]
-            broker_positions_mapped_by_symbol = \
-                {p.symbol: p for p in broker_positions}
-
-            for name, data in iteritems(self.cerebro.datasbyname):
-                if name in broker_positions_symbols:
-                    size = int(broker_positions_mapped_by_symbol[name].qty)
-                    positions[data] = Position(
-                        size,
-                        float(broker_positions_mapped_by_symbol[
-                            name].avg_entry_price)
-                    )
-        return positions
-
     def start(self):
         super(XTPBroker, self).start()
         self.addcommissioninfo(self, XTPCommInfo(mult=1.0, stocklike=False))
         self.o.start(broker=self)
-        self.startingcash = self.cash = self.o.get_cash()
-        self.startingvalue = self.value = self.o.get_value()
-        self.positions = self.update_positions()
+        if self.o.poller is not None:
+            snapshot = self.o.poller.wait(self.p.starttimeout)
+            if snapshot is not None:
+                self.ledger.reconcile(snapshot, self.p.use_positions)
+            else:
+                self.o.put_notification('Account not available at start')
+
+        if self.risk is not None:
+            self.risk.reset(self.ledger)
+        self.startingcash = self.cash = self.ledger.cash
+        self.startingvalue = self.value = self._markvalue()
 
     def data_started(self, data):
         pos = self.getposition(data)
@@ -142,8 +190,7 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
         self.o.stop()
 
     def getcash(self):
-        # This call cannot block if no answer is available from XTP
-        self.cash = cash = self.o.get_cash()
+        self.cash = cash = self.ledger.cash
         return cash
 
     def getvalue(self, datas=None):
@@ -154,31 +201,323 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
         :return: float
         """
         if not datas:
-            # don't use self.o.get_value(). it takes time for local store to
-            # get update from broker.
-            self.value = float(self.o.oapi.get_account().portfolio_value)
+            # marked to market in next()
             return self.value
-        else:
-            # let's calculate the value of the positions
-            total_value = 0
-            for d in datas:
-                pos = self.getposition(d)
-                if pos.size:
-                    price = list(d)[0]
-                    total_value += price * pos.size
-            return total_value
+
+        # let's calculate the value of the positions
+        key = tuple(map(id, datas))  # lines objects overload ==
+        index = self._indices.get(key)
+        if index is None:
+            index = self._indices[key] = np.array(
+                [self.ledger.slot(self._key(d)) for d in datas],
+                dtype=np.intp)
+        return self.ledger.marketvalue(index)
+
+    def _markvalue(self):
+        return self.ledger.cash + self.ledger.marketvalue()
+
+    def _key(self, data):
+        key = self._keys.get(data)
+        if key is None:
+            key = self._keys[data] = xtpstore.symbol_key(data.p.dataname)
+        return key
 
     def getposition(self, data, clone=True):
-        pos = self.positions[data]
-        if clone:
-            pos = pos.clone()
+        '''
+        With ``clone`` a ``PositionView`` over the ledger is returned: it
+        reads the live position and only copies it if written to. The view
+        is reused across calls, reads allocate nothing
+        '''
+        if not clone:
+            return self.ledger.position(self._key(data))
 
-        return pos
+        view = self._views.get(data)
+        if view is None:
+            pos = self.ledger.position(self._key(data))
+            view = self._views[data] = PositionView(pos, self._views, data)
+
+        return view
 
     def orderstatus(self, order):
         o = self.orders[order.ref]
         return o.status
 
+    def _submit(self, oref):
+        order = self.orders[oref]
+        if order.status == order.Accepted:  # held here, now triggered
+            return
+        order.submit(self)
+        self.notify(order)
+
+    def _reject(self, oref):
+        if self.risk is not None:
+            self.risk.release(oref)
+        self._basketend(oref)
+        self._held.discard(oref)
+        order = self.orders[oref]
+        order.reject(self)
+        self.notify(order)
+        self._ococheck(order)
+        self._bracketize(order, cancel=True)
+
+    def _accept(self, oref):
+        order = self.orders[oref]
+        if order.status != order.Submitted:
+            return
+        order.accept()
+        self.notify(order)
+
+    def _cancel(self, oref):
+        if self.risk is not None:
+            self.risk.release(oref)
+        self._basketend(oref)
+        if oref in self._held:
+            self._held.discard(oref)
+            self.triggers.remove(oref)  # may be firing, then gone anyway
+        order = self.orders[oref]
+        if not order.alive():
+            return
+        order.cancel()
+        self.notify(order)
+        self._ococheck(order)
+        self._bracketize(order, cancel=True)
+
+    def _fill(self, oref, size, price, **kwargs):
+        order = self.orders[oref]
+        if order.status == order.Submitted:  # filled before being queued
+            order.accept()
+            self.notify(order)
+
+        data = order.data
+        key = self._key(data)
+        pprice_orig = self.ledger.position(key).price
+        psize, pprice, opened, closed = self.ledger.fill(key, size, price)
+        if self.risk is not None:
+            self.risk.filled(oref, key, size, psize, pprice)
+
+        comminfo = self.getcommissioninfo(data)
+
+        closedvalue = closedcomm = 0.0
+        openedvalue = openedcomm = 0.0
+        margin = pnl = 0.0
+        if closed:  # valued at the price the position was opened at
+            closedvalue = comminfo.getoperationcost(closed, pprice_orig)
+            closedcomm = comminfo.getcommission(closed, price)
+            pnl = comminfo.profitandloss(-closed, pprice_orig, price)
+        if opened:
+            openedvalue = comminfo.getoperationcost(opened, price)
+            openedcomm = comminfo.getcommission(opened, price)
+
+        order.execute(data.datetime[0], size, price,
+                      closed, closedvalue, closedcomm,
+                      opened, openedvalue, openedcomm,
+                      margin, pnl,
+                      psize, pprice)
+
+        if order.executed.remsize:
+            order.partial()
+        else:
+            order.completed()
+
+        basket = self._baskets.get(oref)
+        if basket is not None:
+            basket._fill(basket.legs[oref], size, price)
+            if not order.executed.remsize:
+                del self._baskets[oref]
+
+        self.notify(order)
+        if self._ocos:
+            self._ococheck(order)
+        if not order.executed.remsize and self.brackets:
+            self._bracketize(order)
+
+    def _basketend(self, oref):
+        basket = self._baskets.pop(oref, None)
+        if basket is not None:
+            basket._end(basket.legs[oref])
+
+    _STOPS = (Order.Stop, Order.StopLimit, Order.StopTrail,
+              Order.StopTrailLimit)
+
+    def _ocoize(self, order, oco):
+        leader = self._ocos.setdefault(oco.ref, oco.ref)
+        group = self._ocol.setdefault(leader, [leader])
+        self._ocos[order.ref] = leader
+        group.append(order.ref)
+
+    def _ococheck(self, order):
+        # the first member triggered, filled or ended ends the group
+        leader = self._ocos.get(order.ref)
+        if leader is None:
+            return
+        for oref in self._ocol.pop(leader):
+            del self._ocos[oref]
+            if oref != order.ref:
+                self._cancelother(self.orders[oref])
+
+    def _bracketize(self, order, cancel=False):
+        oref = order.ref
+        pref = getattr(order.parent, 'ref', oref)
+        children = self.brackets.get(pref)
+        if children is None:
+            return
+
+        if oref == pref and not cancel:  # parent done, arm the children
+            for child in children:
+                child.activate()
+                self._arm(child)
+            return
+
+        # parent gone or a child triggered/done: the others are cancelled
+        del self.brackets[pref]
+        for child in children:
+            if child is not order:
+                self._cancelother(child)
+
+    def _cancelother(self, order):
+        if order.status == order.Created or (
+                order.ref in self._held and self.triggers.remove(order.ref)):
+            self._cancel(order.ref)  # never sent
+        elif order.alive():
+            self.o.order_cancel(order)
+
+    def _hold(self, order):
+        # accepted by the broker, sent later
+        self._held.add(order.ref)
+        order.submit(self)
+        order.accept()
+        self.notify(order)
+
+    def _arm(self, order):
+        '''Rests an active held order on its trigger price'''
+        exectype = order.exectype
+        if exectype in self._STOPS:
+            above = order.isbuy()  # buy stops fire on the way up
+        elif exectype == Order.Limit:
+            above = order.issell()
+        else:  # market child of a bracket, nothing to wait for
+            self._held.discard(order.ref)
+            self._transmit(order)
+            return
+
+        if self.risk is not None and not self._admit(order):
+            return
+        request = self.o.order_request(order)
+        if request is None:
+            self.o.put_notification('Unsupported order type', order.ref,
+                                    exectype)
+            self._reject(order.ref)
+            return
+
+        # the children of a bracket and oco groups: one fires, one is sent
+        group = None
+        if order.parent is not None:
+            group = ('bracket', order.parent.ref)
+        elif order.ref in self._ocos:
+            group = ('oco', self._ocos[order.ref])
+
+        offset = None
+        if exectype == Order.StopTrailLimit:
+            offset = order._limitoffset
+        self.triggers.add(order.ref, self._key(order.data),
+                          order.created.price, above, request, group,
+                          amount=order.created.trailamount or 0.0,
+                          percent=order.created.trailpercent or 0.0,
+                          offset=offset)
+
+    def _t_send(self, oref, request):
+        # quote thread: a held order was triggered
+        gateway = self.o.gateway
+        if gateway is None:
+            return False
+        gateway.submitmany((request,))
+        return True
+
+    def _triggered(self, oref, level, sent):
+        order = self.orders[oref]
+        self._held.discard(oref)
+        order.triggered = True
+        if order.exectype in (Order.StopTrail, Order.StopTrailLimit):
+            order.created.price = level  # where it had trailed to
+            if order.exectype == Order.StopTrailLimit:
+                order.created.pricelimit = round(
+                    level - order._limitoffset, 2)
+        if not sent:
+            self.o.put_notification('Trader not connected', oref)
+            self._reject(oref)
+            return
+
+        self._ococheck(order)
+        if order.parent is not None:
+            self._bracketize(order)
+
+    def _place(self, order, entry=0):
+        pref = getattr(order.parent, 'ref', order.ref)
+        if pref != order.ref and pref not in self.opending:
+            if pref not in self.brackets:  # parent gone (e.g. rejected)
+                self.orders[order.ref] = order
+                order.reject(self)
+                self.notify(order)
+                return order
+
+            # added to a bracket already sent
+            self.orders[order.ref] = order
+            self.brackets[pref].append(order)
+            self._hold(order)
+            if order.parent.status == Order.Completed:
+                order.activate()
+                self._arm(order)
+            return order
+
+        pending = self.opending[pref]
+        pending.append(order)
+        if not order.transmit:
+            return order  # waits for the last order of the bracket
+
+        del self.opending[pref]
+        parent, children = pending[0], pending[1:]
+        for child in children:
+            self.orders[child.ref] = child
+        if children:
+            self.brackets[pref] = children
+
+        if parent.exectype in self._STOPS:
+            self.orders[parent.ref] = parent
+            self._hold(parent)
+            self._arm(parent)
+        else:
+            self._transmit(parent, entry)
+
+        if pref in self.brackets:  # parent not rejected right away
+            for child in children:
+                self._hold(child)
+        return order
+
+    def _transmit(self, order, entry=0):
+        self.orders[order.ref] = order
+        if entry:
+            self.o.latency.ordered(order.ref, entry)
+        if self.risk is not None and not self._admit(order):
+            return order
+        return self.o.order_create(order)
+
+    def _admit(self, order):
+        price = None  # market orders are valued at the last price
+        if order.exectype == Order.Limit:
+            price = order.created.price
+        elif order.exectype in (Order.StopLimit, Order.StopTrailLimit):
+            price = order.created.pricelimit
+        reason = self.risk.admit(order.ref, self._key(order.data),
+                                 order.isbuy(), abs(order.created.size),
+                                 price, self.ledger.cash)
+        if reason is None:
+            return True
+
+        self.o.put_notification('Order rejected by risk check', order.ref,
+                                reason)
+        self._reject(order.ref)
+        return False
+
     def buy(self, owner, data,
             size, price=None, plimit=None,
             exectype=None, valid=None, tradeid=0, oco=None,
@@ -186,6 +525,8 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
             parent=None, transmit=True,
             **kwargs):
 
+        latency = self.o.latency
+        entry = latency.now() if latency is not None else 0
         order = BuyOrder(owner=owner, data=data,
                          size=size, price=price, pricelimit=plimit,
                          exectype=exectype, valid=valid, tradeid=tradeid,
@@ -194,7 +535,9 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
 
         order.addinfo(**kwargs)
         order.addcomminfo(self.getcommissioninfo(data))
-        return self._transmit(order)
+        if oco is not None:
+            self._ocoize(order, oco)
+        return self._place(order, entry)
 
     def sell(self, owner, data,
              size, price=None, plimit=None,
@@ -203,6 +546,8 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
              parent=None, transmit=True,
              **kwargs):
 
+        latency = self.o.latency
+        entry = latency.now() if latency is not None else 0
         order = SellOrder(owner=owner, data=data,
                           size=size, price=price, pricelimit=plimit,
                           exectype=exectype, valid=valid, tradeid=tradeid,
@@ -211,18 +556,78 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
 
         order.addinfo(**kwargs)
         order.addcomminfo(self.getcommissioninfo(data))
-        return self._transmit(order)
+        if oco is not None:
+            self._ocoize(order, oco)
+        return self._place(order, entry)
+
+    def submit_basket(self, owner, datas, sizes, prices=None, lot=100,
+                      **kwargs):
+        """
+        Sends the orders of a basket (a rebalance, a program trade) at once
+        and returns a ``Basket`` following their execution.
+
+        ``sizes`` holds the signed shares to trade for each of ``datas``
+        (positive buys, 0 skips the data) and ``prices`` their limit
+        prices, market orders are sent if ``None``. The whole basket is
+        checked before anything is sent: a ``ValueError`` names the legs
+        with fractional sizes, buys not in multiples of ``lot`` shares or
+        prices which are not positive. The orders then go through the risk
+        checks one by one and are handed to the order gateway in a single
+        batch, which its worker thread sends back to back.
+
+        ``kwargs`` are added as info to every order.
+        """
+        sizes = np.asarray(sizes, dtype=np.float64)
+        if sizes.shape != (len(datas),):
+            raise ValueError('submit_basket needs a size per data')
+        bad = ~np.isfinite(sizes) | (sizes != np.round(sizes))
+        bad |= (sizes > 0) & (sizes % lot != 0)
+        if prices is not None:
+            prices = np.asarray(prices, dtype=np.float64)
+            if prices.shape != sizes.shape:
+                raise ValueError('submit_basket needs a price per data')
+            bad |= (sizes != 0) & ~(prices > 0)
+        if bad.any():
+            raise ValueError('Invalid basket legs: %s' % ', '.join(
+                datas[leg].p.dataname for leg in np.flatnonzero(bad)))
+
+        legs = np.flatnonzero(sizes)
+        exectype = Order.Market if prices is None else Order.Limit
+        legprices = [None] * len(legs) if prices is None else \
+            prices[legs].tolist()
+        orders, codes = [], []
+        for leg, size, price in zip(legs.tolist(), sizes[legs].tolist(),
+                                    legprices):
+            data = datas[leg]
+            ordercls = BuyOrder if size > 0 else SellOrder
+            order = ordercls(owner=owner, data=data, size=abs(size),
+                             price=price, exectype=exectype)
+            order.addinfo(**kwargs)
+            order.addcomminfo(self.getcommissioninfo(data))
+            self.orders[order.ref] = order
+            orders.append(order)
+            codes.append(self._key(data)[1].decode('utf-8'))
+
+        basket = Basket(orders, codes, sizes[legs])
+        for oref in basket.refs:
+            self._baskets[oref] = basket
+        if self.risk is not None:
+            orders = [order for order in orders if self._admit(order)]
+        self.o.order_create_many(orders)
+        return basket
 
     def cancel(self, order):
         if not self.orders.get(order.ref, False):
             return
         if order.status == Order.Cancelled:  # already cancelled
             return
+        if order.ref in self._held and self.triggers.remove(order.ref):
+            self._cancel(order.ref)  # never sent
+            return order
 
         return self.o.order_cancel(order)
 
     def notify(self, order):
-        self.positions = self.update_positions()
         self.notifs.append(order.clone())
 
     def get_notification(self):
@@ -232,4 +637,46 @@ class XTPBroker(with_metaclass(MetaXTPBroker, BrokerBase)):
         return self.notifs.popleft()
 
     def next(self):
+        # held orders the quote thread triggered and sent
+        for fired in self.triggers.collect():
+            self._triggered(*fired)
+
+        # apply everything the trader api reported since the last call
+        gateway = self.o.gateway
+        if gateway is not None:
+            for event in gateway.drain():
+                self._GatewayEvents[event[0]](self, *event[1:])
+
+        poller = self.o.poller
+        if poller is not None:
+            if self.ledger.drift:
+                poller.request()
+            for snapshot in poller.drain():
+                self._reconcile(snapshot)
+
+        self.cash = self.ledger.cash
+        self.value = self._markvalue()
         self.notifs.append(None)  # mark notification boundary
+
+    def _reconcile(self, snapshot):
+        diffs = self.ledger.reconcile(snapshot, self.p.use_positions)
+        if diffs is None:
+            return  # fills arrived since, wait for the next query
+
+        if self.risk is not None:
+            self.risk.reset(self.ledger, sellable=False)
+
+        for code, local, broker in diffs:
+            self.o.put_notification('Ledger discrepancy', code,
+                                    local=local, broker=broker)
+
+    def _gateway_reject(self, oref, reason):
+        self.o.put_notification('Order rejected', oref, reason)
+        self._reject(oref)
+
+    _GatewayEvents = {
+        OrderGateway.ACCEPTED: _accept,
+        OrderGateway.FILL: _fill,
+        OrderGateway.CANCELLED: _cancel,
+        OrderGateway.REJECTED: _gateway_reject,
+    }
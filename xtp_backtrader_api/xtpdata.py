@@ -1,7 +1,10 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
-from datetime import datetime, timedelta
+import collections
+from datetime import date, timedelta
+
+import numpy as np
 
 from backtrader.feed import DataBase
 from backtrader import date2num, num2date
@@ -9,6 +12,182 @@ from backtrader.utils.py3 import queue, with_metaclass
 import backtrader as bt
 
 from xtp_backtrader_api import xtpstore
+from xtp_backtrader_api.barbuilder import BarBuilder, OrderFlowBuilder
+from xtp_backtrader_api.tickbuffer import TickRingBuffer
+
+
+def graceclock(now, grace):
+    '''
+    Returns ``now`` (a ``datetime`` in exchange time, see
+    ``XTPStore.now``) minus ``grace`` seconds as an XTP ``data_time``
+    '''
+    now = now - timedelta(seconds=grace)
+    day = (now.year * 100 + now.month) * 100 + now.day
+    secs = (now.hour * 100 + now.minute) * 100 + now.second
+    return (day * 1000000 + secs) * 1000 + now.microsecond // 1000
+
+
+def waittime(data, builder=None):
+    '''
+    Returns how long a live ``data`` with nothing to deliver may wait for
+    events: its ``qcheck`` time, but no longer than until the pending bar
+    of ``builder`` (a ``BarBuilder``, if any) is forced out
+    '''
+    wait = data._qcheck
+    edge = builder.pending() if builder is not None else None
+    if edge is not None and wait > 0.0:
+        now = date2num(data.o.now() + data._timeoffset())
+        due = (data._dtconv(edge) - now) * 86400.0 + data.p.bargrace
+        wait = min(wait, max(due, 0.0))
+    return wait
+
+
+class DataTimeConverter(object):
+    '''
+    Converts XTP ``data_time`` integers (YYYYMMDDHHMMSSsss) to backtrader
+    float dates with integer arithmetic instead of ``strptime`` and
+    ``date2num``.
+
+    The ordinal of the last trading day seen is cached, so that converting
+    a tick only computes the intraday offset. ``convert`` does the same for
+    a whole numpy array at once.
+    '''
+
+    MS_PER_DAY = 86400000.0
+
+    def __init__(self):
+        self._day = None
+        self._base = 0.0
+
+    def ordinal(self, day):
+        '''Returns the float ordinal of ``day`` (YYYYMMDD)'''
+        if day != self._day:
+            self._base = float(
+                date(day // 10000, day // 100 % 100, day % 100).toordinal())
+            self._day = day
+
+        return self._base
+
+    def __call__(self, data_time):
+        day, clock = divmod(data_time, 1000000000)
+        base = self._base if day == self._day else self.ordinal(day)
+        hhmm, ms = divmod(clock, 100000)
+        hh, mm = divmod(hhmm, 100)
+        return base + ((hh * 60 + mm) * 60000 + ms) / self.MS_PER_DAY
+
+    def convert(self, data_times):
+        '''Converts an array of ``data_time`` values'''
+        data_times = np.asarray(data_times, dtype=np.int64)
+        days, clock = np.divmod(data_times, 1000000000)
+        hhmm, ms = np.divmod(clock, 100000)
+        hh, mm = np.divmod(hhmm, 100)
+        offset = ((hh * 60 + mm) * 60000 + ms) / self.MS_PER_DAY
+
+        if not len(days) or (days == days[0]).all():
+            return offset + (self.ordinal(int(days[0])) if len(days) else 0)
+
+        udays, where = np.unique(days, return_inverse=True)
+        bases = np.array([self.ordinal(int(day)) for day in udays])
+        return offset + bases[where]
+
+
+def barcolumns(bars, dtconv=None):
+    '''
+    Returns the columns of ``bars`` (``BAR_DTYPE`` records) as float64
+    arrays by line name, the ``data_time`` converted to the ``datetime``
+    line with ``dtconv`` (a ``DataTimeConverter``)
+    '''
+    columns = dict((name, np.asarray(bars[name], dtype=np.float64))
+                   for name in ('open', 'high', 'low', 'close', 'volume',
+                                'openinterest'))
+    dtconv = dtconv or DataTimeConverter()
+    columns['datetime'] = dtconv.convert(bars['data_time'])
+    return columns
+
+
+def preloadcolumns(data, columns):
+    '''
+    Preloads ``data`` with ``columns`` (float64 arrays by line name, see
+    ``barcolumns``), assigning each line buffer at once. Lines without a
+    column get ``NaN``. Bars outside ``fromdate`` and ``todate`` are left
+    out as ``load`` would.
+
+    Returns ``False``, having done nothing, if the bars have to go one by
+    one through ``load``: filters, an input timezone or ``qbuffer`` lines
+    '''
+    if data._filters or data._ffilters or data._tzinput or \
+            any(line.mode == line.QBuffer for line in data.lines):
+        return False
+
+    dts = columns['datetime']
+    keep = (dts >= data.fromdate) & (dts <= data.todate)
+    count = int(keep.sum())
+    nans = np.full(count, np.nan).tobytes()
+    for alias, line in zip(data.lines.getlinealiases(), data.lines):
+        values = columns.get(alias)
+        line.array.frombytes(nans if values is None else
+                             np.ascontiguousarray(values[keep]).tobytes())
+        line.idx, line.lencount = count - 1, count  # as load() leaves it
+
+    data._last()
+    data.home()
+    return True
+
+
+class DepthBook(object):
+    '''
+    Order book levels of the bars (or ticks) delivered by a data, one row
+    per bar in preallocated numpy columns ``bid``, ``ask`` (prices) and
+    ``bid_qty``, ``ask_qty`` (volumes), each of shape ``(rows, levels)``.
+
+    ``columns`` returns views over the rows filled so far, so indicators can
+    work on whole levels or the whole history with vectorized operations.
+    The buffers double when full.
+    '''
+
+    NAMES = ('bid', 'ask', 'bid_qty', 'ask_qty')
+    DTYPES = (np.float64, np.float64, np.int64, np.int64)
+
+    def __init__(self, levels, capacity=256):
+        self.levels = levels
+        self._len = 0
+        self._buffers = [np.zeros((capacity, levels), dtype=dtype)
+                         for dtype in self.DTYPES]
+
+    def __len__(self):
+        return self._len
+
+    def append(self, bid, ask, bid_qty, ask_qty):
+        n = self._len
+        if n == len(self._buffers[0]):
+            self._buffers = [np.concatenate([buf, np.zeros_like(buf)])
+                             for buf in self._buffers]
+
+        for buf, row in zip(self._buffers, (bid, ask, bid_qty, ask_qty)):
+            buf[n] = row
+        self._len = n + 1
+
+    def columns(self):
+        '''Returns a dictionary of the filled rows of every column'''
+        n = self._len
+        return dict((name, buf[:n])
+                    for name, buf in zip(self.NAMES, self._buffers))
+
+    @property
+    def bid(self):
+        return self._buffers[0][:self._len]
+
+    @property
+    def ask(self):
+        return self._buffers[1][:self._len]
+
+    @property
+    def bid_qty(self):
+        return self._buffers[2][:self._len]
+
+    @property
+    def ask_qty(self):
+        return self._buffers[3][:self._len]
 
 
 class MetaXTPData(DataBase.__class__):
@@ -19,13 +198,50 @@ class MetaXTPData(DataBase.__class__):
         # Initialize the class
         super(MetaXTPData, cls).__init__(name, bases, dct)
 
-        # Register with the store
-        xtpstore.XTPStore.DataCls = cls
+        # Register with the store, unless it is a generated depth class
+        if not dct.get('_depthlevels'):
+            xtpstore.XTPStore.DataCls = cls
+
+    def __call__(cls, *args, **kwargs):
+        # depth lines are declared by a subclass with the requested levels
+        levels = kwargs.get('depthlevels', 0)
+        if levels and levels != cls._depthlevels:
+            cls = cls.withdepth(levels)
+
+        return super(MetaXTPData, cls).__call__(*args, **kwargs)
 
 
 class XTPData(with_metaclass(MetaXTPData, DataBase)):
     """
     XTP Data Feed.
+
+    With ``depthlevels`` set to ``n`` (1-10) the data gets the order book of
+    each bar (as of its last tick) or tick: lines ``bid1``..``bidn``,
+    ``ask1``..``askn``, ``bidvol1``..``bidvoln`` and ``askvol1``..``askvoln``
+    and the same values in ``depth``, a ``DepthBook`` of numpy columns.
+
+    Memory per symbol and hour of trading for ``n`` levels is ``64 * n``
+    bytes per bar (the 4 * n lines as float64 plus the book columns), e.g.
+    with 10 levels 750 KB for 3 second snapshots (1200 per hour) delivered
+    as ticks and 38 KB for 1 minute bars. Fixed costs come on top: the book
+    columns start with 256 rows (``32 * n * 256`` bytes) and the tick ring
+    takes ``320 * ringsize`` bytes.
+
+    With ``historical=True`` the data does not subscribe to anything and
+    delivers the bars of ``dataname``, ``timeframe`` and ``compression``
+    found in the store's ``barcache``. ``islive`` is then ``False`` and the
+    bars are preloaded into the line buffers with one copy per line, so
+    that indicators are calculated in ``runonce`` mode.
+
+    Live datas building native bars start with the last ``backfill`` bars of
+    the ``barcache`` (which have no depth) to warm up indicators, and with
+    ``cachebars`` append every bar they complete to it.
+
+    A live data with nothing to deliver waits up to ``qcheck`` seconds (and
+    never past the moment its pending bar is due) on the store's
+    ``Wakeup``, which the quote callbacks signal, instead of handing
+    control back to cerebro for another round right away. With the default
+    ``qcheck`` of 0 cerebro polls the datas in a busy loop.
     """
     params = (
         ('server_ip', '127.0.0.1'),
@@ -37,25 +253,67 @@ class XTPData(with_metaclass(MetaXTPData, DataBase)):
         ('password', 3.0),  # timeout between reconnections
         ('timeoffset', True),  # Use offset to server for timestamps if needed
         ('timerefresh', 60.0),  # How often to refresh the timeoffset
+        ('ringsize', 4096),  # capacity of the per-symbol tick ring
+        ('overflow', 'dropoldest'),  # dropoldest, block or alert
+        ('ticklayout', 'full'),  # lean: copy only the fields used here
+        ('depthlevels', 0),  # order book levels copied per tick (0-10)
+        ('nativebars', True),  # build second/minute bars from tick batches
+        ('bargrace', 2.0),  # seconds past a bar edge before forcing it out
+        ('historical', False),  # only the bars in the store's barcache
+        ('backfill', 0),  # bars from the barcache delivered before live ones
+        ('cachebars', True),  # append completed bars to the barcache
     )
 
     _store = xtpstore.XTPStore
 
+    _depthlevels = 0  # order book levels exposed as lines
+    _depthclasses = dict()
+
     # States for the Finite State Machine in _load
     _ST_FROM, _ST_START, _ST_LIVE, _ST_HISTORBACK, _ST_OVER = range(5)
 
     _TOFFSET = timedelta()
 
+    # Timeframes the native bar builder handles, in seconds per unit
+    _BarSeconds = {
+        bt.TimeFrame.Seconds: 1,
+        bt.TimeFrame.Minutes: 60,
+    }
+
     def _timeoffset(self):
         # Effective way to overcome the non-notification?
         return self._TOFFSET
 
+    @classmethod
+    def withdepth(cls, levels):
+        '''
+        Returns the subclass of this class with the lines of ``levels``
+        order book levels
+        '''
+        if not 0 < levels <= TickRingBuffer.MAX_DEPTH:
+            raise ValueError('depthlevels must be between 1 and %d' %
+                             TickRingBuffer.MAX_DEPTH)
+
+        key = (cls, levels)
+        if key not in cls._depthclasses:
+            names = tuple('%s%d' % (side, lvl)
+                          for side in ('bid', 'ask', 'bidvol', 'askvol')
+                          for lvl in range(1, levels + 1))
+            dct = dict(lines=names, _depthlevels=levels,
+                       plotlines=dict((name, dict(_plotskip=True))
+                                      for name in names),
+                       __module__=cls.__module__)
+            cls._depthclasses[key] = type(cls)(
+                str('%s_L%d' % (cls.__name__, levels)), (cls,), dct)
+
+        return cls._depthclasses[key]
+
     def islive(self):
         """
         Returns ``True`` to notify ``Cerebro`` that preloading and runonce
-        should be deactivated
+        should be deactivated, ``False`` for ``historical`` datas
         """
-        return True
+        return not self.p.historical
 
     def __init__(self, **kwargs):
         self.o = self._store(**kwargs)
@@ -74,29 +332,299 @@ class XTPData(with_metaclass(MetaXTPData, DataBase)):
         contractdetails if it exists
         """
         super(XTPData, self).start()
-        self.resample(timeframe=self.p.timeframe,
-                      compression=self.p.compression)
+        self._dtconv = DataTimeConverter()
+        self.depth = None
+        if self.p.historical:
+            self._starthistorical()
+            return
+
+        self._ring = self.o.register_ring(self.p.dataname,
+                                          capacity=self.p.ringsize,
+                                          overflow=self.p.overflow,
+                                          layout=self.p.ticklayout,
+                                          depth=self.p.depthlevels)
+        self.o.start(data=self)  # subscribes once the ring is in place
+        self._latency = self.o.latency  # store's LatencyMonitor or None
+        self._latencykey = xtpstore.symbol_key(self.p.dataname)
+
+        self._depthlines = ()
+        carry = ()
+        if self._depthlevels:
+            self.depth = DepthBook(self._depthlevels)
+            carry = DepthBook.NAMES
+            self._depthlines = tuple(
+                tuple(getattr(self.lines, '%s%d' % (side, lvl + 1))
+                      for lvl in range(self._depthlevels))
+                for side in ('bid', 'ask', 'bidvol', 'askvol'))
+
+        self._bars = None
+        self._barq = collections.deque()  # completed bars to be delivered
+        self._cache = None  # barcache the completed bars are appended to
+        self._lastbar = -1  # data_time of the last bar queued
+        barsecs = self._BarSeconds.get(self.p.timeframe)
+        if self.p.nativebars and barsecs:
+            self._bars = BarBuilder(barsecs * self.p.compression,
+                                    carry=carry)
+            if self.p.cachebars:
+                self._cache = self.o.barcache
+            if self.p.backfill:
+                self._backfill(self.p.backfill)
+        elif (self.p.timeframe, self.p.compression) != \
+                (bt.TimeFrame.Ticks, 1):  # ticks go out as they come
+            self.resample(timeframe=self.p.timeframe,
+                          compression=self.p.compression)
 
     def stop(self):
         """
         Stops and tells the store to stop
         """
         super(XTPData, self).stop()
+        self.o.stop()
+
+    def _starthistorical(self):
+        if self.o.barcache is None:
+            raise ValueError('historical datas need a store with barcache')
+
+        bars = self.o.barcache.read(self.p.dataname, self.p.timeframe,
+                                    self.p.compression)
+        self._hist = barcolumns(bars, self._dtconv)
+        self._histidx = 0
+
+    def preload(self):
+        """
+        Historical datas assign the cached bars to the line buffers at once
+        instead of going bar by bar through ``load``, unless filters or an
+        input timezone have to see every bar
+        """
+        if self.p.historical and preloadcolumns(self, self._hist):
+            self._histidx = len(self._hist['datetime'])
+        else:
+            super(XTPData, self).preload()
+
+    def _load(self):
+        if self.p.historical:
+            return self._load_historical()
+
+        load = self._load_bar if self._bars is not None else self._load_tick
+        ret = load()
+        if ret is None and self.o.wakeup.wait(waittime(self, self._bars)):
+            ret = load()  # woken by ticks or an event of the store
+        return ret
+
+    def _load_tick(self):
+        finished = self.o.exhausted()  # checked before the ring is read
+        tick = self._ring.pop()
+        if tick is None:
+            return False if finished else None  # no data in the queue
+
+        if self._latency is not None:
+            self._latency.consumed(self._latencykey)
+        # fill the lines
+        self.lines.datetime[0] = self._dtconv(int(tick.data_time))
+
+        self.lines.open[0] = tick.open_price
+        self.lines.high[0] = tick.high_price
+        self.lines.low[0] = tick.low_price
+        self.lines.close[0] = tick.last_price  # close_price is 0 intraday
+        self.lines.volume[0] = tick.qty
+        self.lines.openinterest[0] = tick.total_long_positon
+        if self.depth is not None:
+            self._loaddepth(tick.bid, tick.ask, tick.bid_qty, tick.ask_qty)
+        return True
+
+    def _loaddepth(self, *book):
+        self.depth.append(*book)
+        for lines, values in zip(self._depthlines, book):
+            for line, value in zip(lines, values.tolist()):
+                line[0] = value
+
+    def _load_bar(self):
+        if not self._barq:
+            # the clock is read before the ring: every tick up to it has
+            # been pushed already (matters when replaying faster than live)
+            finished = self.o.exhausted()
+            now = self._graceclock()
+            ticks = self._ring.popmany()
+            if ticks is not None:
+                self._queuebars(self._bars.update(ticks))
+                if self._barq and self._latency is not None:
+                    self._latency.consumed(self._latencykey)
+            else:
+                self._queuebars(self._bars.expire(now))
+
+            if not self._barq:
+                return False if finished and ticks is None else None
+
+        bar = self._barq.popleft()
+        dt, o, h, l, c, v, oi = bar[:7]
+        self.lines.datetime[0] = self._dtconv(dt)
+        self.lines.open[0] = o
+        self.lines.high[0] = h
+        self.lines.low[0] = l
+        self.lines.close[0] = c
+        self.lines.volume[0] = v
+        self.lines.openinterest[0] = oi
+        if self.depth is not None and len(bar) > 7:  # not backfilled
+            self._loaddepth(*bar[7:])
+        return True
+
+    def _backfill(self, count):
+        if self.o.barcache is None:
+            raise ValueError('backfill needs a store with barcache')
+
+        bars = self.o.barcache.tail(self.p.dataname, self.p.timeframe,
+                                    self.p.compression, count)
+        if len(bars):
+            # tuples from columns, tolist on the records is 5 times slower
+            self._barq.extend(zip(*[bars[name].tolist()
+                                    for name in bars.dtype.names]))
+            self._lastbar = int(bars['data_time'][-1])
+
+    def _queuebars(self, bars):
+        if bars and bars[0][0] <= self._lastbar:  # overlaps the backfill
+            bars = [bar for bar in bars if bar[0] > self._lastbar]
+        if not bars:
+            return
+
+        self._barq.extend(bars)
+        self._lastbar = bars[-1][0]
+        if self._cache is not None:
+            self._cache.append(self.p.dataname, self.p.timeframe,
+                               self.p.compression, bars)
+
+    def _load_historical(self):
+        i = self._histidx
+        if i >= len(self._hist['datetime']):
+            return False
+
+        self._histidx = i + 1
+        for name, values in self._hist.items():
+            getattr(self.lines, name)[0] = values[i]
+        return True
+
+    def _graceclock(self):
+        return graceclock(self.o.now() + self._timeoffset(), self.p.bargrace)
+
+
+class MetaXTPTickByTickData(DataBase.__class__):
+    def __init__(cls, name, bases, dct):
+        """
+        Class has already been created ... register
+        """
+        # Initialize the class
+        super(MetaXTPTickByTickData, cls).__init__(name, bases, dct)
+
+        # Register with the store
+        xtpstore.XTPStore.TickByTickDataCls = cls
+
+
+class XTPTickByTickData(with_metaclass(MetaXTPTickByTickData, DataBase)):
+    """
+    XTP tick by tick (逐笔) Data Feed.
+
+    Subscribes to the entrusts and trades of ``dataname`` and aggregates
+    the trades into bars of ``compression`` seconds or minutes (1 second by
+    default) with the order flow of each bar in the extra lines:
+
+      - ``buyvolume``: volume of the trades initiated by a buyer
+      - ``sellvolume``: volume of the trades initiated by a seller
+      - ``netvolume``: ``buyvolume - sellvolume``
+      - ``trades``: number of trades
+
+    Messages are kept raw in a ``TickByTickBuffer`` by the quote thread and
+    decoded in batches into numpy columns by the data, so ``ringsize``
+    should cover the messages of a symbol arriving between two calls to
+    ``next``.
+    """
+    params = (
+        ('timeframe', bt.TimeFrame.Seconds),
+        ('compression', 1),
+        ('ringsize', 65536),  # capacity of the per-symbol message ring
+        ('overflow', 'dropoldest'),  # dropoldest, block or alert
+        ('bargrace', 2.0),  # seconds past a bar edge before forcing it out
+    )
+
+    lines = ('buyvolume', 'sellvolume', 'netvolume', 'trades')
+
+    _store = xtpstore.XTPStore
+
+    _TOFFSET = timedelta()
+
+    def _timeoffset(self):
+        return self._TOFFSET
+
+    def islive(self):
+        """
+        Returns ``True`` to notify ``Cerebro`` that preloading and runonce
+        should be deactivated
+        """
+        return True
+
+    def __init__(self, **kwargs):
+        self.o = self._store(**kwargs)
+
+    def setenvironment(self, env):
+        """
+        Receives an environment (cerebro) and passes it over to the store it
+        belongs to
+        """
+        super(XTPTickByTickData, self).setenvironment(env)
+        env.addstore(self.o)
+
+    def start(self):
+        """
+        Registers the message ring and subscribes to the tick by tick data
+        """
+        super(XTPTickByTickData, self).start()
+        barsecs = XTPData._BarSeconds.get(self.p.timeframe)
+        if not barsecs:
+            raise ValueError('XTPTickByTickData builds Seconds or Minutes '
+                             'bars only')
+
+        self._dtconv = DataTimeConverter()
+        self._flow = OrderFlowBuilder(barsecs * self.p.compression)
+        self._barq = collections.deque()  # completed bars to be delivered
+        self._ring = self.o.register_tbt_ring(self.p.dataname,
+                                              capacity=self.p.ringsize,
+                                              overflow=self.p.overflow)
+        self.o.start(data=self, tickbytick=True)
+
+    def stop(self):
+        """
+        Stops and tells the store to stop
+        """
+        super(XTPTickByTickData, self).stop()
+        self.o.stop()
 
     def _load(self):
-        try:
-            data = self.o.notifs.popleft()
-        except IndexError:
-            return None  # no data in the queue
-
-            # fill the lines
-            self.lines.datetime[0] = date2num(
-                time.strptime(time.data.data_time, "%Y%m%d%H%M%S%f"))
-
-            self.lines.open[0] = data.open_price
-            self.lines.high[0] = data.high_price
-            self.lines.low[0] = data.low_price
-            self.lines.close[0] = data.close_price
-            self.lines.volume[0] = data.qty
-            self.lines.openinterest[0] = data.total_long_positon
-            return True
+        ret = self._load_bar()
+        if ret is None and self.o.wakeup.wait(waittime(self, self._flow)):
+            ret = self._load_bar()
+        return ret
+
+    def _load_bar(self):
+        if not self._barq:
+            now = graceclock(self.o.now() + self._timeoffset(),
+                             self.p.bargrace)
+            events = self._ring.popmany()
+            if events is not None:
+                self._barq.extend(self._flow.update(events))
+            else:
+                self._barq.extend(self._flow.expire(now))
+
+            if not self._barq:
+                return None  # no bar completed yet
+
+        dt, o, h, l, c, v, buys, sells, net, trades = self._barq.popleft()
+        self.lines.datetime[0] = self._dtconv(dt)
+        self.lines.open[0] = o
+        self.lines.high[0] = h
+        self.lines.low[0] = l
+        self.lines.close[0] = c
+        self.lines.volume[0] = v
+        self.lines.openinterest[0] = 0.0
+        self.lines.buyvolume[0] = buys
+        self.lines.sellvolume[0] = sells
+        self.lines.netvolume[0] = net
+        self.lines.trades[0] = trades
+        return True
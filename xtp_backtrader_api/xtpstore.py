@@ -26,6 +26,17 @@ import xtpwrapper
 import xtpwrapper.xtp_enum as XTPEnum
 import xtpwrapper.xtp_struct as XTPStruct
 
+from xtp_backtrader_api.barcache import BarCache
+from xtp_backtrader_api.events import EventHub, StoreEvent, Wakeup
+from xtp_backtrader_api.latency import LatencyMonitor
+from xtp_backtrader_api.ledger import AccountPoller
+from xtp_backtrader_api.live_trader import LiveTrader
+from xtp_backtrader_api.ordergateway import OrderGateway
+from xtp_backtrader_api.ratelimit import RateLimiter
+from xtp_backtrader_api.recorder import TickRecorder
+from xtp_backtrader_api.tickbuffer import TickByTickBuffer, TickRingBuffer
+from xtp_backtrader_api.triggers import Triggers
+
 NY = 'America/New_York'
 
 
@@ -42,6 +53,130 @@ class XTPError(Exception):
         super(XTPError, self).__init__(msg)
 
 
+_SH = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH
+_SZ = XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SZ
+
+# Code prefixes of the instruments listed on each exchange. Checked longest
+# first, indices overlap between exchanges and need an explicit suffix
+_EXCHANGE_PREFIXES = sorted([
+    ('60', _SH), ('68', _SH), ('90', _SH), ('50', _SH), ('51', _SH),
+    ('52', _SH), ('56', _SH), ('58', _SH), ('11', _SH), ('204', _SH),
+    ('00', _SZ), ('30', _SZ), ('20', _SZ), ('15', _SZ), ('16', _SZ),
+    ('18', _SZ), ('12', _SZ), ('13', _SZ), ('39', _SZ),
+], key=lambda x: -len(x[0]))
+
+_EXCHANGE_SUFFIXES = {'SH': _SH, 'SSE': _SH, 'SZ': _SZ, 'SZSE': _SZ}
+
+
+def split_ticker(ticker):
+    '''
+    Returns ``(code, exchange)`` for ``ticker``. The exchange can be given
+    as a suffix (``000001.SH``) or is derived from the code prefix
+    '''
+    code, _, suffix = ticker.partition('.')
+    if suffix:
+        try:
+            return code, _EXCHANGE_SUFFIXES[suffix.upper()]
+        except KeyError:
+            raise ValueError('Unknown exchange suffix in %r' % (ticker,))
+
+    for prefix, exchange in _EXCHANGE_PREFIXES:
+        if code.startswith(prefix):
+            return code, exchange
+
+    raise ValueError('Cannot tell the exchange of %r, use a .SH/.SZ suffix'
+                     % (ticker,))
+
+
+def symbol_key(ticker):
+    '''
+    Returns the key of ``ticker`` in the tick rings and the per-symbol
+    state built on them: ``(exchange_id, code bytes)``, as the quote
+    callbacks see it, since codes are only unique within an exchange
+    '''
+    code, exchange = split_ticker(ticker)
+    return int(exchange), code.encode('utf-8')
+
+
+def _addring(rings, key, ring):
+    first = rings.get(key)
+    if first is None:
+        rings[key] = ring
+    else:  # a new tuple, the quote thread may be iterating the old one
+        first.copies = first.copies + (ring,)
+
+
+class Subscriptions(object):
+    '''
+    Batches subscription requests per exchange.
+
+    Tickers requested within ``debounce`` seconds of the first pending one
+    are sent together with a single ``subscribe(codes, exchange)`` call per
+    exchange from a timer thread.
+
+    ``notify(msg, *args, **kwargs)`` receives a summary of every batch with
+    the number of calls made and the time elapsed since the first request,
+    ``onflush()`` is called once the calls of a batch have been made
+    '''
+
+    def __init__(self, subscribe, debounce=0.2, notify=None, onflush=None):
+        self.subscribe = subscribe
+        self.debounce = debounce
+        self.notify = notify
+        self.onflush = onflush
+
+        self.subscribed = set()  # (code, exchange), a code can be on both
+        self.calls = 0  # number of subscribe calls made so far
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._since = None
+
+    def add(self, ticker):
+        '''Queues ``ticker`` for the next batch'''
+        code, exchange = split_ticker(ticker)
+        with self._lock:
+            if (code, exchange) in self.subscribed:
+                return
+
+            self.subscribed.add((code, exchange))
+            self._pending.setdefault(exchange, []).append(code)
+            if self._timer is None:
+                self._since = _time.time()
+                self._timer = threading.Timer(self.debounce, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        '''Sends the pending batch right away'''
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, collections.OrderedDict()
+            since = self._since
+
+        calls = 0
+        for exchange, codes in pending.items():
+            ret = self.subscribe(codes, exchange)
+            calls += 1
+            if ret and self.notify is not None:
+                self.notify('Subscription failed', exchange, codes, ret)
+
+        self.calls += calls
+        if calls and self.notify is not None:
+            self.notify('Subscribed', sum(map(len, pending.values())),
+                        calls=calls, elapsed=_time.time() - since)
+        if calls and self.onflush is not None:
+            self.onflush()
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
 class MetaSingleton(MetaParams):
     '''Metaclass to make a metaclassed class a singleton'''
     def __init__(cls, name, bases, dct):
@@ -61,6 +196,8 @@ class XTPQuoteAPI(with_metaclass(MetaSingleton, xtpwrapper.QuoteAPI)):
     _connectStatus: bool = False
     _loginStatus: bool = False
 
+    finished = False  # a live feed never runs out of ticks
+
     params = (
         ('server_ip', '127.0.0.1'),
         ('server_port', 7496),
@@ -72,6 +209,13 @@ class XTPQuoteAPI(with_metaclass(MetaSingleton, xtpwrapper.QuoteAPI)):
         ('timerefresh', 60.0),  # How often to refresh the timeoffset
         ('ticks', []),  # How often to refresh the timeoffset
         ('notifs', collections.deque()),  # How often to refresh the timeoffset
+        ('rings', dict()),  # per-symbol tick rings, keyed by symbol_key
+        ('tbtrings', dict()),  # per-symbol tick by tick rings, same keys
+        ('recorder', None),  # TickRecorder receiving every depth snapshot
+        ('events', None),  # EventHub signalled when a ring gets ticks
+        ('wakeup', None),  # Wakeup signalled when a ring gets ticks
+        ('latency', None),  # LatencyMonitor timing the ticks
+        ('triggers', None),  # Triggers of the orders held by the broker
     )
 
     def __init__(self):
@@ -79,13 +223,23 @@ class XTPQuoteAPI(with_metaclass(MetaSingleton, xtpwrapper.QuoteAPI)):
         super(XTPQuoteAPI, self).__init__()
         self.log_level = XTPEnum.XTP_LOG_LEVEL.XTP_LOG_LEVEL_INFO
         self.notifs = self.p.notifs
+        self.rings = self.p.rings
+        self.tbtrings = self.p.tbtrings
+        self.recorder = self.p.recorder
+        self.events = self.p.events
+        self.wakeup = self.p.wakeup
+        self.latency = self.p.latency
+        self.triggers = self.p.triggers
         self.CreateQuote(self.p.client_id, 'quota', self.log_level)
         self.SetHeartBeatInterval(10)
         connected = self.LoginServer()
 
-        if connected == True:
-            self.SubscribeMarketData(
-                self.p.ticks, XTPEnum.XTP_EXCHANGE_TYPE.XTP_EXCHANGE_SH)
+        if connected == True and self.p.ticks:
+            byexchange = collections.defaultdict(list)
+            for code, exchange in map(split_ticker, self.p.ticks):
+                byexchange[exchange].append(code)
+            for exchange, codes in byexchange.items():
+                self.SubscribeMarketData(codes, exchange)
 
     def OnDisconnected(self, reason):
         """"""
@@ -96,9 +250,58 @@ class XTPQuoteAPI(with_metaclass(MetaSingleton, xtpwrapper.QuoteAPI)):
     def OnError(self, error_info):
         print(error_info)
 
+    def OnSubMarketData(self, ticker, error_info, is_last):
+        if error_info is not None and error_info.error_id:
+            self.notifs.append(('Subscription error',
+                                (ticker.ticker, error_info.error_msg), {}))
+
     def OnDepthMarketData(self, market_data, bid1_qty, bid1_count, max_bid1_count, ask1_qty, ask1_count, max_ask1_count):
-        self.notifs.append(market_data)
-        return
+        # market_data is a view over memory owned by the XTP library which is
+        # only valid during the callback: copy it into the symbol's ring.
+        # Rings are keyed by the exchange and the raw ticker bytes to avoid
+        # decoding per tick
+        key = (market_data.exchange_id, market_data.ticker)
+        if self.latency is not None:
+            self.latency.tick(key, market_data.data_time)
+        if self.recorder is not None:
+            self.recorder.push(market_data)
+        ring = self.rings.get(key)
+        if ring is not None:
+            ring.push(market_data)
+            for copy in ring.copies:  # other datas of the symbol
+                copy.push(market_data)
+            # held stops go out before anybody is woken up
+            if self.triggers is not None and self.triggers.books:
+                price = float(ring.last())
+                if price > 0.0:  # nothing traded yet (pre-open, auctions)
+                    self.triggers.tick(key, price)
+            if self.wakeup is not None:
+                self.wakeup.signal()
+            if self.events is not None:
+                self.events.postdata(key)
+
+    def OnSubTickByTick(self, ticker, error_info, is_last):
+        if error_info is not None and error_info.error_id:
+            self.notifs.append(('Tick by tick subscription error',
+                                (ticker.ticker, error_info.error_msg), {}))
+
+    def OnTickByTick(self, tbt_data):
+        # same contract as OnDepthMarketData, entrusts and trades of a
+        # symbol share its ring
+        key = (tbt_data.exchange_id, tbt_data.ticker)
+        ring = self.tbtrings.get(key)
+        if ring is not None:
+            ring.push(tbt_data)
+            for copy in ring.copies:
+                copy.push(tbt_data)
+            if self.wakeup is not None:
+                self.wakeup.signal()
+            if self.events is not None:
+                self.events.postdata(key)
+
+    def now(self):
+        '''Current exchange time, the host is expected to run on it'''
+        return datetime.now()
 
     def LoginServer(self):
         n = self.Login(
@@ -139,6 +342,8 @@ class XTPStore(with_metaclass(MetaSingleton, object)):
 
     BrokerCls = None  # broker class will autoregister
     DataCls = None  # data class will auto register
+    TickByTickDataCls = None  # tick by tick data class will auto register
+    ReplayCls = None  # quote api stand-in replaying recorded ticks
 
     params = (
         ('server_ip', '127.0.0.1'),
@@ -150,13 +355,52 @@ class XTPStore(with_metaclass(MetaSingleton, object)):
         ('password', 3.0),  # timeout between reconnections
         ('timeoffset', True),  # Use offset to server for timestamps if needed
         ('timerefresh', 60.0),  # How often to refresh the timeoffset
+        ('subdebounce', 0.2),  # seconds to gather tickers before subscribing
+        ('trade_server_ip', '127.0.0.1'),
+        ('trade_server_port', 6001),
+        ('software_key', ''),
+        ('reconcile', 60.0),  # seconds between account queries, 0 disables
+        ('assetrefresh', 5.0),  # seconds between asset only queries
+        ('recordpath', None),  # directory to record all ticks to, if any
+        ('recordsize', 65536),  # ticks buffered before the recorder drops
+        ('replay', None),  # directory (or list) of recorded files to replay
+        ('replayday', None),  # YYYYMMDD to replay, None for all days found
+        ('replayspeed', 0.0),  # 0 as fast as possible, 1 wall clock, N x
+        ('barcache', None),  # directory of the bars of historical datas
+        ('eventloop', None),  # asyncio loop for the event hub, True: own
+        ('latency', False),  # time the quote to fill path, see .latency
+        ('insertrate', 0.0),  # orders/s sent to the trader, 0 no limit
+        ('cancelrate', 0.0),  # cancels/s sent to the trader, 0 no limit
+        ('queryrate', 0.0),  # account queries/s, 0 no limit
+        ('rateburst', 1.0),  # seconds of each rate which can be bursted
     )
 
+    # Backtrader execution types mapped to XTP price types, market orders
+    # are sent as best 5 immediate or cancel
+    _PRICETYPES = {
+        None: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_BEST5_OR_CANCEL,
+        bt.Order.Market: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_BEST5_OR_CANCEL,
+        bt.Order.Limit: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT,
+    }
+
+    # stops triggered by the broker go out as market or limit orders
+    _TRIGGERED = {
+        bt.Order.Stop: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_BEST5_OR_CANCEL,
+        bt.Order.StopLimit: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT,
+        bt.Order.StopTrail: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_BEST5_OR_CANCEL,
+        bt.Order.StopTrailLimit: XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT,
+    }
+
     @classmethod
     def getdata(cls, *args, **kwargs):
         '''Returns ``DataCls`` with args, kwargs'''
         return cls.DataCls(*args, **kwargs)
 
+    @classmethod
+    def gettickbytickdata(cls, *args, **kwargs):
+        '''Returns ``TickByTickDataCls`` with args, kwargs'''
+        return cls.TickByTickDataCls(*args, **kwargs)
+
     @classmethod
     def getbroker(cls, *args, **kwargs):
         '''Returns broker with *args, **kwargs from registered ``BrokerCls``'''
@@ -166,25 +410,271 @@ class XTPStore(with_metaclass(MetaSingleton, object)):
         super(XTPStore, self).__init__()
 
         self.notifs = collections.deque()  # store notifications for cerebro
+        self.rings = dict()  # tick rings by symbol_key, written by quote api
+        self.tbtrings = dict()  # tick by tick rings by symbol_key
 
         self._env = None  # reference to cerebro for general notifications
         self.broker = None  # broker instance
         self.datas = list()  # datas that have registered over start
-        self.quotaAPI = XTPQuoteAPI(notifs=self.notifs, userid=self.p.userid, password=self.p.password,
-                                    server_ip=self.p.server_ip, server_port=self.p.server_port, ticks=['688158'], debug=self.p.debug, client_id=self.p.client_id)
-
-    def start(self, data=None, broker=None):
-        pass
+        self.trader = None  # trader api, connected when a broker starts
+        self.gateway = None  # order gateway over the trader api
+        self.limiter = None  # paces the requests of the trader session
+        self.poller = None  # position/asset queries for reconciliation
+        self.recorder = None  # tick recorder, if recordpath is set
+        self.barcache = BarCache(self.p.barcache) if self.p.barcache else None
+        self.wakeup = Wakeup()  # datas wait on it for ticks and events
+        self.events = None  # EventHub, if eventloop is set
+        if self.p.eventloop is not None:
+            self.events = EventHub(None if self.p.eventloop is True
+                                   else self.p.eventloop)
+        # LatencyMonitor, if latency is set
+        self.latency = LatencyMonitor() if self.p.latency else None
+        # orders held by the broker, fired from the quote callbacks
+        self.triggers = Triggers(latency=self.latency)
+        if self.p.recordpath:
+            self.recorder = TickRecorder(self.p.recordpath,
+                                         capacity=self.p.recordsize,
+                                         notify=self.put_notification)
+            self.recorder.start()
+
+        self._quotaAPI = None  # built by the first live data, see quotaAPI
+
+        # a replay plays once the subscriptions of every exchange are in
+        self.subscriptions = Subscriptions(
+            lambda codes, exchange: self.quotaAPI.SubscribeMarketData(
+                codes, exchange),
+            debounce=self.p.subdebounce, notify=self.put_notification,
+            onflush=(lambda: self.quotaAPI.play()) if self.p.replay
+            else None)
+        self.tbtsubscriptions = Subscriptions(
+            lambda codes, exchange: self.quotaAPI.SubscribeTickByTick(
+                codes, exchange),
+            debounce=self.p.subdebounce, notify=self.put_notification)
+
+    @property
+    def quotaAPI(self):
+        '''
+        The quote api (``ReplayCls`` when replaying), created on first use:
+        a store serving only historical or bar cache datas never logs in to
+        the quote server
+        '''
+        return self._quote()
+
+    def _quote(self):
+        if self._quotaAPI is not None:
+            return self._quotaAPI
+
+        if self.p.replay:
+            self._quotaAPI = self.ReplayCls(
+                files=self.ReplayCls.findfiles(self.p.replay,
+                                               self.p.replayday),
+                speed=self.p.replayspeed, autoplay=False,
+                notifs=self.notifs,
+                rings=self.rings, tbtrings=self.tbtrings,
+                recorder=self.recorder, events=self.events,
+                wakeup=self.wakeup, latency=self.latency,
+                triggers=self.triggers)
+        else:
+            self._quotaAPI = XTPQuoteAPI(
+                notifs=self.notifs,
+                rings=self.rings,
+                tbtrings=self.tbtrings,
+                recorder=self.recorder,
+                events=self.events,
+                wakeup=self.wakeup,
+                latency=self.latency,
+                triggers=self.triggers,
+                userid=self.p.userid,
+                password=self.p.password,
+                server_ip=self.p.server_ip,
+                server_port=self.p.server_port,
+                debug=self.p.debug,
+                client_id=self.p.client_id)
+
+        return self._quotaAPI
+
+    def start(self, data=None, broker=None, tickbytick=False):
+        if data is not None:
+            self._quote()  # logged in before the subscriptions go out
+            self.datas.append(data)
+            if tickbytick:
+                self.tbtsubscriptions.add(data.p.dataname)
+            else:
+                self.subscriptions.add(data.p.dataname)
+
+        if broker is not None:
+            self.broker = broker
+            self._start_trader()
 
     def stop(self):
-        pass
+        self.subscriptions.cancel()
+        self.tbtsubscriptions.cancel()
+        if self.gateway is not None:
+            self.gateway.stop()
+        if self.poller is not None:
+            self.poller.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.p.replay and self._quotaAPI is not None:
+            self._quotaAPI.Close()
+        if self.events is not None:
+            self.events.close()
+
+    def now(self):
+        '''
+        Exchange time as a ``datetime``: the wall clock when live, the time
+        of the replay otherwise
+        '''
+        if self._quotaAPI is None and not self.p.replay:
+            return datetime.now()  # as XTPQuoteAPI.now, without logging in
+        return self.quotaAPI.now()
+
+    def exhausted(self):
+        '''Returns ``True`` once a replay has delivered all its ticks'''
+        if self._quotaAPI is None and not self.p.replay:
+            return XTPQuoteAPI.finished
+        return self.quotaAPI.finished
+
+    def _start_trader(self):
+        if self.gateway is not None:
+            return
+
+        if self.trader is None:
+            self.trader = LiveTrader()
+
+        session_id = self.trader.session_id or self.trader.connect(
+            self.p.userid, self.p.password, self.p.client_id,
+            self.p.trade_server_ip, self.p.trade_server_port,
+            self.p.software_key)
+        if not session_id:
+            self.put_notification('Trader login failed',
+                                  self.trader.GetApiLastError())
+            return
+
+        self.limiter = RateLimiter(insert=self.p.insertrate,
+                                   cancel=self.p.cancelrate,
+                                   query=self.p.queryrate,
+                                   burst=self.p.rateburst)
+        self.gateway = OrderGateway(self.trader, session_id,
+                                    notify=self.put_notification,
+                                    hub=self.events, wakeup=self.wakeup,
+                                    latency=self.latency,
+                                    limiter=self.limiter)
+        self.trader.gateway = self.gateway
+        self.gateway.start()
+
+        self.poller = AccountPoller(self.trader, session_id, self.gateway,
+                                    interval=self.p.reconcile,
+                                    assetinterval=self.p.assetrefresh,
+                                    notify=self.put_notification,
+                                    limiter=self.limiter)
+        self.trader.poller = self.poller
+        self.poller.start()
+
+    def order_create(self, order):
+        '''
+        Hands ``order`` to the order gateway. Returns immediately, the
+        outcome reaches the broker through the gateway events
+        '''
+        self.order_create_many((order,))
+        return order
+
+    def order_create_many(self, orders):
+        '''
+        Hands ``orders`` to the order gateway in one batch, as
+        ``order_create``
+        '''
+        batch = []
+        for order in orders:
+            request = None
+            if order.exectype in self._PRICETYPES or order.triggered:
+                request = self.order_request(order)
+            if request is None or self.gateway is None:
+                reason = 'Unsupported order type' if request is None \
+                    else 'Trader not connected'
+                self.put_notification(reason, order.ref, order.exectype)
+                self.broker._reject(order.ref)
+                continue
+            batch.append(request)
+
+        if batch:
+            self.gateway.submitmany(batch)
+            for request in batch:
+                self.broker._submit(request[0])
+        return orders
+
+    def order_request(self, order):
+        '''
+        Returns the order gateway request for ``order``, ``None`` if XTP
+        cannot take it. Stops are sent as what they turn into once
+        triggered
+        '''
+        pricetype = self._PRICETYPES.get(order.exectype)
+        if pricetype is None:
+            pricetype = self._TRIGGERED.get(order.exectype)
+            if pricetype is None:
+                return None
+
+        code, exchange = split_ticker(order.data.p.dataname)
+        price = 0.0
+        if order.exectype in (bt.Order.StopLimit, bt.Order.StopTrailLimit):
+            price = order.created.pricelimit
+        elif pricetype == XTPEnum.XTP_PRICE_TYPE.XTP_PRICE_LIMIT:
+            price = order.created.price
+        return (order.ref, code, exchange, order.isbuy(),
+                int(abs(order.created.size)), price, pricetype)
+
+    def order_cancel(self, order):
+        if self.gateway is not None:
+            self.gateway.cancel(order.ref)
+        return order
+
+    def register_ring(self, ticker, capacity=4096, overflow='dropoldest',
+                      layout='full', depth=0):
+        '''
+        Returns a new tick ring for ``ticker``. Ticks for symbols without a
+        ring are discarded by the quote api.
+
+        Rings have a single consumer: the first ring of a symbol is the one
+        the ledger, the risk checks and the triggers read, the rings of the
+        datas registering later get a copy of every tick
+        '''
+        key = symbol_key(ticker)
+        ring = TickRingBuffer(key[1].decode('utf-8'), capacity=capacity,
+                              overflow=overflow, onalert=self._ring_overflow,
+                              layout=layout, depth=depth)
+        _addring(self.rings, key, ring)
+        return ring
+
+    def register_tbt_ring(self, ticker, capacity=65536,
+                          overflow='dropoldest'):
+        '''
+        Returns a new tick by tick ring for ``ticker``, shared out like the
+        rings of ``register_ring``. Messages for symbols without a ring are
+        discarded by the quote api
+        '''
+        key = symbol_key(ticker)
+        ring = TickByTickBuffer(key[1].decode('utf-8'), capacity=capacity,
+                                overflow=overflow,
+                                onalert=self._ring_overflow)
+        _addring(self.tbtrings, key, ring)
+        return ring
+
+    def _ring_overflow(self, ring):
+        # called from the quote thread, deque.append is thread safe
+        self.put_notification('Tick ring overflow', ring.ticker,
+                              overflows=ring.overflows)
 
     def put_notification(self, msg, *args, **kwargs):
         self.notifs.append((msg, args, kwargs))
+        self.wakeup.signal()
+        if self.events is not None:
+            self.events.post(StoreEvent(msg, args, kwargs))
 
     def get_notifications(self):
         '''Return the pending "store" notifications'''
         self.notifs.append(None)  # put a mark / threads could still append
+        return [x for x in iter(self.notifs.popleft, None)]
 
 
 if __name__ == '__main__':
@@ -194,7 +684,10 @@ if __name__ == '__main__':
     test = XTPStore(userid='53191002899', password='778MhWYa',
                     client_id=1, server_ip='120.27.164.138', server_port=6002, debug=True)
 
+    ring = test.register_ring('688158')
+    test.subscriptions.add('688158')
     while(True):
-        if len(test.notifs):
-            print("===========", test.notifs.pop())
+        tick = ring.pop()
+        if tick is not None:
+            print("===========", tick)
         time.sleep(1)